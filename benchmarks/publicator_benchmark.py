@@ -0,0 +1,184 @@
+"""
+Publication benchmarks against the bundled MockGeoserver.
+
+Every scenario runs in its own process with a fresh mock and source tree and reports slots per second,
+requests per slot, uploaded bytes and peak RSS, e.g.
+
+python benchmarks/publicator_benchmark.py --slots 200 --latency 0.005 --harvest-delay 0.05
+python benchmarks/publicator_benchmark.py --scenario index --granules 100000 --json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geoserver.Geoserver import Geoserver  # noqa: E402
+from geoserver.MockGeoserver import MockGeoserver  # noqa: E402
+from geoserver.Publicator import Publicator  # noqa: E402
+
+PRODUCT = 'AHI_L2_RGB_GEOSERVER'
+SCENARIOS = ('single', 'batch', 'bulk', 'backfill', 'index')
+
+
+def _create_config(root: str, service_url: str, options) -> dict:
+    return {
+        'storage_config': {'DIR_SAT': root, 'DIR_SAT_RGB': 'rgb', 'DIR_SAT_PUBLIC': 'public'},
+        'geoserver_config': {'service_url': service_url, 'username': 'admin', 'password': 'geoserver'},
+        PRODUCT: {
+            'name': PRODUCT,
+            'dir_source': 'AHI',
+            'init_dir_name': 'init',
+            'storage_dir_name': 'tiff',
+            'base_dir_name': 'base',
+            'sample': 'RGB',
+            'extension': '.tif',
+            'workspace': 'benchmark',
+            'coveragestore': 'ahi',
+            'readiness_timeout': 60,
+            'staging': options.staging,
+            'ingest_queue': {'workers': options.workers},
+        },
+    }
+
+
+def _create_geotiff(file_size: int) -> bytes:
+    """ Uncompressed one band EPSG:4326 GeoTIFF of about file_size bytes, the body is zeros. """
+    side = max(1, int(max(0, file_size - 512) ** 0.5))
+    entries = [
+        (256, 4, 1, struct.pack('<I', side)),
+        (257, 4, 1, struct.pack('<I', side)),
+        (258, 3, 1, struct.pack('<H', 8)),
+        (259, 3, 1, struct.pack('<H', 1)),
+        (273, 4, 1, struct.pack('<I', 512)),
+        (277, 3, 1, struct.pack('<H', 1)),
+        (278, 4, 1, struct.pack('<I', side)),
+        (279, 4, 1, struct.pack('<I', side * side)),
+        (33550, 12, 3, struct.pack('<3d', 360 / side, 180 / side, 0)),
+        (33922, 12, 6, struct.pack('<6d', 0, 0, 0, -180, 90, 0)),
+        (34735, 3, 8, struct.pack('<8H', 1, 1, 0, 1, 2048, 0, 1, 4326)),
+    ]
+    ifd = struct.pack('<H', len(entries))
+    values = b''
+    values_offset = 8 + 2 + 12 * len(entries) + 4
+    for tag, field_type, count, value in entries:
+        if len(value) <= 4:
+            ifd += struct.pack('<HHI', tag, field_type, count) + value.ljust(4, b'\x00')
+        else:
+            ifd += struct.pack('<HHII', tag, field_type, count, values_offset + len(values))
+            values += value
+    header = b'II*\x00' + struct.pack('<I', 8) + ifd + struct.pack('<I', 0) + values
+    return header.ljust(512, b'\x00') + bytes(side * side)
+
+
+def _create_source_tree(root: str, slots, file_size: int) -> None:
+    base_init_dir = os.path.join(root, 'public', 'base', 'init')
+    os.makedirs(base_init_dir)
+    with open(os.path.join(base_init_dir, 'indexer.properties'), 'w') as f:
+        f.write('TimeAttribute=time\nSchema=*the_geom:Polygon,location:String,time:java.util.Date\n'
+                'PropertyCollectors=TimestampFileNameExtractorSPI[timeregex](time)\n')
+    with open(os.path.join(base_init_dir, 'timeregex.properties'), 'w') as f:
+        f.write('regex=[0-9]{8}_[0-9]{4},format=yyyyMMdd_HHmm\n')
+    payload = _create_geotiff(file_size)
+    for (_, year, month, day, dtime) in slots:
+        slot_dir = os.path.join(root, 'rgb', 'AHI', year, month, day, dtime)
+        os.makedirs(slot_dir)
+        with open(os.path.join(slot_dir, 'AHI_{0}{1}{2}_{3}_RGB.tif'.format(year, month, day, dtime)), 'wb') as f:
+            f.write(payload)
+
+
+def _run_scenario(scenario: str, options) -> dict:
+    root = tempfile.mkdtemp(prefix='publicator-benchmark-')
+    start = datetime(2021, 7, 9)
+    slots = Publicator.create_slots(PRODUCT, start, start + timedelta(minutes=10) * (options.slots - 1))
+    try:
+        with MockGeoserver(latency=options.latency, harvest_delay=options.harvest_delay,
+                           error_rate=options.error_rate) as mock:
+            if scenario == 'index':
+                mock.add_granules('benchmark', 'ahi', options.granules)
+                with Geoserver(service_url=mock.service_url) as geo:
+                    started = time.perf_counter()
+                    count = sum(1 for _ in geo.iter_granules_from_coveragestore('benchmark', 'ahi'))
+                    elapsed = time.perf_counter() - started
+                stats = mock.stats()
+                return {
+                    'scenario': scenario,
+                    'granules': count,
+                    'seconds': round(elapsed, 3),
+                    'granules_per_second': round(count / elapsed, 1),
+                    'requests': stats['requests_total'],
+                    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                }
+
+            _create_source_tree(root, slots, options.file_size)
+            config = _create_config(root, mock.service_url, options)
+            with Publicator(PRODUCT, config=config) as publicator:
+                started = time.perf_counter()
+                if scenario == 'single':
+                    results = [publicator.workflow(args) for args in slots]
+                elif scenario in ('batch', 'bulk'):
+                    results = list(publicator.batch_workflow(slots, bulk_harvest=scenario == 'bulk').values())
+                else:
+                    publicator.enqueue(slots)
+                    counts = publicator.run_queue()
+                    results = ['done'] * counts['verified']
+                elapsed = time.perf_counter() - started
+            stats = mock.stats()
+            return {
+                'scenario': scenario,
+                'slots': len(slots),
+                'done': sum(result == 'done' for result in results),
+                'seconds': round(elapsed, 3),
+                'slots_per_second': round(len(slots) / elapsed, 2),
+                'requests_per_slot': round(stats['requests_total'] / len(slots), 2),
+                'bytes_uploaded': stats['bytes_received'],
+                'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _run_in_process(scenario: str, options, queue) -> None:
+    queue.put(_run_scenario(scenario, options))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark Publicator against MockGeoserver.')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help='default: all scenarios')
+    parser.add_argument('--slots', type=int, default=100)
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='bytes of every source file')
+    parser.add_argument('--granules', type=int, default=50000, help='granules of index scenario')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds added to every mock response')
+    parser.add_argument('--harvest-delay', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=4, help='ingest queue workers of backfill scenario')
+    parser.add_argument('--staging', default='copy')
+    parser.add_argument('--json', action='store_true', help='print one JSON line per scenario')
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    context = multiprocessing.get_context()
+    for scenario in options.scenario or SCENARIOS:
+        queue = context.Queue()
+        process = context.Process(target=_run_in_process, args=(scenario, options, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if options.json:
+            print(json.dumps(result))
+        else:
+            print('  '.join('{0}={1}'.format(key, value) for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,677 @@
+import asyncio
+import contextlib
+import os
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, Iterable, List, Optional, Tuple, Union
+
+from geoserver.metrics import Metrics
+from geoserver.payloads import coverage_template, get_payload_format, gwc_layer_template
+from geoserver.utils import GranuleStreamParser
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, pip install aiohttp
+    aiohttp = None
+
+
+class AsyncGeoserver:
+    """
+    Asyncio counterpart of Geoserver.
+
+    Attributes
+    ----------
+    service_url : str
+        The URL for the GeoServer instance.
+    username : str
+        Login name for session.
+    password: str
+        Password for session.
+    pool_maxsize : int
+        Maximum number of pooled connections.
+    pool_maxsize_per_host : int
+        Maximum number of pooled connections to one host, 0 means no limit.
+    keepalive_timeout : float
+        Seconds to keep idle connections open.
+    timeout : float
+        Total timeout of one request in seconds.
+    concurrency : int
+        Maximum number of requests in flight shared by all methods.
+    metrics : Metrics, optional
+        Registry of latency, bytes and status codes of REST calls, can be shared with Geoserver clients.
+
+    Notes
+    -----
+    Methods have the same names, arguments and results as Geoserver methods. All requests go through one shared
+    aiohttp session which is created in the running event loop. Cancelling a task cancels its requests.
+
+    async with AsyncGeoserver(service_url='http://127.0.0.1:8080/geoserver') as geo:
+        await geo.get_workspaces()
+    """
+
+    def __init__(
+            self,
+            service_url="http://10.110.0.22:8080/geoserver",
+            username="admin",
+            password="12345678",
+            pool_maxsize: int = 10,
+            pool_maxsize_per_host: int = 0,
+            keepalive_timeout: float = 15,
+            timeout: float = 300,
+            concurrency: int = 10,
+            metrics: Optional[Metrics] = None,
+    ):
+        if aiohttp is None:
+            raise ImportError('AsyncGeoserver requires aiohttp. Install it with: pip install aiohttp')
+
+        self._service_url = service_url
+        self._username = username
+        self._password = password
+        self._pool_maxsize = pool_maxsize
+        self._pool_maxsize_per_host = pool_maxsize_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+        self._layer_ids = {}  # (workspace, coveragestore) -> GWC layer id
+        self.metrics = metrics or Metrics()
+
+    def __repr__(self):
+        return "I am async Geoserver at {}".format(self._service_url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_maxsize,
+                limit_per_host=self._pool_maxsize_per_host,
+                keepalive_timeout=self._keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                auth=aiohttp.BasicAuth(self._username, self._password),
+                timeout=aiohttp.ClientTimeout(total=self._timeout)
+            )
+        return self._session
+
+    @contextlib.asynccontextmanager
+    async def _request(self, method: str, url: str, **kwargs):
+        """ Send request through the shared session, limited by the concurrency semaphore and recorded in metrics. """
+        if 'params' in kwargs:  # aiohttp does not skip None values like requests does
+            kwargs['params'] = [(k, v) for k, v in kwargs['params'].items() if v is not None]
+        async with self._semaphore:
+            with self.metrics.request(method, url) as call:
+                async with self._get_session().request(method, url, **kwargs) as r:
+                    call['status'] = r.status
+                    call['bytes_sent'] = int(r.request_info.headers.get('Content-Length') or 0)
+                    call['bytes_received'] = r.content_length or 0
+                    yield r
+
+    async def close(self) -> None:
+        """ Close all pooled connections. """
+        if self._session is not None:
+            await self._session.close()
+
+    async def reset(self) -> str:
+        """ Resets all store, raster, and schema caches. """
+
+        url = "{}/rest/reset".format(self._service_url)
+
+        self._invalidate_layer_ids()
+
+        try:
+            async with self._request('POST', url) as r:
+                return "Status code: {}.".format(r.status)
+
+        except Exception as e:
+            return "Reset error. {0}.".format(e)
+
+    async def reload(self) -> str:
+        """ Reloads the GeoServer catalog and configuration from disk. """
+
+        url = "{}/rest/reload".format(self._service_url)
+
+        self._invalidate_layer_ids()
+
+        try:
+            async with self._request('POST', url) as r:
+                return "Status code: {}.".format(r.status)
+
+        except Exception as e:
+            return "Reload error. {0}.".format(e)
+
+    async def get_workspaces(self) -> Union[dict, str]:
+        """ Returns all the workspaces. """
+
+        url = "{}/rest/workspaces".format(self._service_url)
+
+        try:
+            async with self._request('GET', url) as r:
+                return (await r.json())['workspaces']['workspace']
+
+        except TypeError as e:
+            return []  # if there are no workspaces return empty array
+        except Exception as e:
+            return "Can not get workspaces. {0}.".format(e)
+
+    async def get_layers(self, workspace: Optional[str]) -> Union[dict, str]:
+        """ Get all the layers from geoserver, from all workspaces if workspace is None. """
+
+        url = "{}/rest/layers".format(
+            self._service_url) if workspace is None else "{}/rest/workspaces/{}/layers".format(self._service_url,
+                                                                                               workspace)
+
+        try:
+            async with self._request('GET', url) as r:
+                return await r.json()
+
+        except Exception as e:
+            return "Can not get layers. {0}.".format(e)
+
+    async def get_coveragestores(self, workspace: Optional[str]) -> Union[dict, str]:
+        """ Returns all the coveragestores inside a specific workspace. """
+
+        if workspace is None:
+            workspace = "default"
+
+        url = "{}/rest/workspaces/{}/coveragestores".format(self._service_url, workspace)
+
+        try:
+            async with self._request('GET', url) as r:
+                return (await r.json())['coverageStores']['coverageStore']
+
+        except TypeError as e:
+            return []  # if coveragestore is empty return empty array
+        except Exception as e:
+            return "Can not get coveragestores. {0}.".format(e)
+
+    async def delete_workspace(self, workspace: str) -> str:
+        """ Delete workspace by name. """
+
+        url = "{}/rest/workspaces/{}".format(self._service_url, workspace)
+
+        params = {"recurse": "true"}  # flag to delete all layers and coveragestores from this workspace
+
+        self._invalidate_layer_ids(workspace)
+
+        try:
+            async with self._request('DELETE', url, params=params) as r:
+                if r.status == 200:
+                    return "Workspace {0} deleted. Status code: {1}.".format(workspace, r.status)
+
+        except Exception as e:
+            return "Can not delete workspace. {0}.".format(e)
+
+    async def delete_layer(self, workspace: str, coveragestore_name: str) -> str:
+        """ Delete layer from coveragestore by name. """
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}.xml'.format(self._service_url, workspace,
+                                                                                    coveragestore_name)
+
+        params = {"recurse": "true"}
+
+        self._invalidate_layer_ids(workspace, coveragestore_name)
+
+        try:
+            async with self._request('DELETE', url, params=params) as r:
+                if r.status in (200, 201, 202):
+                    return 'Layer {0} deleted. Status code : {1}.'.format(coveragestore_name, r.status)
+
+        except Exception as e:
+            return "Can not delete layer. {0}.".format(e)
+
+    async def delete_coveragesotre(self, coveragestore_name: str, workspace: Optional[str]) -> str:
+        """ Delete coveragestore by name from workspace. """
+
+        if workspace is None:  # geoserver will search coverag estore among all workspaces
+            url = "{}/rest/coveragestores/{}".format(self._service_url, coveragestore_name)
+        else:
+            url = "{}/rest/workspaces/{}/coveragestores/{}".format(
+                self._service_url,
+                workspace,
+                coveragestore_name
+            )
+
+        params = {"recurse": "true"}  # flag to delete all layers from coverage store
+
+        self._invalidate_layer_ids(workspace, coveragestore_name)
+
+        try:
+            async with self._request('DELETE', url, params=params) as r:
+                if r.status == 200:
+                    return "Coverage store deleted successfully. Status code: {}.".format(r.status)
+
+        except Exception as e:
+            return "Coverage store can not be deleted. {0}.".format(e)
+
+    async def create_workspace(self, workspace: str) -> str:
+        """ Create a new workspace in geoserver. """
+
+        url = "{}/rest/workspaces".format(self._service_url)
+
+        data = "<workspace><name>{}</name></workspace>".format(workspace)
+
+        headers = {"content-type": "text/xml"}
+
+        try:
+            async with self._request('POST', url, data=data, headers=headers) as r:
+                if r.status == 201:
+                    return "Workspace {0} created. Status code: {1}.".format(workspace, r.status)
+
+                if r.status == 401:
+                    raise Exception("The workspace already exist. Status code: {}.".format(r.status))
+
+        except Exception as e:
+            return "The workspace can not be created. {0}.".format(e)
+
+    async def create_coveragestore(
+            self,
+            path,
+            workspace: Optional[str] = None,
+            coveragestore_name: Optional[str] = None,
+            configure: Optional[bool] = None,
+            file_type: str = "imagemosaic",
+            content_type: str = "application/zip",
+    ):
+        """ Create coveragestore in worksapce, the zip file is streamed from disk. """
+
+        if not os.path.exists(path):
+            raise FileNotFoundError('This path not exists!')
+
+        if workspace is None:
+            workspace = 'default'
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/file.{3}'.format(
+            self._service_url, workspace, coveragestore_name, file_type
+        )
+
+        headers = {
+            'content-type': content_type
+        }
+
+        params = {
+            'coverageName': coveragestore_name
+        }
+
+        if configure:
+            params['configure'] = 'none'
+
+        try:
+            with open(path, 'rb') as f:
+                async with self._request('PUT', url, data=f, headers=headers, params=params) as r:
+                    return 'Coveragestore {0} is created. Status code: {1}.'.format(coveragestore_name, r.status)
+
+        except Exception as e:
+            return "The coveragestore can not be created. {0}.".format(e)
+
+    async def create_coveragestore_from_directory(
+            self,
+            path: str,
+            workspace: Optional[str] = None,
+            coveragestore_name: Optional[str] = None,
+            configure: str = 'all',
+            file_type: str = "imagemosaic",
+    ) -> str:
+        """ Create coveragestore from directory with pre-built index, see Geoserver method. """
+
+        if not os.path.isdir(path):
+            raise FileNotFoundError('This path not exists!')
+
+        if workspace is None:
+            workspace = 'default'
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/external.{3}'.format(
+            self._service_url, workspace, coveragestore_name, file_type
+        )
+
+        headers = {
+            'content-type': 'text/plain'
+        }
+
+        params = {
+            'configure': configure,
+            'coverageName': coveragestore_name
+        }
+
+        try:
+            async with self._request('PUT', url, data='file://' + os.path.abspath(path), headers=headers,
+                                     params=params) as r:
+                r.raise_for_status()
+                return 'Coveragestore {0} is created. Status code: {1}.'.format(coveragestore_name, r.status)
+
+        except Exception as e:
+            return "The coveragestore can not be created. {0}.".format(e)
+
+    def _get_granules_url(self, workspace: str, coveragestore_name: str) -> str:
+        return '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}/index/granules.json'.format(
+            self._service_url,
+            workspace,
+            coveragestore_name
+        )
+
+    async def get_granules_from_coveragestore(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            cql_filter: Optional[str] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+    ) -> Union[dict, str]:
+        """ Get granules(layers) from coveragesotre, see Geoserver.get_granules_from_coveragestore. """
+
+        url = self._get_granules_url(workspace, coveragestore_name)
+
+        params = {'filter': cql_filter, 'offset': offset, 'limit': limit}
+
+        try:
+            async with self._request('GET', url, params=params) as r:
+                granules_json = await r.json()
+                return {el['id']: el['properties']['location'] for el in granules_json['features']}
+
+        except Exception as e:
+            return "Can not get granules from coveragestore. {0}.".format(e)
+
+    async def iter_granules_from_coveragestore(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            cql_filter: Optional[str] = None,
+            page_size: Optional[int] = 1000,
+            chunk_size: int = 64 * 1024,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Lazily yield (id, location) of granules from coveragestore.
+
+        Notes:
+        -----
+        Pages are parsed while they are downloaded, errors are raised as aiohttp exceptions. Granules of a page
+        are yielded after its response is released, so the consumer can make requests between granules
+        (e.g. delete them) without waiting for a connection or semaphore slot held by the iterator.
+        """
+
+        url = self._get_granules_url(workspace, coveragestore_name)
+        offset = 0
+
+        while True:
+            params = {'filter': cql_filter, 'offset': offset if page_size else None, 'limit': page_size}
+            parser = GranuleStreamParser()
+            page = []
+
+            async with self._request('GET', url, params=params) as r:
+                r.raise_for_status()
+                async for chunk in r.content.iter_chunked(chunk_size):
+                    page.extend(parser.feed(chunk))
+                parser.close()
+
+            for granule in page:
+                yield granule
+            if not page_size or len(page) < page_size:
+                return
+            offset += len(page)
+
+    async def delete_granula_from_coveragestore(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            granula_id: str
+    ) -> str:
+        """ Delete one specific granula from coveragestore. """
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}/index/granules/{3}.xml'.format(
+            self._service_url,
+            workspace,
+            coveragestore_name,
+            granula_id
+        )
+
+        try:
+            async with self._request('DELETE', url) as r:
+                return 'Granula "{0}" deleted successfully. Status code: {1}.'.format(granula_id, r.status)
+
+        except Exception as e:
+            return "Can not delete granula. {0}.".format(e)
+
+    async def publish_file_to_coveragestore(
+            self,
+            path,
+            coveragestore_name: str,
+            workspace: str,
+            file_type: str = "imagemosaic",
+            content_type: str = "image/tiff"
+    ) -> str:
+        """ Publish file/folder/zip to coveragestore, see Geoserver.publish_file_to_coveragestore. """
+
+        if not os.path.exists(path):
+            raise FileNotFoundError('This path not exists.')
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/external.{3}'.format(
+            self._service_url,
+            workspace,
+            coveragestore_name,
+            file_type
+        )
+
+        headers = {
+            "content-type": content_type
+        }
+
+        try:
+            async with self._request('POST', url, data='file://' + path, headers=headers) as r:
+                if r.status in (200, 201, 202):
+                    return 'Published. Status code: {}.'.format(r.status)
+
+        except Exception as e:
+            return "Can not publish it. {0}.".format(e)
+
+    async def publish_files_to_coveragestore(
+            self,
+            paths: Iterable[str],
+            coveragestore_name: str,
+            workspace: str,
+            file_type: str = "imagemosaic",
+            content_type: str = "image/tiff"
+    ) -> List[Optional[str]]:
+        """
+        Publish many files to coveragestore concurrently.
+
+        Notes
+        -----
+        Results are returned in the order of paths, an error of one file is returned as its result string.
+        Concurrency is limited by the client semaphore.
+        """
+
+        async def publish(path):
+            try:
+                return await self.publish_file_to_coveragestore(
+                    path=path,
+                    coveragestore_name=coveragestore_name,
+                    workspace=workspace,
+                    file_type=file_type,
+                    content_type=content_type
+                )
+            except Exception as e:
+                return "Can not publish it. {0}.".format(e)
+
+        return list(await asyncio.gather(*(publish(path) for path in paths)))
+
+    async def publish_zip_to_coveragestore(
+            self,
+            path,
+            coveragestore_name: str,
+            workspace: str,
+            file_type: str = 'imagemosaic',
+            content_type: str = "application/zip"
+    ):
+        """ Publish zip file to coveragestore like a binary, the file is streamed from disk. """
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/file.{3}'.format(self._service_url, workspace,
+                                                                           coveragestore_name, file_type)
+
+        headers = {
+            "content-type": content_type
+        }
+
+        params = {
+            "recalculate": "nativebbox,latlonbbox"
+        }
+
+        try:
+            with open(path, 'rb') as f:
+                async with self._request('POST', url, data=f, headers=headers, params=params) as r:
+                    if r.status in (200, 201, 202):
+                        return 'Zip file published. Status code: {}.'.format(r.status)
+
+        except Exception as e:
+            return "Can not publish zip file. {0}.".format(e)
+
+    async def _get_layer_description(
+            self,
+            coveragestore_name: str,
+            workspace: str,
+            content_type: str = "application/xml; charset=UTF-8",
+    ) -> str:
+        """ Get layer description by name. """
+
+        url = '{0}/gwc/rest/layers/{1}:{2}'.format(self._service_url, workspace, coveragestore_name)
+
+        headers = {
+            "accept": content_type
+        }
+
+        try:
+            async with self._request('GET', url, headers=headers) as r:
+                if r.status in (200, 201, 202):
+                    return await r.text()
+
+        except Exception as e:
+            return "Can not get description. {0}.".format(e)
+
+    def _invalidate_layer_ids(self, workspace: Optional[str] = None, coveragestore_name: Optional[str] = None) -> None:
+        """ Forget cached GWC layer ids of a layer, of a workspace or, without workspace, of all layers. """
+        for key in list(self._layer_ids):
+            if workspace in (None, key[0]) and coveragestore_name in (None, key[1]):
+                del self._layer_ids[key]
+
+    async def _get_layer_id(self, workspace: str, coveragestore_name: str) -> Optional[str]:
+        """
+        Get GWC layer id, None if the layer description can not be fetched or parsed.
+
+        Notes:
+        -----
+        Ids are cached until the layer is deleted, see Geoserver._get_layer_id.
+        """
+
+        key = (workspace, coveragestore_name)
+        if key in self._layer_ids:
+            return self._layer_ids[key]
+
+        url = '{0}/gwc/rest/layers/{1}:{2}'.format(self._service_url, workspace, coveragestore_name)
+
+        headers = {
+            "accept": "application/xml"
+        }
+
+        try:
+            async with self._request('GET', url, headers=headers) as r:
+                if r.status not in (200, 201, 202):
+                    return None
+                layer_id = ET.fromstring(await r.text()).findtext('id')
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError):
+            return None
+
+        if layer_id is not None:
+            self._layer_ids[key] = layer_id
+        return layer_id
+
+    async def publish_timecahe_file_to_coveragestore(
+            self,
+            coveragestore_name: str,
+            workspace: str,
+            content_type: str = "application/xml; charset=UTF-8",
+            blob: str = "RAM",
+            start_time: str = "2021-07-09T00:00:00Z",  # default value
+            mime_formats: Iterable[str] = ('image/png', 'image/jpeg'),
+            gridsets: Iterable[str] = ('EPSG:4326', 'EPSG:900913'),
+            metatile: Tuple[int, int] = (4, 4),
+            regex_filters: Iterable[Tuple[str, str, str]] = (),
+    ) -> str:
+        """ Replaces the old timecache file with a new one, see Geoserver.publish_timecahe_file_to_coveragestore. """
+
+        payload_format = get_payload_format(content_type)
+
+        url = '{0}/gwc/rest/layers/{1}:{2}.{3}'.format(self._service_url, workspace, coveragestore_name,
+                                                       payload_format)
+
+        headers = {
+            "content-type": content_type
+        }
+
+        template = gwc_layer_template(
+            blob_store=blob,
+            mime_formats=tuple(mime_formats),
+            gridsets=tuple(gridsets),
+            metatile=tuple(metatile),
+            regex_filters=tuple(tuple(regex_filter) for regex_filter in regex_filters)
+        )
+
+        try:
+            status = None
+            for _ in range(2):
+                layer_id = await self._get_layer_id(workspace, coveragestore_name)
+                if layer_id is None:
+                    return "Can not publish. Layer {0}:{1} not found.".format(workspace, coveragestore_name)
+
+                timecache_data = template.render(
+                    payload_format,
+                    id=layer_id,
+                    name='{}:{}'.format(workspace, coveragestore_name),
+                    time=start_time
+                )
+
+                async with self._request('PUT', url, data=timecache_data, headers=headers) as r:
+                    status = r.status
+                    if r.status in (200, 201, 202):
+                        return 'Timecache file is published. Status code: {}.'.format(r.status)
+
+                # cached layer id can be outdated if the layer was recreated by someone else
+                self._invalidate_layer_ids(workspace, coveragestore_name)
+
+            return "Can not publish. Status code: {}.".format(status)
+
+        except Exception as e:
+            return "Can not publish. {0}.".format(e)
+
+    async def publish_time_dimension_to_coveragestore(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            presentation: str = 'LIST',
+            units: str = 'ISO8601',
+            default_value: str = 'MINIMUM',
+            content_type: str = "application/xml; charset=UTF-8"
+    ):
+        """ Create time dimension in coverage store to publish time series in geoserver. """
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}'.format(self._service_url, workspace,
+                                                                                coveragestore_name)
+
+        headers = {
+            "content-type": content_type
+        }
+
+        time_dimension_data = coverage_template(
+            dimensions=(('time', presentation, units, default_value),)
+        ).render(get_payload_format(content_type))
+
+        try:
+            async with self._request('PUT', url, data=time_dimension_data, headers=headers) as r:
+                if r.status in (200, 201):
+                    return 'Time dimension is published. Status code: {}.'.format(r.status)
+
+        except Exception as e:
+            return "Can not publish time dimension. {0}.".format(e)
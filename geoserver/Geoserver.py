@@ -1,7 +1,17 @@
+import json
 import os
 import requests
+import threading
+import time
 import xml.etree.ElementTree as ET
-from typing import Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib3.util.retry import Retry
+
+from geoserver.metrics import Metrics
+from geoserver.payloads import coverage_template, get_payload_format, gwc_layer_template
+from geoserver.utils import GranuleStreamParser, UploadStream
 
 
 class Geoserver:
@@ -14,6 +24,35 @@ class Geoserver:
         Login name for session.
     password: str
         Password for session.
+    pool_connections : int
+        Number of connection pools to cache (one pool per host).
+    pool_maxsize : int
+        Maximum number of keep-alive connections per host.
+    keep_alive : bool
+        Reuse TCP connections between requests.
+    timeout : float or tuple
+        Default (connect, read) timeout in seconds for every request.
+    retries : int
+        Number of retries on connection errors and 5xx responses.
+    backoff_factor : float
+        Exponential backoff factor between retries.
+    cache_ttl : float
+        Seconds to keep workspaces, coveragestores, layers and GWC layer descriptions in the catalog cache,
+        0 disables the cache.
+    store_concurrency : int
+        Maximum number of concurrent publish requests per coveragestore, shared by all callers of the client.
+    max_seed_threads : int
+        Maximum number of GWC seeding threads running at once, new seed tasks wait until threads are free.
+    metrics : Metrics, optional
+        Registry of latency, bytes, retries and status codes of REST calls, can be shared by many clients.
+
+    Notes
+    -----
+    All methods share one pooled session. Use the client as a context manager or call `close()`
+    to release the connections:
+
+    with Geoserver(service_url='http://127.0.0.1:8080/geoserver') as geo:
+        geo.get_workspaces()
     """
 
     def __init__(
@@ -21,14 +60,130 @@ class Geoserver:
             service_url="http://10.110.0.22:8080/geoserver",
             username="admin",
             password="12345678",
+            pool_connections: int = 10,
+            pool_maxsize: int = 10,
+            keep_alive: bool = True,
+            timeout: Union[float, Tuple[float, float]] = (10, 300),
+            retries: int = 3,
+            backoff_factor: float = 0.5,
+            cache_ttl: float = 60,
+            store_concurrency: int = 4,
+            max_seed_threads: int = 4,
+            metrics: Optional[Metrics] = None,
     ):
         self._service_url = service_url
         self._username = username
         self._password = password
+        self._timeout = timeout
+        self._session = self._create_session(pool_connections, pool_maxsize, keep_alive, retries, backoff_factor)
+        self._cache_ttl = cache_ttl
+        self._cache = {}  # key -> (expiration time, value)
+        self._cache_lock = threading.Lock()
+        self._store_concurrency = store_concurrency
+        self._store_semaphores = {}  # (workspace, coveragestore) -> semaphore
+        self._max_seed_threads = max_seed_threads
+        self.metrics = metrics or Metrics()
 
     def __repr__(self):
         return "I am Geoserver at {}".format(self._service_url)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _create_session(
+            self,
+            pool_connections: int,
+            pool_maxsize: int,
+            keep_alive: bool,
+            retries: int,
+            backoff_factor: float,
+    ) -> requests.Session:
+        """
+        Create pooled session shared by all REST methods.
+
+        Notes:
+        -----
+        Only idempotent methods (GET, PUT, DELETE, ...) are retried on 5xx responses, POST requests are retried
+        on connection errors only, so a harvest is never sent twice after GeoServer has received it.
+        """
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,  # return the last response, methods report its status code
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        session = requests.Session()
+        session.auth = (self._username, self._password)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        if not keep_alive:
+            session.headers['connection'] = 'close'
+
+        return session
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """ Send request through the pooled session and record it in metrics. """
+        kwargs.setdefault('timeout', self._timeout)
+        with self.metrics.request(method, url) as call:
+            r = self._session.request(method, url, **kwargs)
+            call['status'] = r.status_code
+            call['bytes_sent'] = int(r.request.headers.get('Content-Length') or 0)
+            # body of streamed responses is not read yet, only its declared length is counted
+            call['bytes_received'] = int(r.headers.get('Content-Length') or
+                                         (0 if kwargs.get('stream') else len(r.content)))
+            retries = getattr(r.raw, 'retries', None)
+            call['retries'] = len(retries.history) if retries is not None else 0
+        return r
+
+    def close(self) -> None:
+        """ Close all pooled connections. """
+        self._session.close()
+
+    def _cache_get(self, key: tuple):
+        """ Get value from catalog cache, None if it is missing or expired. """
+        with self._cache_lock:
+            expires_at, value = self._cache.get(key, (0, None))
+            if expires_at < time.monotonic():
+                self._cache.pop(key, None)
+                return None
+            return value
+
+    def _cache_set(self, key: tuple, value, ttl: Optional[float] = None):
+        """ Put value to catalog cache for ttl (cache_ttl by default) seconds and return it. """
+        if ttl is None:
+            ttl = self._cache_ttl
+        if ttl > 0:
+            with self._cache_lock:
+                self._cache[key] = (time.monotonic() + ttl, value)
+        return value
+
+    def invalidate_cache(self, *keys: tuple) -> None:
+        """
+        Drop catalog cache entries.
+
+        Notes:
+        -----
+        Key is a tuple prefix, e.g. ('coveragestores', 'work') or ('layers',). Without keys the whole cache is dropped.
+        """
+
+        with self._cache_lock:
+            if not keys:
+                self._cache.clear()
+                return
+            for cached_key in list(self._cache):
+                if any(cached_key[:len(key)] == key for key in keys):
+                    del self._cache[cached_key]
+
     def reset(self) -> str:
         """
         Resets all store, raster, and schema caches. This operation is used to force GeoServer to drop all caches and
@@ -39,8 +194,10 @@ class Geoserver:
 
         url = "{}/rest/reset".format(self._service_url)
 
+        self.invalidate_cache()
+
         try:
-            r = requests.post(url, auth=(self._username, self._password))
+            r = self._request('POST', url)
             return "Status code: {}.".format(r.status_code)
 
         except Exception as e:
@@ -55,8 +212,10 @@ class Geoserver:
 
         url = "{}/rest/reload".format(self._service_url)
 
+        self.invalidate_cache()
+
         try:
-            r = requests.post(url, auth=(self._username, self._password))
+            r = self._request('POST', url)
             return "Status code: {}.".format(r.status_code)
 
         except Exception as e:
@@ -65,12 +224,18 @@ class Geoserver:
     def get_workspaces(self) -> Union[dict, str]:
         """ Returns all the workspaces. """
 
+        cached = self._cache_get(('workspaces',))
+        if cached is not None:
+            return cached
+
         url = "{}/rest/workspaces".format(self._service_url)
 
         try:
-            r = requests.get(url, auth=(self._username, self._password))
-            return r.json()['workspaces']['workspace']
+            r = self._request('GET', url)
+            return self._cache_set(('workspaces',), r.json()['workspaces']['workspace'])
 
+        except TypeError as e:
+            return self._cache_set(('workspaces',), [])  # if there are no workspaces return empty array
         except Exception as e:
             return "Can not get workspaces. {0}. Status code: {1}.".format(e, r.status_code)
 
@@ -80,13 +245,17 @@ class Geoserver:
         If workspace is None, it will listout all the layers from geoserver.
         """
 
+        cached = self._cache_get(('layers', workspace))
+        if cached is not None:
+            return cached
+
         url = "{}/rest/layers".format(
             self._service_url) if workspace is None else "{}/rest/workspaces/{}/layers".format(self._service_url,
                                                                                                workspace)
 
         try:
-            r = requests.get(url, auth=(self._username, self._password))
-            return r.json()
+            r = self._request('GET', url)
+            return self._cache_set(('layers', workspace), r.json())
 
         except Exception as e:
             return "Can not get layers. {0}. Status code: {1}.".format(e, r.status_code)
@@ -97,17 +266,76 @@ class Geoserver:
         if workspace is None:
             workspace = "default"
 
+        cached = self._cache_get(('coveragestores', workspace))
+        if cached is not None:
+            return cached
+
         url = "{}/rest/workspaces/{}/coveragestores".format(self._service_url, workspace)
 
         try:
-            r = requests.get(url, auth=(self._username, self._password))
-            return r.json()['coverageStores']['coverageStore']
+            r = self._request('GET', url)
+            return self._cache_set(('coveragestores', workspace), r.json()['coverageStores']['coverageStore'])
 
         except TypeError as e:
-            return []  # if coveragestore is empty return empty array
+            return self._cache_set(('coveragestores', workspace), [])  # if coveragestore is empty return empty array
         except Exception as e:
             return "Can not get coveragestores. {0}. Status code: {1}.".format(e, r.status_code)
 
+    def wait_for(
+            self,
+            check: Callable[[], bool],
+            timeout: float = 60,
+            initial_delay: float = 0.1,
+            max_delay: float = 5,
+            factor: float = 2,
+    ) -> bool:
+        """
+        Poll check with exponential backoff until it returns True or timeout seconds pass.
+
+        Notes:
+        -----
+        Returns as soon as the state is visible, False if it is not visible before the deadline.
+        """
+
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        while True:
+            if check():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * factor, max_delay)
+
+    def _check_resource_existence(self, url: str) -> bool:
+        """ Check that REST resource exists, the catalog cache is bypassed. """
+        try:
+            return self._request('GET', url).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def wait_for_workspace(self, workspace: str, timeout: float = 60) -> bool:
+        """ Wait until workspace is visible in the catalog. """
+        url = "{}/rest/workspaces/{}".format(self._service_url, workspace)
+        return self.wait_for(lambda: self._check_resource_existence(url), timeout=timeout)
+
+    def wait_for_coveragestore(self, workspace: str, coveragestore_name: str, timeout: float = 60) -> bool:
+        """ Wait until coveragestore is visible in the catalog. """
+        url = "{}/rest/workspaces/{}/coveragestores/{}".format(self._service_url, workspace, coveragestore_name)
+        return self.wait_for(lambda: self._check_resource_existence(url), timeout=timeout)
+
+    def wait_for_coverage(self, workspace: str, coveragestore_name: str, timeout: float = 60) -> bool:
+        """ Wait until coverage (layer) of coveragestore is configured. """
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}'.format(self._service_url, workspace,
+                                                                                coveragestore_name)
+        return self.wait_for(lambda: self._check_resource_existence(url), timeout=timeout)
+
+    def wait_for_gwc_layer(self, workspace: str, coveragestore_name: str, timeout: float = 60) -> bool:
+        """ Wait until GWC layer of coveragestore is created. """
+        url = '{0}/gwc/rest/layers/{1}:{2}'.format(self._service_url, workspace, coveragestore_name)
+        return self.wait_for(lambda: self._check_resource_existence(url), timeout=timeout)
+
     def delete_workspace(self, workspace: str) -> str:
         """ Delete workspace by name. """
 
@@ -115,8 +343,10 @@ class Geoserver:
 
         params = {"recurse": "true"}  # flag to delete all layers and coveragestores from this workspace
 
+        self.invalidate_cache()
+
         try:
-            r = requests.delete(url, auth=(self._username, self._password), params=params)
+            r = self._request('DELETE', url, params=params)
 
             if r.status_code == 200:
                 return "Workspace {0} deleted. Status code: {1}.".format(workspace, r.status_code)
@@ -138,12 +368,15 @@ class Geoserver:
         """
 
         url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}.xml'.format(self._service_url, workspace,
-                                                                                    store_name)
+                                                                                    coveragestore_name)
 
         params = {"recurse": "true"}
 
+        self.invalidate_cache(('layers',), ('layer_description', workspace, coveragestore_name),
+                              ('layer_id', workspace, coveragestore_name))
+
         try:
-            r = requests.delete(url, auth=(self._username, self._password), params=params)
+            r = self._request('DELETE', url, params=params)
 
             if r.status_code in (200, 201, 202):
                 return 'Layer {0} deleted. Status code : {1}.'.format(coveragestore_name, r.status_code)
@@ -165,8 +398,10 @@ class Geoserver:
 
         params = {"recurse": "true"}  # flag to delete all layers from coverage store
 
+        self.invalidate_cache(('coveragestores',), ('layers',), ('layer_description',), ('layer_id',))
+
         try:
-            r = requests.delete(url, auth=(self._username, self._password), params=params)
+            r = self._request('DELETE', url, params=params)
             if r.status_code == 200:
                 return "Coverage store deleted successfully. Status code: {}.".format(r.status_code)
 
@@ -183,8 +418,10 @@ class Geoserver:
 
         headers = {"content-type": "text/xml"}
 
+        self.invalidate_cache(('workspaces',))
+
         try:
-            r = requests.post(url, data, auth=(self._username, self._password), headers=headers)
+            r = self._request('POST', url, data=data, headers=headers)
 
             if r.status_code == 201:
                 return "Workspace {0} created. Status code: {1}.".format(workspace, r.status_code)
@@ -203,18 +440,27 @@ class Geoserver:
             configure: Optional[bool] = None,
             file_type: str = "imagemosaic",
             content_type: str = "application/zip",
+            chunk_size: int = 1024 * 1024,
+            progress: Optional[Callable] = None,
+            data: Optional[Iterable[bytes]] = None,
     ):
-        """ Create coveragestore in worksapce. """
+        """
+        Create coveragestore in worksapce.
 
-        if not os.path.exists(path):
+        Notes:
+        -----
+        The zip file is streamed from disk in chunks of chunk_size bytes, so memory usage does not depend
+        on the archive size. progress(bytes_sent, total_bytes, throughput) is called after every chunk.
+        Instead of path, data can be an iterable of zip bytes, e.g. PublicationUtils.iter_zip_dir(init_dir),
+        it is sent with chunked transfer encoding.
+        """
+
+        if data is None and not os.path.exists(path):
             raise FileNotFoundError('This path not exists!')
 
         if workspace is None:
             workspace = 'default'
 
-        if configure:
-            params['configure'] = 'none'
-
         url = '{0}/rest/workspaces/{1}/coveragestores/{2}/file.{3}'.format(
             self._service_url, workspace, coveragestore_name, file_type
         )
@@ -227,43 +473,155 @@ class Geoserver:
             'coverageName': coveragestore_name
         }
 
+        if configure:
+            params['configure'] = 'none'
+
+        self.invalidate_cache(('coveragestores', workspace), ('layers',), ('layer_description', workspace),
+                              ('layer_id', workspace))
+
         try:
-            with open(path, 'rb') as f:
-                r = requests.put(url, data=f.read(),
-                                 auth=(self._username, self._password), headers=headers, params=params)
+            if data is not None:
+                r = self._request('PUT', url, data=data, headers=headers, params=params)
+            else:
+                with UploadStream(path, chunk_size=chunk_size, progress=progress) as stream:
+                    r = self._request('PUT', url, data=stream, headers=headers, params=params)
 
             return 'Coveragestore {0} is created. Status code: {1}.'.format(coveragestore_name, r.status_code)
 
         except Exception as e:
             return "The coveragestore can not be created. {0}. Status code: {1}.".format(e, r.status_code)
 
+    def create_coveragestore_from_directory(
+            self,
+            path: str,
+            workspace: Optional[str] = None,
+            coveragestore_name: Optional[str] = None,
+            configure: str = 'all',
+            file_type: str = "imagemosaic",
+    ) -> str:
+        """
+        Create coveragestore from directory readable by GeoServer, nothing is uploaded.
+
+        Notes:
+        -----
+        Used for mosaic directories with pre-built index (<coveragestore_name>.properties and shapefile),
+        GeoServer reads the index instead of harvesting the granules one by one.
+        """
+
+        if not os.path.isdir(path):
+            raise FileNotFoundError('This path not exists!')
+
+        if workspace is None:
+            workspace = 'default'
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/external.{3}'.format(
+            self._service_url, workspace, coveragestore_name, file_type
+        )
+
+        headers = {
+            'content-type': 'text/plain'
+        }
+
+        params = {
+            'configure': configure,
+            'coverageName': coveragestore_name
+        }
+
+        self.invalidate_cache(('coveragestores', workspace), ('layers',), ('layer_description', workspace),
+                              ('layer_id', workspace))
+
+        try:
+            r = self._request('PUT', url, data='file://' + os.path.abspath(path), headers=headers, params=params)
+            r.raise_for_status()
+            return 'Coveragestore {0} is created. Status code: {1}.'.format(coveragestore_name, r.status_code)
+
+        except Exception as e:
+            return "The coveragestore can not be created. {0}.".format(e)
+
     def _get_granules_list_from_json(self, granules_json: dict) -> dict:
         """ Get granules(layers) names and their file locations from json. """
+        return {el['id']: el['properties']['location'] for el in granules_json['features']}
+
+    def _iter_granules_from_stream(self, chunks: Iterator[bytes]) -> Iterator[Tuple[str, str]]:
+        """ Parse granules json incrementally and yield (id, location) pairs. """
+        parser = GranuleStreamParser()
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        parser.close()
 
-        ids = [el['id'] for el in granules_json['features']]  # all ids of granules
-        locations = [el['properties']['location'] for el in granules_json['features']]  # all locations of granules
-        return dict(zip(ids, locations))
+    def _get_granules_url(self, workspace: str, coveragestore_name: str) -> str:
+        return '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}/index/granules.json'.format(
+            self._service_url,
+            workspace,
+            coveragestore_name
+        )
 
     def get_granules_from_coveragestore(
             self,
             workspace: str,
             coveragestore_name: str,
+            cql_filter: Optional[str] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
     ) -> Union[dict, str]:
-        """ Get all granules(layers) from coveragesotre. """
+        """
+        Get granules(layers) from coveragesotre.
 
-        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}/index/granules.json'.format(
-            self._service_url,
-            workspace,
-            coveragestore_name
-        )
+        Notes:
+        -----
+        Without arguments all granules are returned. cql_filter, offset and limit are passed to GeoServer
+        as filter, offset and limit query parameters, for example:
+
+        cql_filter="location LIKE '%20210709%'"
+        cql_filter="time >= 2021-07-09T00:00:00Z AND time < 2021-07-10T00:00:00Z"
+        """
+
+        url = self._get_granules_url(workspace, coveragestore_name)
+
+        params = {'filter': cql_filter, 'offset': offset, 'limit': limit}  # None values are not sent
 
         try:
-            r = requests.get(url, auth=(self._username, self._password))
+            r = self._request('GET', url, params=params)
             return self._get_granules_list_from_json(r.json())
 
         except Exception as e:
             return "Can not get granules from coveragestore. {0}. Status code: {1}.".format(e, r.status_code)
 
+    def iter_granules_from_coveragestore(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            cql_filter: Optional[str] = None,
+            page_size: Optional[int] = 1000,
+            chunk_size: int = 64 * 1024,
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Lazily yield (id, location) of granules from coveragestore.
+
+        Notes:
+        -----
+        The index is requested page by page (offset/limit), every page is parsed while it is downloaded.
+        page_size None requests the whole index in one streamed response.
+        Unlike other methods, errors are raised as requests exceptions.
+        """
+
+        url = self._get_granules_url(workspace, coveragestore_name)
+        offset = 0
+
+        while True:
+            params = {'filter': cql_filter, 'offset': offset if page_size else None, 'limit': page_size}
+
+            with self._request('GET', url, params=params, stream=True) as r:
+                r.raise_for_status()
+                count = 0
+                for granule in self._iter_granules_from_stream(r.iter_content(chunk_size)):
+                    count += 1
+                    yield granule
+
+            if not page_size or count < page_size:
+                return
+            offset += count
+
     def delete_granula_from_coveragestore(
             self,
             workspace: str,
@@ -280,12 +638,66 @@ class Geoserver:
         )
 
         try:
-            r = requests.delete(url, auth=(self._username, self._password))
+            r = self._request('DELETE', url)
             return 'Granula "{0}" deleted successfully. Status code: {1}.'.format(granula_id, r.status_code)
 
         except Exception as e:
             return "Can not delete granula. {0}. Status code: {1}.".format(e, r.status_code)
 
+    def delete_granules_from_coveragestore(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            cql_filter: str,
+            purge: str = 'none',
+    ) -> str:
+        """
+        Delete all granules matching CQL filter from coveragestore in one request.
+
+        Notes:
+        -----
+        Examples of filter: "time < 2021-07-01T00:00:00Z", "location IN ('/data/a.tif', '/data/b.tif')".
+        purge: 'none' keeps files on disk, 'metadata' removes index related files, 'all' removes granule files too.
+        """
+
+        url = '{0}/rest/workspaces/{1}/coveragestores/{2}/coverages/{2}/index/granules'.format(
+            self._service_url,
+            workspace,
+            coveragestore_name
+        )
+
+        params = {'filter': cql_filter, 'purge': purge}
+
+        try:
+            r = self._request('DELETE', url, params=params)
+            r.raise_for_status()
+            return 'Granules deleted successfully. Status code: {}.'.format(r.status_code)
+
+        except Exception as e:
+            return "Can not delete granules. {0}.".format(e)
+
+    def delete_granules_by_locations(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            locations: Iterable[str],
+            batch_size: int = 100,
+            purge: str = 'none',
+    ) -> List[Optional[str]]:
+        """ Delete granules by file locations, batch_size locations per request to keep URLs short. """
+
+        locations = list(locations)
+        results = []
+        for i in range(0, len(locations), batch_size):
+            quoted = ", ".join("'{}'".format(location.replace("'", "''")) for location in locations[i:i + batch_size])
+            results.append(self.delete_granules_from_coveragestore(
+                workspace=workspace,
+                coveragestore_name=coveragestore_name,
+                cql_filter='location IN ({})'.format(quoted),
+                purge=purge
+            ))
+        return results
+
     def publish_file_to_coveragestore(
             self,
             path,
@@ -329,10 +741,10 @@ class Geoserver:
         configuration_data = path
 
         try:
-            r = requests.post(
+            r = self._request(
+                'POST',
                 url,
                 data=configuration_data,
-                auth=(self._username, self._password),
                 headers=headers
             )
 
@@ -342,13 +754,72 @@ class Geoserver:
         except Exception as e:
             return "Can not publish it. {0}. Status code: {1}.".format(e, r.status_code)
 
+    def _get_store_semaphore(self, workspace: str, coveragestore_name: str) -> threading.BoundedSemaphore:
+        """ Semaphore limiting concurrent publish requests to one coveragestore. """
+        with self._cache_lock:
+            key = (workspace, coveragestore_name)
+            if key not in self._store_semaphores:
+                self._store_semaphores[key] = threading.BoundedSemaphore(self._store_concurrency)
+            return self._store_semaphores[key]
+
+    def publish_files_to_coveragestore(
+            self,
+            paths: Iterable[str],
+            coveragestore_name: str,
+            workspace: str,
+            max_workers: Optional[int] = None,
+            file_type: str = "imagemosaic",
+            content_type: str = "image/tiff"
+    ) -> List[Optional[str]]:
+        """
+        Publish many files to coveragestore concurrently.
+
+        Notes
+        -----
+        Results are returned in the order of paths, an error of one file is returned as its result string and does
+        not stop the others. At most store_concurrency requests run against one coveragestore and at most
+        2 * max_workers paths are taken from the iterable ahead of publication, so paths can be a lazy generator.
+        Keep max_workers not greater than pool_maxsize to reuse pooled connections.
+        """
+
+        if max_workers is None:
+            max_workers = self._store_concurrency
+
+        store_semaphore = self._get_store_semaphore(workspace, coveragestore_name)
+        pending = threading.BoundedSemaphore(2 * max_workers)  # back-pressure on the paths iterable
+
+        def publish(path):
+            try:
+                with store_semaphore:
+                    return self.publish_file_to_coveragestore(
+                        path=path,
+                        coveragestore_name=coveragestore_name,
+                        workspace=workspace,
+                        file_type=file_type,
+                        content_type=content_type
+                    )
+            except Exception as e:
+                return "Can not publish it. {0}.".format(e)
+            finally:
+                pending.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for path in paths:
+                pending.acquire()
+                futures.append(executor.submit(publish, path))
+
+        return [future.result() for future in futures]
+
     def publish_zip_to_coveragestore(
             self,
             path,
             coveragestore_name: str,
             workspace: str,
             file_type: str = 'imagemosaic',
-            content_type: str = "application/zip"
+            content_type: str = "application/zip",
+            chunk_size: int = 1024 * 1024,
+            progress: Optional[Callable] = None,
     ):
         """ 
         Publish zip file to coveragestore like a binary. 
@@ -356,6 +827,7 @@ class Geoserver:
         Notes:
         -----
         Example of path: '/NFS_WORK/sat/public/test_products/init_with_tiff/tiff.zip'
+        The zip file is streamed from disk in chunks, see create_coveragestore.
         """
 
         url = '{0}/rest/workspaces/{1}/coveragestores/{2}/file.{3}'.format(self._service_url, workspace,
@@ -370,9 +842,8 @@ class Geoserver:
         }
 
         try:
-            with open(path, 'rb') as f:
-                r = requests.post(url, data=f.read(), auth=(
-                    self._username, self._password), headers=headers, params=params)
+            with UploadStream(path, chunk_size=chunk_size, progress=progress) as stream:
+                r = self._request('POST', url, data=stream, headers=headers, params=params)
 
             if r.status_code in (200, 201, 202):
                 return 'Zip file published. Status code: {}.'.format(r.status_code)
@@ -380,9 +851,47 @@ class Geoserver:
         except Exception as e:
             return "Can not publish zip file. {0}. Status code: {1}.".format(e, r.status_code)
 
-    def _get_id_of_layer(self, description: str) -> str:
-        """ Get layer id from parsed description string. """
-        return ET.fromstring(description).find('id').text
+    def _get_layer_id(self, workspace: str, coveragestore_name: str, chunk_size: int = 8 * 1024) -> Optional[str]:
+        """
+        Get GWC layer id.
+
+        Notes:
+        -----
+        Ids are cached until the layer is deleted or the cache is reset. The description is parsed incrementally
+        and parsing stops at the id element, the rest of the response is only drained to keep the connection.
+        """
+
+        cache_key = ('layer_id', workspace, coveragestore_name)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        url = '{0}/gwc/rest/layers/{1}:{2}'.format(self._service_url, workspace, coveragestore_name)
+
+        headers = {
+            "accept": "application/xml"
+        }
+
+        layer_id = None
+        with self._request('GET', url, headers=headers, stream=True) as r:
+            if r.status_code not in (200, 201, 202):
+                return None
+
+            parser = ET.XMLPullParser(events=('start', 'end'))
+            depth = 0
+            for chunk in r.iter_content(chunk_size):
+                if layer_id is not None:
+                    continue
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    depth += 1 if event == 'start' else -1
+                    if event == 'end' and depth == 1 and element.tag == 'id':
+                        layer_id = element.text
+                        break
+
+        if layer_id is not None:
+            self._cache_set(cache_key, layer_id, ttl=float('inf'))
+        return layer_id
 
     def _get_layer_description(
             self,
@@ -392,6 +901,11 @@ class Geoserver:
     ) -> str:
         """ Get layer description by name. """
 
+        cache_key = ('layer_description', workspace, coveragestore_name, content_type)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+
         url = '{0}/gwc/rest/layers/{1}:{2}'.format(self._service_url, workspace, coveragestore_name)
 
         headers = {
@@ -399,10 +913,10 @@ class Geoserver:
         }
 
         try:
-            r = requests.get(url, auth=(self._username, self._password), headers=headers)
+            r = self._request('GET', url, headers=headers)
 
             if r.status_code in (200, 201, 202):
-                return r.text
+                return self._cache_set(cache_key, r.text)
 
         except Exception as e:
             return "Can not get description. {0}. Status code: {1}.".format(e, r.status_code)
@@ -413,80 +927,214 @@ class Geoserver:
             workspace: str,
             content_type: str = "application/xml; charset=UTF-8",
             blob: str = "RAM",
-            start_time: str = "2021-07-09T00:00:00Z"  # default value
+            start_time: str = "2021-07-09T00:00:00Z",  # default value
+            mime_formats: Iterable[str] = ('image/png', 'image/jpeg'),
+            gridsets: Iterable[str] = ('EPSG:4326', 'EPSG:900913'),
+            metatile: Tuple[int, int] = (4, 4),
+            regex_filters: Iterable[Tuple[str, str, str]] = (),
     ) -> str:
         """ 
         Replaces the old timecache file with a new one with a description of the time dimension and cache data. 
+
+        Notes:
+        -----
+        The GeoServerLayer document is rendered from a template cached per layer config (see payloads),
+        json is sent if content_type is json. regex_filters are additional (key, regex, default value) filters.
         """
 
-        url = '{0}/gwc/rest/layers/{1}:{2}.xml'.format(self._service_url, workspace, coveragestore_name)
+        payload_format = get_payload_format(content_type)
+
+        url = '{0}/gwc/rest/layers/{1}:{2}.{3}'.format(self._service_url, workspace, coveragestore_name,
+                                                       payload_format)
 
         headers = {
             "content-type": content_type
         }
 
-        coveragestore_id = self._get_id_of_layer(
-            self._get_layer_description(workspace=workspace, coveragestore_name=coveragestore_name))
-
-        timecache_data = (
-            "<GeoServerLayer>"
-            "<id>{0}</id>"
-            "<enabled>true</enabled>"
-            "<inMemoryCached>true</inMemoryCached>"
-            "<name>{1}:{2}</name>"
-            "<blobStoreId>{3}</blobStoreId>"
-            "<mimeFormats>"
-            "<string>image/png</string>"
-            "<string>image/jpeg</string>"
-            "</mimeFormats>"
-            "<gridSubsets>"
-            "<gridSubset>"
-            "<gridSetName>EPSG:4326</gridSetName>"
-            "</gridSubset>"
-            "<gridSubset>"
-            "<gridSetName>EPSG:900913</gridSetName>"
-            "</gridSubset>"
-            "</gridSubsets>"
-            "<metaWidthHeight>"
-            "<int>4</int>"
-            "<int>4</int>"
-            "</metaWidthHeight>"
-            "<expireCache>0</expireCache>"
-            "<expireClients>0</expireClients>"
-            "<parameterFilters>"
-            "<regexParameterFilter>"
-            "<key>TIME</key>"
-            "<defaultValue>{4}</defaultValue>"
-            "<normalize>"
-            "<locale></locale>"
-            "</normalize>"
-            "<regex>[0-9]{4}-[0-9]{2}-[0-9]{2}T([0-9]{2}:){2}[0-9]{2}[.][0-9]{3}Z</regex>"
-            "</regexParameterFilter>"
-            "<styleParameterFilter>"
-            "<key>STYLES</key>"
-            "<defaultValue></defaultValue>"
-            "</styleParameterFilter>"
-            "</parameterFilters>"
-            "<gutter>0</gutter>"
-            "* Connection #0 to host localhost left intact"
-            "</GeoServerLayer>".format(
-                coveragestore_id, workspace, coveragestore_name, blob, start_time
-            )
+        self.invalidate_cache(('layer_description', workspace, coveragestore_name))
+
+        template = gwc_layer_template(
+            blob_store=blob,
+            mime_formats=tuple(mime_formats),
+            gridsets=tuple(gridsets),
+            metatile=tuple(metatile),
+            regex_filters=tuple(tuple(regex_filter) for regex_filter in regex_filters)
         )
 
         try:
-            r = requests.put(
-                url,
-                data=timecache_data,
-                auth=(self._username, self._password),
-                headers=headers
-            )
+            status_code = None
+            for _ in range(2):
+                layer_id = self._get_layer_id(workspace, coveragestore_name)
+                if layer_id is None:
+                    return "Can not publish. Layer {0}:{1} not found.".format(workspace, coveragestore_name)
+
+                timecache_data = template.render(
+                    payload_format,
+                    id=layer_id,
+                    name='{}:{}'.format(workspace, coveragestore_name),
+                    time=start_time
+                )
+
+                r = self._request(
+                    'PUT',
+                    url,
+                    data=timecache_data,
+                    headers=headers
+                )
+                status_code = r.status_code
+
+                if r.status_code in (200, 201, 202):
+                    return 'Timecache file is published. Status code: {}.'.format(r.status_code)
+
+                # cached layer id can be outdated if the layer was recreated by someone else
+                self.invalidate_cache(('layer_id', workspace, coveragestore_name))
+
+            return "Can not publish. Status code: {}.".format(status_code)
 
-            if r.status_code in (200, 201, 202):
-                return 'Timecache file is published. Status code: {}.'.format(r.status_code)
+        except Exception as e:
+            return "Can not publish. {0}.".format(e)
+
+    def get_seed_tasks(self, workspace: Optional[str] = None, layer_name: Optional[str] = None) -> Union[list, str]:
+        """
+        Get GWC seed/truncate tasks of a layer, or of all layers if layer_name is None.
+
+        Notes:
+        -----
+        Every task is a dict with tiles_done, tiles_total, time_remaining, task_id and status
+        (-1 aborted, 0 pending, 1 running, 2 done). GWC runs one task per seeding thread.
+        """
+
+        if layer_name is None:
+            url = '{0}/gwc/rest/seed.json'.format(self._service_url)
+        else:
+            url = '{0}/gwc/rest/seed/{1}:{2}.json'.format(self._service_url, workspace, layer_name)
+
+        keys = ('tiles_done', 'tiles_total', 'time_remaining', 'task_id', 'status')
+
+        try:
+            r = self._request('GET', url)
+            r.raise_for_status()
+            return [dict(zip(keys, task)) for task in r.json()['long-array-array']]
+
+        except Exception as e:
+            return "Can not get seed tasks. {0}.".format(e)
+
+    def _count_running_seed_threads(self) -> int:
+        tasks = self.get_seed_tasks()
+        if isinstance(tasks, str):
+            return 0
+        return sum(1 for task in tasks if task['status'] in (0, 1))
+
+    def seed_layer(
+            self,
+            workspace: str,
+            layer_name: str,
+            seed_type: str = 'seed',
+            time_value: Optional[str] = None,
+            bbox: Optional[Tuple[float, float, float, float]] = None,
+            srs: int = 4326,
+            gridset: str = 'EPSG:4326',
+            zoom_start: int = 0,
+            zoom_stop: int = 5,
+            image_format: str = 'image/png',
+            threads: int = 1,
+            parameters: Optional[dict] = None,
+            timeout: float = 60,
+    ) -> str:
+        """
+        Start GWC seed, reseed or truncate task for a layer.
+
+        Notes:
+        -----
+        time_value restricts the task to one TIME parameter value, e.g. '2021-07-09T05:00:00.000Z',
+        bbox is (minx, miny, maxx, maxy) in srs. threads are capped by max_seed_threads, the task (truncate too)
+        is started when enough seeding threads are free or timeout seconds passed, so many tasks do not pile up
+        in GWC.
+        """
+
+        url = '{0}/gwc/rest/seed/{1}:{2}.json'.format(self._service_url, workspace, layer_name)
+
+        headers = {
+            "content-type": "application/json"
+        }
+
+        threads = max(1, min(threads, self._max_seed_threads))
+
+        parameters = dict(parameters or {})
+        if time_value is not None:
+            parameters['TIME'] = time_value
+
+        seed_request = {
+            'name': '{}:{}'.format(workspace, layer_name),
+            'srs': {'number': srs},
+            'zoomStart': zoom_start,
+            'zoomStop': zoom_stop,
+            'format': image_format,
+            'type': seed_type,
+            'threadCount': threads,
+            'gridSetId': gridset,
+        }
+        if bbox is not None:
+            seed_request['bounds'] = {'coords': {'double': list(bbox)}}
+        if parameters:
+            seed_request['parameters'] = {'entry': [{'string': [key, value]} for key, value in parameters.items()]}
+
+        self.wait_for(lambda: self._count_running_seed_threads() + threads <= self._max_seed_threads,
+                      timeout=timeout, initial_delay=1)
+
+        try:
+            r = self._request('POST', url, data=json.dumps({'seedRequest': seed_request}), headers=headers)
+            r.raise_for_status()
+            return '{0} task started. Status code: {1}.'.format(seed_type.capitalize(), r.status_code)
 
         except Exception as e:
-            return "Can not publish. {0}. Status code: {1}.".format(e, r.status_code)
+            return "Can not start {0} task. {1}.".format(seed_type, e)
+
+    def truncate_layer(self, workspace: str, layer_name: str, **seed_args) -> str:
+        """ Remove cached tiles of a layer, arguments are the same as in seed_layer. """
+        return self.seed_layer(workspace, layer_name, seed_type='truncate', **seed_args)
+
+    def wait_for_seed(self, workspace: str, layer_name: str, timeout: float = 600) -> bool:
+        """ Wait until all seed tasks of the layer are finished. """
+
+        def check():
+            tasks = self.get_seed_tasks(workspace, layer_name)
+            return not isinstance(tasks, str) and all(task['status'] not in (0, 1) for task in tasks)
+
+        return self.wait_for(check, timeout=timeout, initial_delay=1, max_delay=10)
+
+    def update_gwc_layers(
+            self,
+            layers: Iterable[Tuple[str, str]],
+            max_workers: Optional[int] = None,
+            **layer_config
+    ) -> dict:
+        """
+        Update caching settings of many GWC layers at once.
+
+        Notes:
+        -----
+        layers are (workspace, coveragestore_name) pairs, layer_config are publish_timecahe_file_to_coveragestore
+        arguments shared by all layers. Returns result of every layer, layers are updated concurrently.
+        """
+
+        layers = list(layers)
+        if max_workers is None:
+            max_workers = self._store_concurrency
+
+        def update(layer):
+            workspace, coveragestore_name = layer
+            try:
+                return self.publish_timecahe_file_to_coveragestore(
+                    coveragestore_name=coveragestore_name,
+                    workspace=workspace,
+                    **layer_config
+                )
+            except Exception as e:
+                return "Can not publish. {0}.".format(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(layers, executor.map(update, layers)))
 
     def publish_time_dimension_to_coveragestore(
             self,
@@ -513,32 +1161,17 @@ class Geoserver:
             "content-type": content_type
         }
 
-        time_dimension_data = (
-            "<coverage>"
-            "<enabled>true</enabled>"
-            "<metadata>"
-            "<entry key='time'>"
-            "<dimensionInfo>"
-            "<enabled>true</enabled>"
-            "<presentation>{0}</presentation>"
-            "<units>{1}</units>"
-            "<defaultValue>"
-            "<strategy>{2}</strategy>"
-            "</defaultValue>"
-            "</dimensionInfo>"
-            "</entry>"
-            "</metadata>"
-            "</coverage>".format(
-                presentation, units, default_value
-            )
-        )
+        time_dimension_data = coverage_template(
+            dimensions=(('time', presentation, units, default_value),)
+        ).render(get_payload_format(content_type))
 
         try:
-            r = requests.put(url,
-                             data=time_dimension_data,
-                             auth=(self._username, self._password),
-                             headers=headers
-                             )
+            r = self._request(
+                'PUT',
+                url,
+                data=time_dimension_data,
+                headers=headers
+            )
 
             if r.status_code in (200, 201):
                 return 'Time dimension is published. Status code: {}.'.format(r.status_code)
@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class GranuleIndex:
+    """
+    Local index of granule file names of one coveragestore.
+
+    Attributes
+    ----------
+    geoserver : Geoserver
+        Client used to download the granule index.
+    workspace : str
+        Workspace of the coveragestore.
+    coveragestore_name : str
+        Name of the coveragestore.
+    path : str, optional
+        SQLite file to persist the index between runs.
+    time_attribute : str
+        Time attribute of the mosaic index used in delta queries.
+    max_age : float
+        Seconds during which the index is trusted without delta queries.
+
+    Notes
+    -----
+    The full granule index is downloaded only once (or loaded from path), afterwards names are added and removed
+    by our own publishes/deletes and refreshed with time-filtered delta queries, so lookups are set lookups.
+    """
+
+    def __init__(
+            self,
+            geoserver,
+            workspace: str,
+            coveragestore_name: str,
+            path: Optional[str] = None,
+            time_attribute: str = 'time',
+            max_age: float = 60,
+    ):
+        self._geoserver = geoserver
+        self._workspace = workspace
+        self._coveragestore_name = coveragestore_name
+        self._time_attribute = time_attribute
+        self._max_age = max_age
+        self._names = set()
+        self._populated = False
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS granules (name TEXT PRIMARY KEY)')
+            self._db.commit()
+            self._names = {name for (name,) in self._db.execute('SELECT name FROM granules')}
+            self._populated = bool(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        return self.contains(name)
+
+    def __len__(self) -> int:
+        self._ensure_populated()
+        return len(self._names)
+
+    @staticmethod
+    def _get_name_from_location(location: str) -> str:
+        return location.split('/')[-1]
+
+    def _ensure_populated(self) -> bool:
+        """ Download the whole index if it is not known yet, True if this call downloaded it. """
+        # checked and downloaded under the lock, so concurrent lookups make one download
+        with self._lock:
+            if self._populated:
+                return False
+            self._replace(self._fetch())
+            return True
+
+    def _fetch(self, cql_filter: Optional[str] = None) -> set:
+        return {
+            self._get_name_from_location(location)
+            for _, location in self._geoserver.iter_granules_from_coveragestore(
+                workspace=self._workspace,
+                coveragestore_name=self._coveragestore_name,
+                cql_filter=cql_filter
+            )
+        }
+
+    def _persist(self, added=(), removed=(), replace: bool = False) -> None:
+        if self._db is None:
+            return
+        with self._db:
+            if replace:
+                self._db.execute('DELETE FROM granules')
+            self._db.executemany('INSERT OR IGNORE INTO granules (name) VALUES (?)', ((n,) for n in added))
+            self._db.executemany('DELETE FROM granules WHERE name = ?', ((n,) for n in removed))
+
+    def populate(self) -> None:
+        """ Download the whole granule index. """
+        with self._lock:
+            self._replace(self._fetch())
+
+    def replace(self, names) -> None:
+        """
+        Replace local state with a complete set of granule names, e.g. of a full index download.
+
+        Notes:
+        -----
+        Delta queries only add names, so entries of granules deleted by others (also persisted ones) are dropped
+        only by a full replace, see Publicator.reconcile.
+        """
+
+        with self._lock:
+            self._replace(names)
+
+    def _replace(self, names) -> None:
+        # caller holds the lock
+        self._names = set(names)
+        self._populated = True
+        self._synced_at = time.monotonic()
+        self._persist(added=self._names, replace=True)
+
+    def sync(self, since: str) -> None:
+        """ Add granules with time attribute not earlier than since (ISO 8601, e.g. 2021-07-09T05:00:00Z). """
+        if self._ensure_populated():
+            return
+        names = self._fetch('{0} >= {1}'.format(self._time_attribute, since))
+        with self._lock:
+            added = names - self._names
+            self._names |= added
+            self._synced_at = time.monotonic()
+            self._persist(added=added)
+
+    def contains(self, name: str, since: Optional[str] = None) -> bool:
+        """
+        Check granule existence by file name.
+
+        Notes:
+        -----
+        If the name is unknown, the index is older than max_age and since is given, a delta query from since
+        is made before answering.
+        """
+
+        self._ensure_populated()
+        if name in self._names:
+            return True
+        if since is not None and time.monotonic() - self._synced_at > self._max_age:
+            self.sync(since)
+            return name in self._names
+        return False
+
+    def add(self, name: str) -> None:
+        """ Register granule published by us. """
+        with self._lock:
+            self._names.add(name)
+            self._persist(added=(name,))
+
+    def discard(self, name: str) -> None:
+        """ Forget granule deleted by us. """
+        with self._lock:
+            self._names.discard(name)
+            self._persist(removed=(name,))
+
+    def discard_many(self, names) -> None:
+        """ Forget many granules deleted by us. """
+        names = set(names)
+        with self._lock:
+            self._names -= names
+            self._persist(removed=names)
+
+    def clear(self) -> None:
+        """ Drop local state, the index is downloaded again on next lookup. """
+        with self._lock:
+            self._names = set()
+            self._populated = False
+            self._persist(replace=True)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
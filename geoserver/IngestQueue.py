@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import List, Optional
+
+IngestJob = namedtuple('IngestJob', ['granule', 'args', 'state', 'attempts'])
+
+JOB_STATES = ('pending', 'staged', 'published', 'verified', 'failed')
+
+
+class IngestQueue:
+    """
+    Persistent queue of slots to publish.
+
+    Attributes
+    ----------
+    path : str
+        SQLite file of the queue.
+    max_attempts : int
+        Number of attempts before a job is marked as failed.
+    backoff : float
+        Delay in seconds before the first retry, doubled with every attempt.
+
+    Notes
+    -----
+    Jobs are unique by granule name and move through pending -> staged -> published -> verified states,
+    so after a restart every job resumes from its last recorded state. Claims of a previous process are
+    released on open, the queue is meant to be drained by one process.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 5, backoff: float = 30):
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'granule TEXT PRIMARY KEY, '
+                'product TEXT NOT NULL, year TEXT NOT NULL, month TEXT NOT NULL, day TEXT NOT NULL, '
+                'dtime TEXT NOT NULL, '
+                "state TEXT NOT NULL DEFAULT 'pending', "
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'next_attempt REAL NOT NULL DEFAULT 0, '
+                'claimed INTEGER NOT NULL DEFAULT 0, '
+                'error TEXT, '
+                'updated REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, next_attempt)')
+            self._db.execute('UPDATE jobs SET claimed = 0')
+
+    def __len__(self) -> int:
+        """ Number of unfinished jobs. """
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state NOT IN ('verified', 'failed')").fetchone()
+        return count
+
+    def put(self, args, granule: str) -> bool:
+        """ Add slot, returns False if the granule is already queued. """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                'INSERT OR IGNORE INTO jobs (granule, product, year, month, day, dtime, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (granule, *args, time.time())
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, limit: int = 1) -> List[IngestJob]:
+        """ Take unfinished jobs which are due, oldest slots first. """
+        with self._lock, self._db:
+            rows = self._db.execute(
+                'SELECT granule, product, year, month, day, dtime, state, attempts FROM jobs '
+                "WHERE state NOT IN ('verified', 'failed') AND claimed = 0 AND next_attempt <= ? "
+                'ORDER BY year, month, day, dtime LIMIT ?',
+                (time.time(), limit)
+            ).fetchall()
+            self._db.executemany('UPDATE jobs SET claimed = 1 WHERE granule = ?', ((row[0],) for row in rows))
+        return [IngestJob(row[0], tuple(row[1:6]), row[6], row[7]) for row in rows]
+
+    def set_state(self, granule: str, state: str) -> None:
+        """ Record job progress, the job stays claimed until it is verified or released. """
+        if state not in JOB_STATES:
+            raise ValueError('state must be one of {}'.format(', '.join(JOB_STATES)))
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE jobs SET state = ?, claimed = ?, error = NULL, updated = ? WHERE granule = ?',
+                (state, 0 if state in ('verified', 'failed') else 1, time.time(), granule)
+            )
+
+    def release(self, granule: str) -> None:
+        """ Return claimed job to the queue. """
+        with self._lock, self._db:
+            self._db.execute('UPDATE jobs SET claimed = 0 WHERE granule = ?', (granule,))
+
+    def fail(self, granule: str, error: str, state: Optional[str] = None) -> str:
+        """
+        Record failed attempt, the job is retried with exponential backoff until max_attempts.
+
+        Notes:
+        -----
+        state moves the job back, e.g. to 'staged' to publish it again. Returns the new state.
+        """
+
+        with self._lock, self._db:
+            (attempts, current_state) = self._db.execute(
+                'SELECT attempts, state FROM jobs WHERE granule = ?', (granule,)).fetchone()
+            attempts += 1
+            if attempts >= self._max_attempts:
+                state = 'failed'
+            elif state is None:
+                state = current_state
+            self._db.execute(
+                'UPDATE jobs SET state = ?, attempts = ?, next_attempt = ?, claimed = 0, error = ?, updated = ? '
+                'WHERE granule = ?',
+                (state, attempts, time.time() + self._backoff * 2 ** (attempts - 1), error, time.time(), granule)
+            )
+        return state
+
+    def retry_failed(self) -> int:
+        """ Put failed jobs back to the queue, returns their number. """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, next_attempt = 0 WHERE state = 'failed'")
+        return cursor.rowcount
+
+    def next_attempt_in(self) -> Optional[float]:
+        """ Seconds until the next unfinished job is due, None if there are no unfinished jobs. """
+        with self._lock:
+            (next_attempt,) = self._db.execute(
+                "SELECT MIN(next_attempt) FROM jobs WHERE state NOT IN ('verified', 'failed') AND claimed = 0"
+            ).fetchone()
+        return None if next_attempt is None else max(0.0, next_attempt - time.time())
+
+    def counts(self) -> dict:
+        """ Number of jobs by state. """
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        return {state: dict(rows).get(state, 0) for state in JOB_STATES}
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,427 @@
+import io
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+from geoserver.metrics import get_endpoint
+
+# slot time in granule file names, e.g. src_20210709_0330_rgb.tif or 202107090330_RGB.tif
+_GRANULE_TIME_REGEX = re.compile(r'(\d{8})_?(\d{4})')
+
+
+class _Store:
+    """ Coveragestore of the mock with its granule index. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.coverage = False
+        self.granules = {}  # id -> (location, time, visible since)
+        self.next_id = 0
+
+    def add_granule(self, location: str, visible_at: float = 0.0, granule_time: Optional[str] = None) -> None:
+        match = _GRANULE_TIME_REGEX.search(os.path.basename(location))
+        if granule_time is None and match is not None:
+            granule_time = datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M').strftime(
+                '%Y-%m-%dT%H:%M:%SZ')
+        self.granules['{0}.{1}'.format(self.name, self.next_id)] = (location, granule_time, visible_at)
+        self.next_id += 1
+
+
+class MockGeoserver:
+    """
+    Local mock of GeoServer REST and GWC endpoints used by Geoserver and Publicator.
+
+    Attributes
+    ----------
+    latency : float
+        Seconds added to every response.
+    harvest_delay : float
+        Seconds after which harvested granules become visible in the granule index.
+    error_rate : float
+        Probability of answering a request with error_status instead of handling it.
+    error_status : int
+        Status code of injected errors.
+    seed : int
+        Seed of error injection.
+    host : str
+    port : int
+        0 picks a free port.
+
+    Notes
+    -----
+    The mock keeps workspaces, coveragestores, granule indexes and GWC layers in memory and counts requests
+    by method and endpoint, opened connections and received body bytes in stats(). Granule filters support
+    "time >= ...", "time < ...", "location IN (...)" and "location LIKE '...'" joined with AND.
+
+    with MockGeoserver(latency=0.005) as mock:
+        geo = Geoserver(service_url=mock.service_url)
+    """
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            harvest_delay: float = 0.0,
+            error_rate: float = 0.0,
+            error_status: int = 503,
+            seed: int = 0,
+            host: str = '127.0.0.1',
+            port: int = 0,
+    ):
+        self.latency = latency
+        self.harvest_delay = harvest_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._workspaces = {}  # name -> {store name: _Store}
+        self._gwc_layers = {}  # workspace:layer -> id
+        self._seed_tasks = []
+        self._requests = Counter()
+        self._connections = 0
+        self._bytes_received = 0
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def service_url(self) -> str:
+        return 'http://{0}:{1}/geoserver'.format(*self._server.server_address[:2])
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self) -> 'MockGeoserver':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-geoserver', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        """ Number of requests by (method, endpoint), their total, opened connections and received body bytes. """
+        with self._lock:
+            return {
+                'requests': dict(self._requests),
+                'requests_total': sum(self._requests.values()),
+                'connections': self._connections,
+                'bytes_received': self._bytes_received,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._connections = 0
+            self._bytes_received = 0
+
+    def seed_requests(self) -> list:
+        """ Bodies of GWC seed, reseed and truncate requests in order of arrival. """
+        with self._lock:
+            return list(self._seed_tasks)
+
+    def add_granules(
+            self,
+            workspace: str,
+            coveragestore_name: str,
+            count: int,
+            start: datetime = datetime(2021, 1, 1),
+            step: timedelta = timedelta(minutes=10),
+    ) -> None:
+        """ Create store with count synthetic granules, e.g. to measure index paging. """
+        with self._lock:
+            store = self._get_or_create_store(workspace, coveragestore_name)
+            store.coverage = True
+            for i in range(count):
+                slot = start + i * step
+                store.add_granule('/mock/{0}/{0}_{1}_rgb.tif'.format(coveragestore_name, slot.strftime('%Y%m%d_%H%M')))
+
+    def granule_count(self, workspace: str, coveragestore_name: str) -> int:
+        with self._lock:
+            store = self._workspaces.get(workspace, {}).get(coveragestore_name)
+            return 0 if store is None else len(store.granules)
+
+    def _get_or_create_store(self, workspace: str, coveragestore_name: str) -> _Store:
+        stores = self._workspaces.setdefault(workspace, {})
+        if coveragestore_name not in stores:
+            stores[coveragestore_name] = _Store(coveragestore_name)
+        return stores[coveragestore_name]
+
+    @staticmethod
+    def _match_filter(cql_filter: Optional[str], location: str, granule_time: Optional[str]) -> bool:
+        if not cql_filter:
+            return True
+        for condition in re.split(r'\s+AND\s+', cql_filter.strip(), flags=re.IGNORECASE):
+            match = re.match(r"(\w+)\s*(>=|<=|>|<|=|IN|LIKE)\s*(.+)$", condition.strip(), flags=re.IGNORECASE)
+            if match is None:
+                raise ValueError('unsupported filter: {}'.format(condition))
+            (attribute, operator, value) = match.groups()
+            operator = operator.upper()
+            if attribute == 'location' and operator == 'IN':
+                values = [v.replace("''", "'") for v in re.findall(r"'((?:[^']|'')*)'", value)]
+                if location not in values:
+                    return False
+            elif attribute == 'location' and operator == 'LIKE':
+                pattern = re.escape(value.strip().strip("'")).replace('%', '.*').replace('_', '.')
+                if re.fullmatch(pattern, location) is None:
+                    return False
+            elif attribute == 'time':
+                value = value.strip().strip("'")
+                if granule_time is None or not {
+                    '>=': granule_time >= value, '<=': granule_time <= value, '>': granule_time > value,
+                    '<': granule_time < value, '=': granule_time == value,
+                }[operator]:
+                    return False
+            else:
+                raise ValueError('unsupported filter: {}'.format(condition))
+        return True
+
+    @staticmethod
+    def _read_index(path: str):
+        """ (location, time) records of shapefile index .dbf written by PublicationUtils.write_shapefile_index. """
+        with open(path, 'rb') as f:
+            (count, header_size, record_size) = struct.unpack('<4xIHH', f.read(12))
+            f.seek(32)
+            fields = []
+            offset = 1  # deletion flag
+            for _ in range((header_size - 33) // 32):
+                (name, field_type, length) = struct.unpack('<11sc4xB15x', f.read(32))
+                fields.append((name.rstrip(b'\x00').decode(), field_type, offset, length))
+                offset += length
+            f.seek(header_size)
+            for _ in range(count):
+                record = f.read(record_size)
+                values = {}
+                for name, field_type, offset, length in fields:
+                    value = record[offset:offset + length]
+                    if field_type == b'@':
+                        (days, millis) = struct.unpack('>2i', value)
+                        values[name] = (datetime(1970, 1, 1) + timedelta(days=days - 2440588, milliseconds=millis)
+                                        ).strftime('%Y-%m-%dT%H:%M:%SZ')
+                    else:
+                        values[name] = value.decode('utf-8').strip()
+                yield values['location'], values.get('time')
+
+    def _harvest(self, store: _Store, path: str) -> bool:
+        path = unquote(path.strip())
+        if path.startswith('file://'):
+            path = path[len('file://'):]
+        visible_at = time.monotonic() + self.harvest_delay
+        index_path = os.path.join(path, store.name + '.dbf')
+        if os.path.isfile(index_path):  # mosaic dir with pre-built index
+            for location, granule_time in self._read_index(index_path):
+                store.add_granule(location, visible_at, granule_time=granule_time)
+            store.coverage = True
+            return True
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(('.tif', '.tiff')):
+                    store.add_granule(os.path.join(path, name), visible_at)
+            return True
+        if os.path.isfile(path) and path.lower().endswith(('.tif', '.tiff')):
+            store.add_granule(path, visible_at)
+            return True
+        return False
+
+    def _handle(self, method: str, path: str, query: dict, body: bytes):
+        """ Returns (status, content type, body) of response. """
+        path = path[len('/geoserver'):] if path.startswith('/geoserver') else path
+        path = re.sub(r'\.(json|xml)$', '', path)
+
+        if path in ('/rest/reset', '/rest/reload'):
+            return 200, 'text/plain', b''
+
+        if path == '/rest/workspaces':
+            if method == 'POST':
+                name = re.search(rb'<name>(.*?)</name>', body).group(1).decode()
+                self._workspaces.setdefault(name, {})
+                return 201, 'text/plain', name.encode()
+            workspaces = [{'name': name} for name in sorted(self._workspaces)]
+            return 200, 'application/json', {'workspaces': {'workspace': workspaces} if workspaces else ''}
+
+        match = re.fullmatch(r'/rest(?:/workspaces/([^/]+))?/layers', path)
+        if match is not None:
+            layers = [{'name': '{0}:{1}'.format(ws, name)} for ws, stores in sorted(self._workspaces.items())
+                      if match.group(1) in (None, ws) for name, store in stores.items() if store.coverage]
+            return 200, 'application/json', {'layers': {'layer': layers} if layers else ''}
+
+        match = re.fullmatch(r'/rest/workspaces/([^/]+)(?:/coveragestores(?:/([^/]+)(/.*)?)?)?', path)
+        if match is not None:
+            (workspace, store_name, rest) = match.groups()
+            stores = self._workspaces.get(workspace)
+            if store_name is None and '/coveragestores' not in path:
+                if stores is None:
+                    return 404, 'text/plain', b'No such workspace'
+                if method == 'DELETE':
+                    del self._workspaces[workspace]
+                return 200, 'application/json', {'workspace': {'name': workspace}}
+            if store_name is None:
+                if stores is None:
+                    return 404, 'text/plain', b'No such workspace'
+                names = [{'name': name} for name in sorted(stores)]
+                return 200, 'application/json', {'coverageStores': {'coverageStore': names} if names else ''}
+            return self._handle_store(method, workspace, store_name, rest or '', query, body)
+
+        match = re.fullmatch(r'/gwc/rest/layers/([^/]+)', path)
+        if match is not None:
+            layer = match.group(1)
+            if method in ('PUT', 'POST'):
+                sent_id = re.search(rb'<id>(.*?)</id>|"id": *"(.*?)"', body)
+                sent_id = sent_id and (sent_id.group(1) or sent_id.group(2)).decode()
+                if sent_id and layer in self._gwc_layers and sent_id != self._gwc_layers[layer]:
+                    return 400, 'text/plain', b'Layer id does not match'
+                self._gwc_layers[layer] = self._gwc_layers.get(layer, 'LayerInfoImpl--' + str(len(self._gwc_layers)))
+                return 200, 'text/plain', b''
+            if layer not in self._gwc_layers:
+                return 404, 'text/plain', b'Unknown layer'
+            return 200, 'application/xml', '<GeoServerLayer><id>{0}</id><name>{1}</name></GeoServerLayer>'.format(
+                self._gwc_layers[layer], escape(layer)).encode()
+
+        match = re.fullmatch(r'/gwc/rest/seed(?:/([^/]+))?', path)
+        if match is not None:
+            if method == 'POST':
+                self._seed_tasks.append(json.loads(body or b'{}'))
+                return 200, 'text/plain', b''
+            return 200, 'application/json', {'long-array-array': []}  # tasks finish at once
+
+        return 404, 'text/plain', b'Not found'
+
+    def _handle_store(self, method: str, workspace: str, store_name: str, rest: str, query: dict, body: bytes):
+        stores = self._workspaces.get(workspace, {})
+        store = stores.get(store_name)
+
+        if rest == '':
+            if store is None:
+                return 404, 'text/plain', b'No such coveragestore'
+            if method == 'DELETE':
+                del stores[store_name]
+            return 200, 'application/json', {'coverageStore': {'name': store_name}}
+
+        if rest.startswith('/file.'):
+            store = self._get_or_create_store(workspace, store_name)
+            store.coverage = query.get('configure', ['first'])[0] != 'none'
+            archive = zipfile.ZipFile(io.BytesIO(body))
+            for name in archive.namelist():
+                if name.lower().endswith(('.tif', '.tiff')):
+                    store.add_granule(os.path.join('/mock', workspace, store_name, name))
+            self._gwc_layers.setdefault('{0}:{1}'.format(workspace, store_name),
+                                        'LayerInfoImpl--' + str(len(self._gwc_layers)))
+            return 201, 'text/plain', b''
+
+        if rest.startswith('/external.'):
+            store = self._get_or_create_store(workspace, store_name)
+            if not self._harvest(store, body.decode()):
+                return 500, 'text/plain', b'Could not harvest'
+            if store.coverage:
+                self._gwc_layers.setdefault('{0}:{1}'.format(workspace, store_name),
+                                            'LayerInfoImpl--' + str(len(self._gwc_layers)))
+            return 202, 'text/plain', b''
+
+        if store is None:
+            return 404, 'text/plain', b'No such coveragestore'
+
+        match = re.fullmatch(r'/coverages/[^/]+(/index/granules(?:/([^/]+))?)?', rest)
+        if match is None:
+            return 404, 'text/plain', b'Not found'
+        (index, granule_id) = match.groups()
+
+        if index is None:
+            if method == 'PUT':
+                store.coverage = True
+                return 200, 'text/plain', b''
+            if not store.coverage:
+                return 404, 'text/plain', b'No such coverage'
+            return 200, 'application/json', {'coverage': {'name': store_name}}
+
+        if granule_id is not None:
+            if store.granules.pop(granule_id, None) is None:
+                return 404, 'text/plain', b'No such granule'
+            return 200, 'text/plain', b''
+
+        cql_filter = query.get('filter', [None])[0]
+        now = time.monotonic()
+        try:
+            matching = [(granule_id, location) for granule_id, (location, granule_time, visible_at)
+                        in store.granules.items()
+                        if visible_at <= now and self._match_filter(cql_filter, location, granule_time)]
+        except ValueError as e:
+            return 400, 'text/plain', str(e).encode()
+
+        if method == 'DELETE':
+            for granule_id, _ in matching:
+                del store.granules[granule_id]
+            return 200, 'text/plain', b''
+
+        offset = int(query.get('offset', [0])[0])
+        limit = query.get('limit', [None])[0]
+        page = matching[offset:offset + int(limit) if limit is not None else None]
+        return 200, 'application/json', {
+            'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'id': granule_id, 'properties': {'location': location}}
+                         for granule_id, location in page]
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock: MockGeoserver = None
+    protocol_version = 'HTTP/1.1'  # keep-alive like GeoServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.mock._lock:
+            self.mock._connections += 1
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _respond(self) -> None:
+        mock = self.mock
+        body = self._read_body()
+        url = urlparse(self.path)
+        with mock._lock:
+            mock._requests[(self.command, get_endpoint(self.path))] += 1
+            mock._bytes_received += len(body)
+            failed = mock.error_rate and mock._random.random() < mock.error_rate
+        if mock.latency:
+            time.sleep(mock.latency)
+        if failed:
+            (status, content_type, content) = (mock.error_status, 'text/plain', b'Injected error')
+        else:
+            with mock._lock:
+                (status, content_type, content) = mock._handle(self.command, url.path, parse_qs(url.query), body)
+        if isinstance(content, dict):
+            content = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
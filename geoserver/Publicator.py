@@ -1,4 +1,20 @@
-import time
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+from geoserver.Geoserver import Geoserver
+from geoserver.GranuleIndex import GranuleIndex
+from geoserver.IngestQueue import IngestJob, IngestQueue
+from geoserver.metrics import stage
+from geoserver.utils import PublicationUtils
 
 
 class ELECTRO_L_2_RGB_GEOSERVER_PUBLICATOR:
@@ -22,6 +38,10 @@ class ELECTRO_L_2_RGB_GEOSERVER_PUBLICATOR:
         """ Workflow method. """
         return self.publicator.workflow(args)
 
+    def batch_workflow(self, slots) -> dict:
+        """ Batch workflow method. """
+        return self.publicator.batch_workflow(slots)
+
 
 class AHI_L2_RGB_GEOSERVER_PUBLICATOR:
     """ Publishes HIMAWARI 8 disk GEO geotiff to geoserver. """
@@ -44,6 +64,10 @@ class AHI_L2_RGB_GEOSERVER_PUBLICATOR:
         """ Workflow method. """
         return self.publicator.workflow(args)
 
+    def batch_workflow(self, slots) -> dict:
+        """ Batch workflow method. """
+        return self.publicator.batch_workflow(slots)
+
 
 class ABI_L2_G17_RGB_GEOSERVER_PUBLICATOR:
     """ Publishes GEOS17 disk GEO geotiff to geoserver. """
@@ -66,6 +90,10 @@ class ABI_L2_G17_RGB_GEOSERVER_PUBLICATOR:
         """ Workflow method. """
         return self.publicator.workflow(args)
 
+    def batch_workflow(self, slots) -> dict:
+        """ Batch workflow method. """
+        return self.publicator.batch_workflow(slots)
+
 
 class ABI_L2_G16_RGB_GEOSERVER_PUBLICATOR:
     """ Publishes GEOS16 disk GEO geotiff to geoserver. """
@@ -88,18 +116,52 @@ class ABI_L2_G16_RGB_GEOSERVER_PUBLICATOR:
         """ Workflow method. """
         return self.publicator.workflow(args)
 
+    def batch_workflow(self, slots) -> dict:
+        """ Batch workflow method. """
+        return self.publicator.batch_workflow(slots)
+
+
+# prefix of dirs harvested as a whole in product tiff dir
+HARVEST_DIR_PREFIX = 'harvest_'
+
+# errors of the optimize stage: GDAL is missing, the source is not a tiff or GDAL failed
+OPTIMIZE_ERRORS = (ImportError, ValueError, RuntimeError)
+
+# products of satellite publicators, config sections with the same names
+PRODUCTS = (
+    'ELECTRO_L_2_RGB_GEOSERVER',
+    'AHI_L2_RGB_GEOSERVER',
+    'ABI_L2_G17_RGB_GEOSERVER',
+    'ABI_L2_G16_RGB_GEOSERVER',
+)
+
 
 class Publicator:
     """ Publishes geotiff to geoserver. """
 
-    def __init__(self, product: str):
-        """ Init publicator. """
+    def __init__(
+            self,
+            product: str,
+            config: Optional[dict] = None,
+            geoserver=None,
+            logger=None,
+            config_loader: Optional[Callable[[], dict]] = None,
+    ):
+        """
+        Init publicator, config and geoserver client can be shared by many publicators.
+
+        Notes:
+        -----
+        Without config, config_loader() is called, by default Publicator.load_config.
+        logger is a logging.Logger compatible object, e.g. WFLogger().plogger(product) of the host application,
+        by default logging.getLogger(product).
+        """
         self.product = product
         # init logger
-        wflogger = WFLogger().plogger(self.product)
-        self.logger = wflogger
+        self.logger = logger if logger is not None else logging.getLogger(self.product)
         # init configs
-        config = YConfig().config
+        if config is None:
+            config = (config_loader or Publicator.load_config)()
         self._config = config
         storage_config = config['storage_config']
         product_config = config[self.product]
@@ -120,13 +182,96 @@ class Publicator:
         self._geoserver_url = geoserver_config['service_url']
         self._geoserver_username = geoserver_config['username']
         self._geoserver_password = geoserver_config['password']
-        self.geoserver = Geoserver(
+        self._owns_geoserver = geoserver is None
+        self.geoserver = geoserver or Geoserver(
             service_url=self._geoserver_url,
             username=self._geoserver_username,
-            password=self._geoserver_password
+            password=self._geoserver_password,
+            **geoserver_config.get('session', {})  # pool_maxsize, timeout, retries, ...
         )
+        self.metrics = self.geoserver.metrics
         self.workspace_name = product_config['workspace']
         self.coveragestore_name = product_config['coveragestore']
+        self._publish_concurrency = product_config.get('publish_concurrency')
+        self._readiness_timeout = product_config.get('readiness_timeout', 60)
+        self._retention_days = product_config.get('retention_days')
+        self._staging = product_config.get('staging', 'copy')  # copy, hardlink, reflink, symlink or rename
+        self._stream_init_zip = product_config.get('stream_init_zip', False)
+        # batches with at least bulk_harvest_threshold missing slots are harvested as one folder, 0 disables
+        self._bulk_harvest_threshold = product_config.get('bulk_harvest_threshold', 0)
+        # dir of locally built mosaic index, see bootstrap
+        self._DIR_MOSAIC = product_config.get('mosaic_dir_name', 'mosaic')
+        self._gwc_layer_config = product_config.get('gwc_layer', {})
+        # seed_layer arguments (zoom_start, zoom_stop, bbox, gridset, threads, ...), wait and truncate_on_prune flags
+        self._seed_config = dict(product_config.get('seed', {}))
+        self._seed_wait = self._seed_config.pop('wait', False)
+        self._truncate_on_prune = self._seed_config.pop('truncate_on_prune', False)
+        # published slots are seeded if seed arguments are given or on_publish is set
+        self._seed_on_publish = self._seed_config.pop('on_publish', bool(self._seed_config))
+        self._time_attribute = product_config.get('time_attribute', 'time')
+        # source tiff headers are checked before publication, expected_header maps GeoTiffHeader fields to values
+        self._validate = product_config.get('validate', False)
+        self._expected_header = product_config.get('expected_header', {})
+        # local granule index, optionally persisted to sqlite file
+        self.granule_index = GranuleIndex(
+            self.geoserver,
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            path=product_config.get('granule_index_path'),
+            time_attribute=self._time_attribute,
+            max_age=product_config.get('granule_index_max_age', 60)
+        )
+        # optional conversion to tiled GeoTIFF with overviews before staging, needs GDAL
+        # (block_size, compression, overview_levels, resampling and processes of the pool)
+        self._optimize_config = dict(product_config.get('optimize', {}))
+        self._optimize_processes = self._optimize_config.pop('processes', None)
+        self._optimize_executor = None
+        self._optimize_lock = threading.Lock()
+        # ingest queue (path, max_attempts, backoff, workers), opened on first use
+        self._ingest_queue_config = dict(product_config.get('ingest_queue', {}))
+        self._ingest_queue = None
+        self._product_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """ Release geoserver connections, shared client is closed by its owner. """
+        if self._ingest_queue is not None:
+            self._ingest_queue.close()
+        if self._optimize_executor is not None:
+            self._optimize_executor.shutdown()
+        self.granule_index.close()
+        if self._owns_geoserver:
+            self.geoserver.close()
+
+    @staticmethod
+    def load_config(path: Optional[str] = None) -> dict:
+        """
+        Load configs of storage, geoserver and all products.
+
+        Notes:
+        -----
+        Reads the JSON file at path, by default the config of the host application YConfig().config.
+        """
+        if path is not None:
+            with open(path) as file:
+                return json.load(file)
+        return YConfig().config
+
+    @property
+    def ingest_queue(self) -> IngestQueue:
+        """ Persistent queue of slots, by default stored next to the product dir. """
+        if self._ingest_queue is None:
+            config = dict(self._ingest_queue_config)
+            config.pop('workers', None)
+            path = config.pop('path', None) or PublicationUtils.create_filename(
+                (self._DIR_SAT, self._DIR_SAT_PUBLIC, self.product + '_ingest_queue.sqlite'))
+            self._ingest_queue = IngestQueue(path, **config)
+        return self._ingest_queue
 
     def _create_source_file_name(self, args) -> str:
         (_, year, month, day, dtime) = args
@@ -135,6 +280,38 @@ class Publicator:
                '_' + dtime + \
                '_' + self._source_file_sample + self._file_extension
 
+    def _create_slot_datetime(self, args) -> datetime:
+        (_, year, month, day, dtime) = args
+        return datetime.strptime(year + month + day + dtime, '%Y%m%d%H%M')
+
+    def _create_slot_time(self, args) -> str:
+        """ Slot time in ISO 8601, e.g. 2021-08-02T03:30:00Z. """
+        return self._create_slot_datetime(args).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _parse_slot_time_from_file_name(self, file_name: str) -> Optional[datetime]:
+        """ Slot time of file created by _create_source_file_name, None for other files. """
+        pattern = re.escape(self._DIR_SOURCE) + r'_(\d{8})_(\d{4})_' + \
+                  re.escape(self._source_file_sample + self._file_extension) + '$'
+        match = re.match(pattern, file_name)
+        if match is None:
+            return None
+        return datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M')
+
+    @property
+    def source_dir(self) -> str:
+        """ Source tree of the product, slots are stored in YYYY/MM/DD/HHMM subdirs. """
+        return PublicationUtils.create_filename((self._DIR_SAT, self._DIR_SAT_RGB, self._DIR_SOURCE))
+
+    def parse_slot_from_path(self, path: str) -> Optional[tuple]:
+        """ Workflow args of file path created by _create_source_file_path, None for other files. """
+        slot_time = self._parse_slot_time_from_file_name(os.path.basename(path))
+        if slot_time is None:
+            return None
+        args = self.create_slots(self.product, slot_time, slot_time)[0]
+        if os.path.normpath(path) != os.path.normpath(self._create_source_file_path(args)):
+            return None
+        return args
+
     def _create_source_file_path(self, args) -> str:
         (_, year, month, day, dtime) = args
         # build file path
@@ -153,6 +330,7 @@ class Publicator:
         )
         return full_path_source_filename
 
+    @stage('check_source')
     def _check_source_file_existence(self, args) -> bool:
         source_file_path = self._create_source_file_path(args)
         status = PublicationUtils.check_path_existence(source_file_path)
@@ -162,19 +340,29 @@ class Publicator:
             self.logger.error(f'File {source_file_path} exists: {status}')
         return status
 
+    @stage('validate')
+    def _validate_source_file(self, args) -> bool:
+        """ Check tiff header of source file, so corrupt or unexpected files are rejected before harvest. """
+        if not self._validate:
+            return True
+        (_, error) = PublicationUtils.check_geotiff(self._create_source_file_path(args), self._expected_header)
+        if error is not None:
+            self.logger.error(f'invalid source file: {error}')
+        return error is None
+
     def _check_product_existence_in_filesystem(self, args) -> bool:
         product_name = args[0]
         # build file path
         local_product_dir = PublicationUtils.create_filename((self._DIR_SAT, self._DIR_SAT_PUBLIC, product_name))
         return PublicationUtils.check_path_existence(local_product_dir)
 
+    @stage('create_product')
     def _create_product_in_filesystem(self, args) -> None:
         """ Create product. """
         # create dir and file names
         product_name = args[0]  # ELECTRO_L_2_RGB_GEOSERVER
         local_product_dir = PublicationUtils.create_filename((self._DIR_SAT, self._DIR_SAT_PUBLIC, product_name))
         local_source_file_name = self._create_source_file_name(args)
-        local_source_file_path = self._create_source_file_path(args)
         init_dir_name = PublicationUtils.create_filename((local_product_dir, self._DIR_INIT))
         base_dir_name = PublicationUtils.create_filename((self._DIR_SAT, self._DIR_SAT_PUBLIC, self._DIR_BASE))
         base_init_dir_name = PublicationUtils.create_filename((base_dir_name, self._DIR_INIT))
@@ -184,75 +372,116 @@ class Publicator:
         PublicationUtils.make_dir(local_product_dir)
         PublicationUtils.make_dir(tif_storage_dir_name)
 
-        # copy files
-        PublicationUtils.copy_dir_recursively(base_init_dir_name, init_dir_name)
-        PublicationUtils.copy_file(
-            local_source_file_path,
-            PublicationUtils.create_filename((init_dir_name, local_source_file_name))
-        )
-        PublicationUtils.zip_dir(init_dir_name)
+        # copy files, source file is kept for tiff dir
+        init_staging = 'copy' if self._staging == 'rename' else self._staging
+        PublicationUtils.copy_dir_recursively(base_init_dir_name, init_dir_name, strategy=init_staging)
+        self._stage_source_files([args], init_dir_name, strategy=init_staging)
+        if not self._stream_init_zip:  # otherwise zip is built while uploading
+            # reuse cached archive of base init dir and append only the sample file
+            PublicationUtils.zip_dir_from_base(
+                base_init_dir_name,
+                init_dir_name + self._zip_extension,
+                (PublicationUtils.create_filename((init_dir_name, local_source_file_name)),)
+            )
         self.logger.info(f'product {product_name} created in file system')
 
+    @stage('check_workspace')
     def _check_workspace_existence_in_geoserver(self, args) -> None:
         # Check workspace
-        workspace_names = [self.geoserver.get_workspaces()[i]['name']
-                           for i in range(len(self.geoserver.get_workspaces()))]
+        workspace_names = [workspace['name'] for workspace in self.geoserver.get_workspaces()]
         if self.workspace_name not in workspace_names:
             self.geoserver.create_workspace(self.workspace_name)
-            self.logger.info(f'{self.workspace_name} created')
+            ready = self.geoserver.wait_for_workspace(self.workspace_name, timeout=self._readiness_timeout)
+            self.logger.info(f'{self.workspace_name} created, ready: {ready}')
             return
         self.logger.info(f'{self.workspace_name} already created')
         return
 
+    @stage('check_coveragestore')
     def _check_product_existence_in_geoserver(self, args) -> None:
         """ Check coveragestore existence in geoserver. """
         product_name = args[0]
 
         # Check coveragestore in workspace
-        coveragesotre_names = [self.geoserver.get_coveragestores(workspace=self.workspace_name)[i]['name']
-                               for i in range(len(self.geoserver.get_coveragestores(workspace=self.workspace_name)))]
+        coveragesotre_names = [coveragestore['name']
+                               for coveragestore in self.geoserver.get_coveragestores(workspace=self.workspace_name)]
         # todo: string indices must be integers -> workspace is empty!
         if self.coveragestore_name not in coveragesotre_names:
-            path = PublicationUtils.create_filename(
+            init_dir_name = PublicationUtils.create_filename(
                 (
                     self._DIR_SAT,
                     self._DIR_SAT_PUBLIC,
                     product_name,
-                    self._DIR_INIT + self._zip_extension
+                    self._DIR_INIT
                 )
             )
 
             self.geoserver.create_coveragestore(
-                path=path,
+                path=init_dir_name + self._zip_extension,
                 workspace=self.workspace_name,
-                coveragestore_name=self.coveragestore_name
+                coveragestore_name=self.coveragestore_name,
+                data=PublicationUtils.iter_zip_dir(init_dir_name) if self._stream_init_zip else None
             )
-            self.logger.info(f'empty coveragestore {self.coveragestore_name} created')
-
-            self.geoserver.publish_time_dimension_to_coveragestore(
+            ready = self.geoserver.wait_for_coverage(
                 workspace=self.workspace_name,
-                coveragestore_name=self.coveragestore_name
+                coveragestore_name=self.coveragestore_name,
+                timeout=self._readiness_timeout
             )
-            self.logger.info(f'add time dimension to coveragestore {self.coveragestore_name}')
-
-            self.geoserver.publish_timecahe_file_to_coveragestore(
-                workspace=self.workspace_name,
-                coveragestore_name=self.coveragestore_name
-            )
-            self.logger.info(f'add timecache file to coveragestore {self.coveragestore_name}')
-
+            self.logger.info(f'empty coveragestore {self.coveragestore_name} created, ready: {ready}')
+            self._configure_coverage()
             return
 
         self.logger.info(f'coveragestore {self.coveragestore_name} store already exists')
         return
 
-    def _check_file_existence_in_product(self, args) -> bool:
-        product, year, month, day, dtime = args
-        granules = [i.split('/')[-1] for i in self.geoserver.get_granules_from_coveragestore(
+    def _configure_coverage(self) -> None:
+        """ Add time dimension and GWC layer with time cache to created coveragestore. """
+        self.geoserver.publish_time_dimension_to_coveragestore(
             workspace=self.workspace_name,
             coveragestore_name=self.coveragestore_name
-        ).values()]
-        return self._create_source_file_name(args) in granules
+        )
+        self.logger.info(f'add time dimension to coveragestore {self.coveragestore_name}')
+
+        self.geoserver.wait_for_gwc_layer(
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            timeout=self._readiness_timeout
+        )
+
+        self.geoserver.publish_timecahe_file_to_coveragestore(
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            **self._gwc_layer_config  # blob, mime_formats, gridsets, metatile, regex_filters
+        )
+        self.logger.info(f'add timecache file to coveragestore {self.coveragestore_name}')
+
+    @stage('check_granule')
+    def _check_file_existence_in_product(self, args) -> bool:
+        """ Check granula existence in local granule index. """
+        slot_time = self._create_slot_time(args)
+        return self.granule_index.contains(self._create_source_file_name(args), since=slot_time)
+
+    @stage('verify')
+    def _wait_for_files_in_product(self, slots) -> bool:
+        """
+        Poll granule index until all slots are harvested or readiness timeout passes.
+
+        Notes:
+        -----
+        Names are added to the index only by sync (delta queries of GeoServer's granule index), not by the
+        status of publish requests, because GeoServer may accept a request and harvest the granule later or not at all.
+        """
+
+        since = min(self._create_slot_time(args) for args in slots)
+        names = [self._create_source_file_name(args) for args in slots]
+
+        def check():
+            if all(name in self.granule_index for name in names):
+                return True
+            self.granule_index.sync(since=since)
+            return all(name in self.granule_index for name in names)
+
+        return self.geoserver.wait_for(check, timeout=self._readiness_timeout)
 
     def _create_tif_file_path(self, args) -> str:
         product_name = args[0]  # ELECTRO_L_2_RGB_GEOSERVER
@@ -262,24 +491,149 @@ class Publicator:
         tiff_dir_name = PublicationUtils.create_filename((local_product_dir, self._DIR_TIFF))
         return PublicationUtils.create_filename((tiff_dir_name, local_source_file_name))
 
+    def _get_tiff_dir_name(self) -> str:
+        return PublicationUtils.create_filename((self._DIR_SAT, self._DIR_SAT_PUBLIC, self.product, self._DIR_TIFF))
+
+    def _iter_tiff_files(self) -> Iterator[os.DirEntry]:
+        """ Granule files of product tiff dir and of its harvest batch dirs. """
+        tiff_dir_name = self._get_tiff_dir_name()
+        if not PublicationUtils.check_path_existence(tiff_dir_name):
+            return
+        with os.scandir(tiff_dir_name) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name.startswith(HARVEST_DIR_PREFIX):
+                    with os.scandir(entry.path) as batch_entries:
+                        for batch_entry in batch_entries:
+                            if self._parse_slot_time_from_file_name(batch_entry.name) is not None:
+                                yield batch_entry
+                elif entry.is_file() and self._parse_slot_time_from_file_name(entry.name) is not None:
+                    yield entry
+
+    def _get_optimize_executor(self) -> ProcessPoolExecutor:
+        """ Process pool of optimize stage, created on first use and shut down by close. """
+        with self._optimize_lock:
+            if self._optimize_executor is None:
+                # spawned workers, forking a process with running queue and watcher threads is not safe
+                self._optimize_executor = ProcessPoolExecutor(
+                    max_workers=self._optimize_processes,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._optimize_executor
+
+    @stage('optimize')
+    def _optimize_source_files(self, source_paths: list, target_paths: list) -> list:
+        """ Write tiled and overviewed copies of source files, False for files which are already optimized. """
+        optimize = functools.partial(PublicationUtils.optimize_geotiff, **self._optimize_config)
+        return list(self._get_optimize_executor().map(optimize, source_paths, target_paths))
+
+    @stage('stage_file')
+    def _stage_source_files(self, slots, dir_name: Optional[str] = None, strategy: Optional[str] = None) -> None:
+        """ Stage source files of slots into dir (product tiff dir by default), optimized if configured. """
+        dir_name = dir_name or self._get_tiff_dir_name()
+        strategy = strategy or self._staging
+        source_paths = [self._create_source_file_path(args) for args in slots]
+        target_paths = [PublicationUtils.create_filename((dir_name, self._create_source_file_name(args)))
+                        for args in slots]
+        optimized = [False] * len(slots)
+        if self._optimize_config:
+            optimized = self._optimize_source_files(source_paths, target_paths)
+        for source_path, target_path, done in zip(source_paths, target_paths, optimized):
+            if not done:
+                PublicationUtils.stage_file(source_path, target_path, strategy=strategy)
+            elif strategy == 'rename':  # optimized copy replaces the moved file
+                os.remove(source_path)
+
     def _move_file_to_product_dir(self, args) -> None:
         """ Move .tif file to tiff project directory. """
-        local_source_file_path = self._create_source_file_path(args)
-        tif_filename = self._create_tif_file_path(args)
-        PublicationUtils.copy_file(
-            local_source_file_path,
-            tif_filename
-        )
+        self._stage_source_files([args])
 
-    def _publish_file_to_coveragestore(self, args) -> None:
-        """ Publish .tif granula to coveragestore. """
+    @stage('publish')
+    def _publish_file_to_coveragestore(self, args) -> Optional[str]:
+        """ Publish .tif granula to coveragestore, the granule is indexed once a sync of the granule index sees it. """
         tif_filename = self._create_tif_file_path(args)
-        self.geoserver.publish_file_to_coveragestore(
+        result = self.geoserver.publish_file_to_coveragestore(
             path=tif_filename,
             workspace=self.workspace_name,
             coveragestore_name=self.coveragestore_name
         )
+        if result is None or not result.startswith('Published'):
+            self.logger.error(f'{self._create_source_file_name(args)} publication error: {result}')
+        return result
+
+    @stage('publish')
+    def _publish_files_to_coveragestore(self, slots) -> None:
+        """ Publish .tif granules of many slots concurrently. """
+        results = self.geoserver.publish_files_to_coveragestore(
+            (self._create_tif_file_path(args) for args in slots),
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            max_workers=self._publish_concurrency
+        )
+        for args, result in zip(slots, results):
+            if result is None or not result.startswith('Published'):
+                self.logger.error(f'{self._create_source_file_name(args)} publication error: {result}')
+
+    @stage('harvest')
+    def _harvest_files_to_coveragestore(self, slots) -> str:
+        """
+        Stage files of many slots into a new harvest dir and harvest the whole dir with one request.
+
+        Notes:
+        -----
+        Harvest dirs are kept in product tiff dir as harvest_<UTC time> because the mosaic index refers
+        to granule files by location.
+        """
+
+        harvest_dir_name = PublicationUtils.create_filename(
+            (self._get_tiff_dir_name(), HARVEST_DIR_PREFIX + datetime.utcnow().strftime('%Y%m%d%H%M%S%f')))
+        PublicationUtils.make_dir(harvest_dir_name)
+        self._stage_source_files(slots, harvest_dir_name)
+
+        result = self.geoserver.publish_file_to_coveragestore(
+            path=harvest_dir_name,
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            content_type='text/plain'
+        )
+        if result is None or not result.startswith('Published'):
+            self.logger.error(f'{harvest_dir_name} harvest error: {result}')
+        else:
+            self.logger.info(f'{len(slots)} files harvested from {harvest_dir_name}')
+        return result
+
+    def _create_time_parameter(self, slot_time: datetime) -> str:
+        """ TIME parameter value matching GWC regex filter, e.g. 2021-08-02T03:30:00.000Z. """
+        return slot_time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+    @stage('seed')
+    def _seed_slot_times(self, slot_times, seed_type: str = 'seed') -> None:
+        """
+        Warm (or truncate) GWC tiles for TIME values of slots, if seeding (or truncate_on_prune) is configured.
+
+        Notes:
+        -----
+        Every TIME value is a GWC task, tasks are started when seeding threads of GeoServer are free,
+        see Geoserver.seed_layer.
+        """
+
+        enabled = self._truncate_on_prune if seed_type == 'truncate' else self._seed_on_publish
+        if not enabled or not slot_times:
+            return
+        for slot_time in sorted(set(slot_times)):
+            time_value = self._create_time_parameter(slot_time)
+            result = self.geoserver.seed_layer(
+                workspace=self.workspace_name,
+                layer_name=self.coveragestore_name,
+                seed_type=seed_type,
+                time_value=time_value,
+                **self._seed_config
+            )
+            self.logger.info(f'{seed_type} {time_value}: {result}')
+        if self._seed_wait and seed_type != 'truncate':
+            done = self.geoserver.wait_for_seed(self.workspace_name, self.coveragestore_name)
+            self.logger.info(f'seeding of {len(slot_times)} slots finished: {done}')
 
+    @stage('workflow')
     def workflow(self, args) -> str:
         """ Check if there are files in local dir then load by args. """
         product, year, month, day, dtime = args
@@ -290,30 +644,449 @@ class Publicator:
         if not self._check_source_file_existence(args):
             return 'source file existence error'
 
+        if not self._validate_source_file(args):
+            return 'invalid source file'
+
         if not self._check_product_existence_in_filesystem(args):
             self.logger.info(f'product {product} not exists in filesystem')
 
-            self._create_product_in_filesystem(args)
-            time.sleep(2)
+            try:
+                self._create_product_in_filesystem(args)
+            except OPTIMIZE_ERRORS as error:
+                self.logger.error(f'{tif_filename} optimize error: {error}')
+                return 'optimize error'
             self._check_workspace_existence_in_geoserver(args)
-            time.sleep(2)
             self._check_product_existence_in_geoserver(args)
 
             self.logger.info(f'product {product} finally created')
-            self.logger.info(f'{tif_filename} file in product: {self._check_file_existence_in_product(args)}')
-            return 'done' if self._check_file_existence_in_product(args) else 'initial file creation error'
-        elif self._check_product_existence_in_filesystem(args) and not self._check_file_existence_in_product(args):
+            exists = self._wait_for_files_in_product([args])
+            self.logger.info(f'{tif_filename} file in product: {exists}')
+            if exists:
+                self._seed_slot_times([self._create_slot_datetime(args)])
+            return 'done' if exists else 'initial file creation error'
+        elif not self._check_file_existence_in_product(args):
             self.logger.info(f'product {product} exists in filesystem')
             self.logger.info(f'file {tif_filename} does not exists in product dir')
 
-            self._move_file_to_product_dir(args)
+            try:
+                self._move_file_to_product_dir(args)
+            except OPTIMIZE_ERRORS as error:
+                self.logger.error(f'{tif_filename} optimize error: {error}')
+                return 'optimize error'
             self.logger.info(f'file {tif_filename} moved to product tiff dir')
 
-            time.sleep(5)
             self._publish_file_to_coveragestore(args)
-            self.logger.info(
-                f'new {tif_filename} file published to product: {self._check_file_existence_in_product(args)}')
-            return 'done' if self._check_file_existence_in_product(args) else 'file creation error'
+            exists = self._wait_for_files_in_product([args])
+            if exists:
+                self._seed_slot_times([self._create_slot_datetime(args)])
+            self.logger.info(f'new {tif_filename} file published to product: {exists}')
+            return 'done' if exists else 'file creation error'
 
-        self.logger.info(f'{tif_filename} file already in product: {self._check_file_existence_in_product(args)}')
+        self.logger.info(f'{tif_filename} file already in product: True')
         return 'done'
+
+    def _ensure_product(self, args) -> bool:
+        """ Create product in filesystem and geoserver if needed, returns True if the product was created. """
+        with self._product_lock:
+            created = False
+            if not self._check_product_existence_in_filesystem(args):
+                self.logger.info(f'product {args[0]} not exists in filesystem')
+                self._create_product_in_filesystem(args)
+                created = True
+            self._check_workspace_existence_in_geoserver(args)
+            self._check_product_existence_in_geoserver(args)
+            return created
+
+    @staticmethod
+    def create_slots(product: str, start: datetime, end: datetime, step: timedelta = timedelta(minutes=10)) -> list:
+        """ Create workflow args for every slot from start to end inclusive. """
+        slots = []
+        slot = start
+        while slot <= end:
+            slots.append((product, slot.strftime('%Y'), slot.strftime('%m'), slot.strftime('%d'), slot.strftime('%H%M')))
+            slot += step
+        return slots
+
+    @stage('batch_workflow')
+    def batch_workflow(self, slots, bulk_harvest: Optional[bool] = None) -> dict:
+        """
+        Publish many slots in one run, returns result of workflow for every slot.
+
+        Notes:
+        -----
+        Catalog state is checked once, requested files are compared with the granule index once and only
+        missing files are staged and published. Slots can be made with create_slots, e.g.
+        publicator.batch_workflow(Publicator.create_slots('AHI_L2_RGB_GEOSERVER', start, end)).
+        With bulk_harvest missing files are harvested as one folder instead of one request per file, by default
+        when there are at least bulk_harvest_threshold of product config missing files.
+        """
+
+        results = {}
+        available = []
+        for args in slots:
+            if not self._check_source_file_existence(args):
+                results[args] = 'source file existence error'
+            elif not self._validate_source_file(args):
+                results[args] = 'invalid source file'
+            else:
+                available.append(args)
+
+        if not available:
+            return results
+
+        product = available[0][0]
+        self._ensure_product(available[0])
+
+        # one delta query from the earliest slot instead of one query per slot
+        since = min(self._create_slot_time(args) for args in available)
+        self.granule_index.sync(since=since)
+
+        missing = []
+        for args in available:
+            if self._create_source_file_name(args) in self.granule_index:
+                results[args] = 'done'
+            else:
+                missing.append(args)
+        self.logger.info(f'{len(missing)} of {len(available)} files are missing in product {product}')
+
+        if bulk_harvest is None:
+            bulk_harvest = 0 < self._bulk_harvest_threshold <= len(missing)
+
+        if missing:
+            try:
+                if bulk_harvest:
+                    self._harvest_files_to_coveragestore(missing)
+                else:
+                    self._stage_source_files(missing)
+                    self._publish_files_to_coveragestore(missing)
+            except OPTIMIZE_ERRORS as error:  # files are optimized before any of them is staged
+                self.logger.error(f'{len(missing)} files optimize error: {error}')
+                results.update((args, 'optimize error') for args in missing)
+                return {args: results[args] for args in slots}
+
+            self._wait_for_files_in_product(missing)
+            for args in missing:
+                exists = self._create_source_file_name(args) in self.granule_index
+                results[args] = 'done' if exists else 'file creation error'
+
+            self._seed_slot_times([self._create_slot_datetime(args) for args in missing if results[args] == 'done'])
+
+        self.logger.info(f'{sum(r == "done" for r in results.values())} of {len(results)} slots done')
+        return {args: results[args] for args in slots}
+
+    def enqueue(self, slots) -> int:
+        """ Add slots to the ingest queue, returns number of new slots (queued granules are skipped). """
+        added = sum(self.ingest_queue.put(args, self._create_source_file_name(args)) for args in slots)
+        self.logger.info(f'{added} of {len(slots)} slots queued')
+        return added
+
+    @stage('queue_job')
+    def _process_job(self, job: IngestJob) -> str:
+        """
+        Move job forward from its recorded state, returns the new state.
+
+        Notes:
+        -----
+        pending -> staged: source file is copied to product tiff dir (skipped if granule is already indexed),
+        staged -> published: granule is published, published -> verified: granule is found in the index.
+        A granule that is not harvested goes back to staged, so it is published again on retry.
+        A pending job whose file is already in product tiff dir is staged: staging renames or writes the file
+        atomically, but the process can stop before the state is recorded, e.g. after rename staging moved
+        the source file away.
+        """
+
+        queue = self.ingest_queue
+        args, state = job.args, job.state
+        try:
+            if state == 'pending' and PublicationUtils.check_path_existence(self._create_tif_file_path(args)):
+                state = 'staged'
+                queue.set_state(job.granule, state)
+
+            if state == 'pending':
+                if not self._check_source_file_existence(args):
+                    return queue.fail(job.granule, 'source file existence error')
+                if not self._validate_source_file(args):
+                    return queue.fail(job.granule, 'invalid source file', state='failed')
+                if self._ensure_product(args):
+                    state = 'published'  # source file is the initial granule of the new product
+                elif self._check_file_existence_in_product(args):
+                    state = 'published'
+                else:
+                    self._move_file_to_product_dir(args)
+                    state = 'staged'
+                queue.set_state(job.granule, state)
+
+            if state == 'staged':
+                if not self._check_file_existence_in_product(args):
+                    self._publish_file_to_coveragestore(args)
+                state = 'published'
+                queue.set_state(job.granule, state)
+
+            if not self._wait_for_files_in_product([args]):
+                return queue.fail(job.granule, 'file creation error', state='staged')
+            queue.set_state(job.granule, 'verified')
+        except Exception as error:
+            self.logger.error(f'{job.granule} {state} error: {error}')
+            return queue.fail(job.granule, str(error))
+
+        self.logger.info(f'{job.granule} verified')
+        self._seed_slot_times([self._create_slot_datetime(args)])
+        return 'verified'
+
+    def run_queue(self, workers: Optional[int] = None, poll_interval: float = 5.0,
+                  stop_when_empty: bool = True, stop: Optional[threading.Event] = None) -> dict:
+        """
+        Drain the ingest queue with workers threads, returns number of jobs by state.
+
+        Notes:
+        -----
+        Jobs waiting for a retry are awaited, with stop_when_empty=False the loop also waits for new slots
+        until stop is set.
+        """
+
+        if workers is None:
+            workers = self._ingest_queue_config.get('workers', 1)
+        queue = self.ingest_queue
+
+        def worker():
+            while True:
+                jobs = queue.claim()
+                if not jobs:
+                    return
+                self._process_job(jobs[0])
+
+        stop = stop or threading.Event()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while not stop.is_set():
+                for future in [executor.submit(worker) for _ in range(workers)]:
+                    future.result()
+                wait = queue.next_attempt_in()
+                if wait is None and stop_when_empty:
+                    break
+                stop.wait(poll_interval if wait is None else min(wait, poll_interval))
+
+        counts = queue.counts()
+        self.logger.info(f'ingest queue drained: {counts}')
+        return counts
+
+    def _write_mosaic_dir(self, mosaic_dir_name: str, granules: list, resolution: tuple, epsg: Optional[int]) -> None:
+        """ Write ImageMosaic config and shapefile index of granules (location, bbox, time) to mosaic dir. """
+        base_init_dir_name = PublicationUtils.create_filename(
+            (self._DIR_SAT, self._DIR_SAT_PUBLIC, self._DIR_BASE, self._DIR_INIT))
+        PublicationUtils.make_dir(mosaic_dir_name)
+        for file_name in ('indexer.properties', 'timeregex.properties'):
+            file_path = PublicationUtils.create_filename((base_init_dir_name, file_name))
+            if PublicationUtils.check_path_existence(file_path):
+                PublicationUtils.stage_file(file_path, PublicationUtils.create_filename((mosaic_dir_name, file_name)),
+                                            strategy='copy')
+
+        # the same settings GeoServer writes when it harvests the first granule
+        PublicationUtils.write_properties(
+            PublicationUtils.create_filename((mosaic_dir_name, self.coveragestore_name + '.properties')),
+            {
+                'Levels': '{0},{1}'.format(*resolution),
+                'LevelsNum': 1,
+                'Heterogeneous': 'false',
+                'AbsolutePath': 'true',
+                'Name': self.coveragestore_name,
+                'TypeName': self.coveragestore_name,
+                'Caching': 'false',
+                'ExpandToRGB': 'false',
+                'LocationAttribute': 'location',
+                'TimeAttribute': self._time_attribute,
+                'SuggestedSPI': 'it.geosolutions.imageioimpl.plugins.tiff.TIFFImageReaderSpi',
+                'CheckAuxiliaryMetadata': 'false',
+            }
+        )
+        PublicationUtils.write_shapefile_index(
+            PublicationUtils.create_filename((mosaic_dir_name, self.coveragestore_name)),
+            granules,
+            epsg=epsg
+        )
+
+    @stage('bootstrap')
+    def bootstrap(self, slots=(), processes: Optional[int] = None) -> dict:
+        """
+        Create coveragestore with all granules of product tiff dir in one request.
+
+        Notes:
+        -----
+        Files of slots are staged into tiff dir first. Headers of all tiff files are read in a process pool,
+        the mosaic index (location, footprint, time) is written to product mosaic dir next to indexer.properties
+        and timeregex.properties of base init dir, then GeoServer configures the store from that dir instead of
+        harvesting granules one by one. Files rejected by PublicationUtils.check_geotiff are skipped and reported.
+        Raises ValueError if the coveragestore already exists, use batch_workflow to add granules to it.
+        """
+
+        self._check_workspace_existence_in_geoserver((self.product,))
+        coveragestore_names = [coveragestore['name']
+                               for coveragestore in self.geoserver.get_coveragestores(workspace=self.workspace_name)]
+        if self.coveragestore_name in coveragestore_names:
+            raise ValueError('coveragestore {} already exists'.format(self.coveragestore_name))
+
+        PublicationUtils.make_dir(self._get_tiff_dir_name())
+        for args in slots:
+            if not PublicationUtils.check_path_existence(self._create_tif_file_path(args)) \
+                    and self._check_source_file_existence(args):
+                self._move_file_to_product_dir(args)
+
+        paths = sorted(entry.path for entry in self._iter_tiff_files())
+        # spawned workers like the optimize pool, bootstrap may run next to queue and watcher threads
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            check = functools.partial(PublicationUtils.check_geotiff, expected=self._expected_header)
+            checks = list(executor.map(check, paths, chunksize=max(1, len(paths) // 64)))
+
+        granules = []
+        skipped = []
+        for path, (header, error) in zip(paths, checks):
+            if header is None:
+                skipped.append(path)
+                self.logger.error(f'{error}, skipped')
+                continue
+            slot_time = self._parse_slot_time_from_file_name(os.path.basename(path))
+            granules.append((os.path.abspath(path), header.bbox, slot_time))
+        if not granules:
+            return {'granules': 0, 'skipped': skipped, 'result': 'no granules to index'}
+
+        # granules of a product share grid, resolution and CRS of the first one
+        first = next(header for header, _ in checks if header is not None)
+        mosaic_dir_name = PublicationUtils.create_filename(
+            (self._DIR_SAT, self._DIR_SAT_PUBLIC, self.product, self._DIR_MOSAIC))
+        self._write_mosaic_dir(mosaic_dir_name, granules, first.resolution, first.epsg)
+        self.logger.info(f'mosaic index of {len(granules)} granules written to {mosaic_dir_name}')
+
+        result = self.geoserver.create_coveragestore_from_directory(
+            path=mosaic_dir_name,
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name
+        )
+        ready = self.geoserver.wait_for_coverage(
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            timeout=self._readiness_timeout
+        )
+        self.logger.info(f'coveragestore {self.coveragestore_name} created from index: {result}, ready: {ready}')
+        if ready:
+            self._configure_coverage()
+        self.granule_index.clear()
+        return {'granules': len(granules), 'skipped': skipped, 'result': result}
+
+    @stage('reconcile')
+    def reconcile(self, repair: bool = False) -> dict:
+        """
+        Compare product tiff dir with the granule index, returns drift report.
+
+        Notes:
+        -----
+        The tiff dir (with harvest dirs) is scanned once and the index is downloaded once page by page. The report
+        has file names which are not indexed ('unindexed'), indexed locations in tiff dir without files ('orphaned')
+        and locations indexed more than once ('duplicated'). The local granule index is replaced with the downloaded
+        one. repair=False is a dry run, with repair=True orphaned and duplicated entries of tiff dir are deleted with
+        CQL location filters and unindexed and duplicated files are published again. Duplicates outside tiff dir
+        (e.g. initial granule) are only reported.
+        """
+
+        tiff_dir_name = os.path.normpath(self._get_tiff_dir_name())
+        on_disk = {entry.name: entry.path for entry in self._iter_tiff_files()}
+
+        location_counts = Counter(
+            location for _, location in self.geoserver.iter_granules_from_coveragestore(
+                workspace=self.workspace_name,
+                coveragestore_name=self.coveragestore_name
+            )
+        )
+        indexed = {os.path.basename(location) for location in location_counts}
+        # full download, drops local entries of granules deleted outside this client
+        self.granule_index.replace(indexed)
+
+        def in_tiff_dir(location):
+            dir_name = os.path.normpath(os.path.dirname(location))
+            return dir_name == tiff_dir_name or (os.path.dirname(dir_name) == tiff_dir_name and
+                                                 os.path.basename(dir_name).startswith(HARVEST_DIR_PREFIX))
+
+        report = {
+            'files': len(on_disk),
+            'granules': sum(location_counts.values()),
+            'unindexed': sorted(on_disk.keys() - indexed),
+            'orphaned': sorted(location for location in location_counts
+                               if in_tiff_dir(location) and os.path.basename(location) not in on_disk),
+            'duplicated': sorted(location for location, count in location_counts.items() if count > 1),
+        }
+        self.logger.info(f'reconcile {self.coveragestore_name}: {len(report["unindexed"])} unindexed, '
+                         f'{len(report["orphaned"])} orphaned, {len(report["duplicated"])} duplicated')
+        if not repair:
+            return report
+
+        duplicated = [location for location in report['duplicated']
+                      if in_tiff_dir(location) and os.path.basename(location) in on_disk]
+        report['deleted'] = self.geoserver.delete_granules_by_locations(
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            locations=report['orphaned'] + duplicated
+        )
+        self.granule_index.discard_many(os.path.basename(location) for location in report['orphaned'])
+
+        paths = [on_disk[name] for name in report['unindexed']] + duplicated
+        report['published'] = self.geoserver.publish_files_to_coveragestore(
+            paths,
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            max_workers=self._publish_concurrency
+        )
+        for path, result in zip(paths, report['published']):
+            if result is None or not result.startswith('Published'):
+                self.logger.error(f'{path} publication error: {result}')
+        return report
+
+    @stage('prune')
+    def prune(self, retention_days: Optional[float] = None, now: Optional[datetime] = None) -> dict:
+        """
+        Remove granules older than retention_days from the mosaic index and from product tiff dir.
+
+        Notes:
+        -----
+        Index entries are removed with one CQL delete request, files are removed in one scan of the tiff dir,
+        emptied harvest dirs are removed too. Files are kept if the index delete fails.
+        retention_days defaults to retention_days of product config.
+        """
+
+        if retention_days is None:
+            retention_days = self._retention_days
+        if retention_days is None:
+            raise ValueError('retention_days is not set in product config')
+
+        before = (now or datetime.utcnow()) - timedelta(days=retention_days)
+        before_time = before.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        index_result = self.geoserver.delete_granules_from_coveragestore(
+            workspace=self.workspace_name,
+            coveragestore_name=self.coveragestore_name,
+            cql_filter='{0} < {1}'.format(self._time_attribute, before_time)
+        )
+        if not index_result.startswith('Granules deleted'):
+            # files stay while the index refers to them, the next prune retries
+            self.logger.error(f'granules older than {before_time} are not deleted from index: {index_result}')
+            return {'index': index_result, 'files': []}
+        self.logger.info(f'granules older than {before_time} deleted from index: {index_result}')
+
+        tiff_dir_name = self._get_tiff_dir_name()
+        removed = []
+        removed_times = []
+        harvest_dir_names = set()
+        for entry in list(self._iter_tiff_files()):
+            slot_time = self._parse_slot_time_from_file_name(entry.name)
+            if slot_time < before:
+                os.remove(entry.path)
+                removed.append(entry.name)
+                removed_times.append(slot_time)
+                if os.path.dirname(entry.path) != tiff_dir_name:
+                    harvest_dir_names.add(os.path.dirname(entry.path))
+        for harvest_dir_name in harvest_dir_names:
+            if not os.listdir(harvest_dir_name):
+                os.rmdir(harvest_dir_name)
+
+        self._seed_slot_times(removed_times, seed_type='truncate')
+
+        self.granule_index.discard_many(removed)
+        self.logger.info(f'{len(removed)} files older than {before_time} removed from {tiff_dir_name}')
+        return {'index': index_result, 'files': removed}
@@ -0,0 +1,156 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from geoserver.Geoserver import Geoserver
+from geoserver.Publicator import PRODUCTS, Publicator
+
+
+class Scheduler:
+    """
+    Publishes ingest queues of many products with one geoserver client.
+
+    Attributes
+    ----------
+    products : Iterable[str], optional
+        Product config names, by default all PRODUCTS found in config.
+    config : dict, optional
+        Loaded config, by default config_loader() is called once.
+    config_loader : Callable[[], dict], optional
+        Loader of config, by default Publicator.load_config.
+    logger_factory : Callable[[str], logging.Logger]
+        Logger of product name given to its publicator, by default logging.getLogger.
+    max_workers : int
+        Number of jobs in flight across all products.
+    poll_interval : float
+        Seconds between checks of empty queues.
+
+    Notes
+    -----
+    Jobs are taken with stride scheduling: every product gets a share of workers proportional to its
+    priority (schedule.priority of product config, 1 by default) and never more than its
+    schedule.max_in_flight jobs at once, so the backlog of one satellite does not starve the others.
+    Publicators share the pooled client, hence also the catalog cache and per-store publish limits.
+    """
+
+    def __init__(
+            self,
+            products: Optional[Iterable[str]] = None,
+            config: Optional[dict] = None,
+            max_workers: int = 4,
+            poll_interval: float = 5.0,
+            config_loader: Optional[Callable[[], dict]] = None,
+            logger_factory: Callable[[str], logging.Logger] = logging.getLogger,
+    ):
+        if config is None:
+            config = (config_loader or Publicator.load_config)()
+        if products is None:
+            products = [product for product in PRODUCTS if product in config]
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self._max_workers = max_workers
+        self._poll_interval = poll_interval
+        self._priorities = {}
+        self._limits = {}
+        for product in products:
+            schedule = config[product].get('schedule', {})
+            self._priorities[product] = float(schedule.get('priority', 1))
+            self._limits[product] = schedule.get('max_in_flight', max_workers)
+            if self._priorities[product] <= 0:
+                raise ValueError('priority of {} must be positive'.format(product))
+            if self._limits[product] < 1:
+                raise ValueError('max_in_flight of {} must be at least 1'.format(product))
+
+        geoserver_config = config['geoserver_config']
+        self.geoserver = Geoserver(
+            service_url=geoserver_config['service_url'],
+            username=geoserver_config['username'],
+            password=geoserver_config['password'],
+            **geoserver_config.get('session', {})
+        )
+        self.publicators: Dict[str, Publicator] = {
+            product: Publicator(product, config=config, geoserver=self.geoserver, logger=logger_factory(product))
+            for product in self._priorities
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """ Release publicators and the shared client. """
+        for publicator in self.publicators.values():
+            publicator.close()
+        self.geoserver.close()
+
+    def enqueue(self, product: str, slots) -> int:
+        """ Add slots to ingest queue of product. """
+        return self.publicators[product].enqueue(slots)
+
+    def _claim_next(self, in_flight: dict, passes: dict):
+        """ Claim job of product with the smallest pass which is below its in flight limit. """
+        for product in sorted(self.publicators, key=lambda p: (passes[p], -self._priorities[p])):
+            if in_flight[product] >= self._limits[product]:
+                continue
+            jobs = self.publicators[product].ingest_queue.claim()
+            if jobs:
+                return product, jobs[0]
+        return None
+
+    def run(self, stop_when_empty: bool = True, stop: Optional[threading.Event] = None) -> Dict[str, dict]:
+        """
+        Drain ingest queues of all products, returns number of jobs by state for every product.
+
+        Notes:
+        -----
+        Jobs waiting for a retry are awaited, with stop_when_empty=False the loop also waits for new slots
+        until stop is set.
+        """
+
+        stop = stop or threading.Event()
+        condition = threading.Condition()
+        in_flight = {product: 0 for product in self.publicators}
+        passes = {product: 0.0 for product in self.publicators}
+        virtual_time = 0.0
+
+        def run_job(product, job):
+            try:
+                self.publicators[product]._process_job(job)
+            finally:
+                with condition:
+                    in_flight[product] -= 1
+                    condition.notify_all()
+
+        for publicator in self.publicators.values():
+            publicator.ingest_queue  # open queues before worker threads share them
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            while not stop.is_set():
+                with condition:
+                    while sum(in_flight.values()) >= self._max_workers:
+                        condition.wait()
+                    claimed = self._claim_next(in_flight, passes)
+                    if claimed is None and any(in_flight.values()):
+                        condition.wait(self._poll_interval)  # finished job may free a product limit
+                        continue
+                    if claimed is not None:
+                        product = claimed[0]
+                        in_flight[product] += 1
+                        # idle products start from current virtual time instead of their old pass
+                        virtual_time = max(passes[product], virtual_time)
+                        passes[product] = virtual_time + 1 / self._priorities[product]
+
+                if claimed is not None:
+                    executor.submit(run_job, *claimed)
+                    continue
+
+                waits = [wait for wait in (publicator.ingest_queue.next_attempt_in()
+                                           for publicator in self.publicators.values()) if wait is not None]
+                if not waits and stop_when_empty:
+                    break
+                stop.wait(min(waits + [self._poll_interval]))
+
+        return {product: publicator.ingest_queue.counts() for product, publicator in self.publicators.items()}
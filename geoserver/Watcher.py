@@ -0,0 +1,291 @@
+import argparse
+import functools
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import inotify_simple
+except ImportError:  # optional dependency, pip install inotify_simple
+    inotify_simple = None
+
+WATCHER_MODES = ('queue', 'workflow')
+
+
+class Watcher:
+    """
+    Watches source trees of products and publishes new slots as soon as their files are written.
+
+    Attributes
+    ----------
+    publicators : Iterable[Publicator]
+        Publicators of watched products.
+    mode : str
+        'queue' adds slots to ingest queue drained by one thread per product, 'workflow' calls batch_workflow.
+    settle_time : float
+        Seconds during which file size must not change before the file is published.
+    poll_interval : float
+        Seconds between scans of day dirs.
+    lookback_days : int
+        Number of previous days (besides today, UTC) which are scanned.
+    use_inotify : bool, optional
+        Use inotify events, by default if inotify_simple is installed.
+    scheduler : Scheduler, optional
+        Drains queues of publicators in queue mode instead of one thread per product.
+
+    Notes
+    -----
+    Only day dirs YYYY/MM/DD of the lookback window are scanned and slot dirs are listed only when their mtime
+    changes, so a scan costs a few stat calls. With inotify files closed after writing are published at once,
+    the scan still runs every poll_interval to pick up new day dirs and missed events.
+    """
+
+    def __init__(
+            self,
+            publicators: Iterable,
+            mode: str = 'queue',
+            settle_time: float = 5.0,
+            poll_interval: float = 2.0,
+            lookback_days: int = 1,
+            use_inotify: Optional[bool] = None,
+            scheduler=None,
+    ):
+        if mode not in WATCHER_MODES:
+            raise ValueError('mode must be one of {}'.format(', '.join(WATCHER_MODES)))
+        if use_inotify is None:
+            use_inotify = inotify_simple is not None
+        elif use_inotify and inotify_simple is None:
+            raise ImportError('inotify_simple is required for inotify watching, pip install inotify_simple')
+
+        self._publicators = list(publicators)
+        self._mode = mode
+        self._scheduler = scheduler
+        self._settle_time = settle_time
+        self._poll_interval = poll_interval
+        self._lookback_days = lookback_days
+        self._stop = threading.Event()
+        # path -> [publicator, args, size, stable since]
+        self._candidates = {}
+        # day dir -> {slot dir: mtime}, day dir -> handed off file paths
+        self._dir_mtimes: Dict[str, Dict[str, int]] = {}
+        self._seen: Dict[str, set] = {}
+        self._inotify = inotify_simple.INotify() if use_inotify else None
+        self._watches = {}  # watch descriptor -> (publicator, dir path)
+        self._watched_dirs = set()
+
+    def stop(self) -> None:
+        """ Stop run loop. """
+        self._stop.set()
+
+    def _get_day_dirs(self, publicator) -> List[str]:
+        today = datetime.utcnow()
+        return [
+            os.path.join(publicator.source_dir, *(today - timedelta(days=days)).strftime('%Y/%m/%d').split('/'))
+            for days in range(self._lookback_days + 1)
+        ]
+
+    def _watch(self, publicator, path: str) -> None:
+        if self._inotify is None or path in self._watched_dirs:
+            return
+        flags = inotify_simple.flags
+        try:
+            wd = self._inotify.add_watch(path, flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO)
+        except FileNotFoundError:
+            return
+        self._watches[wd] = (publicator, path)
+        self._watched_dirs.add(path)
+
+    def _add_candidate(self, publicator, path: str, settled: bool = False) -> None:
+        day_dir = os.path.dirname(os.path.dirname(path))
+        if path in self._candidates or path in self._seen.get(day_dir, ()):
+            return
+        args = publicator.parse_slot_from_path(path)
+        if args is None:
+            return
+        self._candidates[path] = [publicator, args, -1, float('-inf') if settled else time.monotonic()]
+
+    def _scan_slot_dir(self, publicator, slot_dir: str) -> None:
+        self._watch(publicator, slot_dir)
+        try:
+            with os.scandir(slot_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        self._add_candidate(publicator, entry.path)
+        except FileNotFoundError:
+            return
+
+    def _scan(self) -> None:
+        """ List slot dirs of lookback window whose mtime changed. """
+        day_dirs = set()
+        for publicator in self._publicators:
+            for day_dir in self._get_day_dirs(publicator):
+                day_dirs.add(day_dir)
+                mtimes = self._dir_mtimes.setdefault(day_dir, {})
+                try:
+                    with os.scandir(day_dir) as entries:
+                        slot_dirs = [entry for entry in entries if entry.is_dir()]
+                except FileNotFoundError:
+                    continue
+                self._watch(publicator, day_dir)
+                for entry in slot_dirs:
+                    mtime = entry.stat().st_mtime_ns
+                    if mtimes.get(entry.path) != mtime:
+                        mtimes[entry.path] = mtime
+                        self._scan_slot_dir(publicator, entry.path)
+
+        # forget days which left the lookback window
+        for day_dir in set(self._dir_mtimes) - day_dirs:
+            del self._dir_mtimes[day_dir]
+            self._seen.pop(day_dir, None)
+        if self._inotify is not None:
+            for wd, (_, path) in list(self._watches.items()):
+                if path not in day_dirs and os.path.dirname(path) not in day_dirs:
+                    self._unwatch(wd)
+
+    def _unwatch(self, wd: int) -> None:
+        (_, path) = self._watches.pop(wd)
+        self._watched_dirs.discard(path)
+        try:
+            self._inotify.rm_watch(wd)
+        except OSError:  # dir is already removed
+            pass
+
+    def _read_events(self) -> None:
+        """ Wait for inotify events up to poll_interval. """
+        flags = inotify_simple.flags
+        for event in self._inotify.read(timeout=int(self._poll_interval * 1000)):
+            if event.mask & flags.Q_OVERFLOW:
+                self._dir_mtimes.clear()  # rescan everything
+                continue
+            if event.mask & flags.IGNORED:
+                (_, path) = self._watches.pop(event.wd, (None, None))
+                self._watched_dirs.discard(path)
+                continue
+            if event.wd not in self._watches:
+                continue
+            (publicator, dir_path) = self._watches[event.wd]
+            path = os.path.join(dir_path, event.name)
+            if event.mask & flags.ISDIR:
+                self._scan_slot_dir(publicator, path)
+            else:
+                # closed or moved in files are complete
+                settled = bool(event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO))
+                self._add_candidate(publicator, path, settled=settled)
+                if settled and path in self._candidates:
+                    self._candidates[path][3] = float('-inf')
+
+    def _collect_ready(self) -> Dict[object, list]:
+        """ Slots whose files kept their size for settle_time, by publicator. """
+        now = time.monotonic()
+        ready = {}
+        for path, candidate in list(self._candidates.items()):
+            (publicator, args, size, since) = candidate
+            try:
+                current_size = os.stat(path).st_size
+            except FileNotFoundError:
+                del self._candidates[path]
+                continue
+            if current_size == 0 or (current_size != size and since != float('-inf')):
+                candidate[2:] = [current_size, now]
+                continue
+            if now - since < self._settle_time:
+                continue
+            del self._candidates[path]
+            self._seen.setdefault(os.path.dirname(os.path.dirname(path)), set()).add(path)
+            ready.setdefault(publicator, []).append(args)
+        return ready
+
+    def _publish(self, ready: Dict[object, list]) -> None:
+        for publicator, slots in ready.items():
+            slots = sorted(set(slots))
+            if self._mode == 'queue':
+                publicator.enqueue(slots)
+            else:
+                publicator.batch_workflow(slots)
+
+    def run(self) -> None:
+        """ Watch source trees until stop is called. """
+        drainers = []
+        if self._mode == 'queue' and self._scheduler is not None:
+            drainer = threading.Thread(
+                target=self._scheduler.run,
+                kwargs={'stop_when_empty': False, 'stop': self._stop},
+                name='drain',
+                daemon=True
+            )
+            drainer.start()
+            drainers.append(drainer)
+        elif self._mode == 'queue':
+            for publicator in self._publicators:
+                publicator.ingest_queue  # open queue before threads share it
+                drainer = threading.Thread(
+                    target=publicator.run_queue,
+                    kwargs={'poll_interval': self._poll_interval, 'stop_when_empty': False, 'stop': self._stop},
+                    name='drain-' + publicator.product,
+                    daemon=True
+                )
+                drainer.start()
+                drainers.append(drainer)
+        try:
+            while not self._stop.is_set():
+                self._scan()
+                self._publish(self._collect_ready())
+                if self._inotify is not None:
+                    self._read_events()
+                    self._publish(self._collect_ready())
+                else:
+                    self._stop.wait(self._poll_interval)
+        finally:
+            self._stop.set()
+            for drainer in drainers:
+                drainer.join()
+            if self._inotify is not None:
+                self._inotify.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """ Entry point, e.g. python -m geoserver.Watcher AHI_L2_RGB_GEOSERVER ABI_L2_G16_RGB_GEOSERVER """
+    from geoserver.Publicator import Publicator
+    from geoserver.Scheduler import Scheduler
+
+    parser = argparse.ArgumentParser(description='Publish new satellite slots to geoserver as they arrive.')
+    parser.add_argument('products', nargs='+', help='product config names')
+    parser.add_argument('--mode', choices=WATCHER_MODES, default='queue')
+    parser.add_argument('--settle-time', type=float, default=5.0)
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--lookback-days', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=4, help='jobs in flight across all products')
+    parser.add_argument('--no-inotify', action='store_true', help='scan directories only')
+    parser.add_argument('--config', help='JSON config file, by default the config of the host application')
+    options = parser.parse_args(argv)
+
+    # one config load and one pooled client for all products
+    scheduler = Scheduler(
+        options.products,
+        max_workers=options.workers,
+        poll_interval=options.poll_interval,
+        config_loader=functools.partial(Publicator.load_config, options.config)
+    )
+    watcher = Watcher(
+        scheduler.publicators.values(),
+        mode=options.mode,
+        settle_time=options.settle_time,
+        poll_interval=options.poll_interval,
+        lookback_days=options.lookback_days,
+        use_inotify=False if options.no_inotify else None,
+        scheduler=scheduler
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+import bisect
+import contextlib
+import functools
+import json
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+# seconds, from catalog lookups to harvests of big mosaics
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# REST collections, the segment after them is a name and is replaced in endpoint labels
+_COLLECTIONS = {'workspaces', 'coveragestores', 'coverages', 'layers', 'granules', 'seed', 'styles'}
+
+
+class Histogram:
+    """ Counts of observed values per bucket upper bound, the last count is for values above all buckets. """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """ (le, count) pairs in Prometheus order, ending with +Inf. """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return pairs
+
+
+def get_endpoint(url: str) -> str:
+    """ URL path with names replaced by {}, e.g. /geoserver/rest/workspaces/{}/coveragestores/{}/external.imagemosaic. """
+    segments = urlparse(url).path.split('/')
+    for i in range(1, len(segments)):
+        if segments[i - 1] in _COLLECTIONS and segments[i]:
+            extension = segments[i].rsplit('.', 1)[1] if '.' in segments[i] else None
+            segments[i] = '{}.' + extension if extension in ('json', 'xml') else '{}'
+    return '/'.join(segments)
+
+
+class Metrics:
+    """
+    Registry of REST call and workflow stage measurements.
+
+    Attributes
+    ----------
+    buckets : Tuple[float, ...]
+        Upper bounds of latency histogram buckets in seconds.
+
+    Notes
+    -----
+    REST calls are labelled by method and endpoint (URL path with names replaced), workflow stages by stage
+    and product. Export with to_prometheus() (text exposition format) or log() (one JSON line per series).
+    Hooks are called as hook(name, attributes=dict) and must return a context manager wrapping the call, e.g.
+    tracer.start_as_current_span of OpenTelemetry. If the entered value has set_attribute, the status of the call
+    is set on it.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._hooks: List[Callable] = []
+        self._latency: Dict[tuple, Histogram] = {}
+        self._requests = Counter()  # (method, endpoint, status)
+        self._bytes_sent = Counter()  # (method, endpoint)
+        self._bytes_received = Counter()
+        self._retries = Counter()
+        self._in_flight = Counter()
+        self._stage_latency: Dict[tuple, Histogram] = {}  # (stage, product)
+        self._stage_errors = Counter()
+        self._stages_in_flight = Counter()
+
+    def add_hook(self, hook: Callable) -> None:
+        """ Add tracing hook called around every REST call and workflow stage. """
+        self._hooks.append(hook)
+
+    @contextlib.contextmanager
+    def _hook_spans(self, name: str, attributes: dict) -> Iterator[list]:
+        with contextlib.ExitStack() as stack:
+            yield [stack.enter_context(hook(name, attributes=dict(attributes))) for hook in self._hooks]
+
+    @staticmethod
+    def _set_span_attributes(spans: list, attributes: dict) -> None:
+        for span in spans:
+            if hasattr(span, 'set_attribute'):
+                for key, value in attributes.items():
+                    span.set_attribute(key, value)
+
+    def _observe(self, histograms: Dict[tuple, Histogram], key: tuple, value: float) -> None:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self._buckets)
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def request(self, method: str, url: str) -> Iterator[dict]:
+        """
+        Measure one REST call.
+
+        Notes:
+        -----
+        Yields dict where the caller sets status, bytes_sent, bytes_received and retries of the response.
+        Status is the exception name if the call raises.
+        """
+
+        key = (method, get_endpoint(url))
+        call = {'status': None, 'bytes_sent': 0, 'bytes_received': 0, 'retries': 0}
+        with self._lock:
+            self._in_flight[key] += 1
+        started = time.perf_counter()
+        try:
+            with self._hook_spans('geoserver.request', {'http.method': method, 'endpoint': key[1]}) as spans:
+                try:
+                    yield call
+                except Exception as e:
+                    call['status'] = type(e).__name__
+                    raise
+                finally:
+                    self._set_span_attributes(spans, {'http.status_code': str(call['status'])})
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._in_flight[key] -= 1
+                self._observe(self._latency, key, elapsed)
+                self._requests[key + (str(call['status']),)] += 1
+                self._bytes_sent[key] += call['bytes_sent']
+                self._bytes_received[key] += call['bytes_received']
+                self._retries[key] += call['retries']
+
+    @contextlib.contextmanager
+    def span(self, stage: str, product: str = '', **attributes) -> Iterator[None]:
+        """ Measure one workflow stage. """
+        key = (stage, product)
+        with self._lock:
+            self._stages_in_flight[key] += 1
+        started = time.perf_counter()
+        try:
+            with self._hook_spans(stage, dict(attributes, product=product)):
+                yield
+        except Exception:
+            with self._lock:
+                self._stage_errors[key] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._stages_in_flight[key] -= 1
+                self._observe(self._stage_latency, key, elapsed)
+
+    def snapshot(self) -> dict:
+        """ Copy of all series, for custom exporters. """
+        with self._lock:
+            return {
+                'request_duration_seconds': {k: (h.cumulative(), h.count, h.sum) for k, h in self._latency.items()},
+                'requests_total': dict(self._requests),
+                'request_bytes_sent_total': dict(self._bytes_sent),
+                'response_bytes_received_total': dict(self._bytes_received),
+                'request_retries_total': dict(self._retries),
+                'requests_in_flight': dict(self._in_flight),
+                'stage_duration_seconds': {k: (h.cumulative(), h.count, h.sum)
+                                           for k, h in self._stage_latency.items()},
+                'stage_errors_total': dict(self._stage_errors),
+                'stages_in_flight': dict(self._stages_in_flight),
+            }
+
+    @staticmethod
+    def _format_labels(names: Tuple[str, ...], values: tuple, extra: str = '') -> str:
+        labels = ['{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                  for name, value in zip(names, values)]
+        if extra:
+            labels.append(extra)
+        return '{' + ','.join(labels) + '}'
+
+    def to_prometheus(self) -> str:
+        """ All series in Prometheus text exposition format. """
+        snapshot = self.snapshot()
+        request_labels = ('method', 'endpoint')
+        stage_labels = ('stage', 'product')
+        lines = []
+
+        def add_histogram(name, labels, series, help_text):
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} histogram'.format(name))
+            for key, (buckets, count, total) in sorted(series.items()):
+                for le, value in buckets:
+                    lines.append('{0}_bucket{1} {2}'.format(name, self._format_labels(labels, key, 'le="{}"'.format(le)),
+                                                            value))
+                lines.append('{0}_sum{1} {2}'.format(name, self._format_labels(labels, key), total))
+                lines.append('{0}_count{1} {2}'.format(name, self._format_labels(labels, key), count))
+
+        def add_series(name, metric_type, labels, series, help_text):
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} {1}'.format(name, metric_type))
+            for key, value in sorted(series.items()):
+                lines.append('{0}{1} {2}'.format(name, self._format_labels(labels, key), value))
+
+        add_histogram('geoserver_request_duration_seconds', request_labels,
+                      snapshot['request_duration_seconds'], 'Latency of GeoServer REST calls.')
+        add_series('geoserver_requests_total', 'counter', request_labels + ('status',),
+                   snapshot['requests_total'], 'GeoServer REST calls by status code.')
+        add_series('geoserver_request_bytes_sent_total', 'counter', request_labels,
+                   snapshot['request_bytes_sent_total'], 'Request body bytes sent to GeoServer.')
+        add_series('geoserver_response_bytes_received_total', 'counter', request_labels,
+                   snapshot['response_bytes_received_total'], 'Response body bytes received from GeoServer.')
+        add_series('geoserver_request_retries_total', 'counter', request_labels,
+                   snapshot['request_retries_total'], 'Retries of GeoServer REST calls.')
+        add_series('geoserver_requests_in_flight', 'gauge', request_labels,
+                   snapshot['requests_in_flight'], 'GeoServer REST calls in progress.')
+        add_histogram('publicator_stage_duration_seconds', stage_labels,
+                      snapshot['stage_duration_seconds'], 'Duration of publication workflow stages.')
+        add_series('publicator_stage_errors_total', 'counter', stage_labels,
+                   snapshot['stage_errors_total'], 'Publication workflow stages failed with exception.')
+        add_series('publicator_stages_in_flight', 'gauge', stage_labels,
+                   snapshot['stages_in_flight'], 'Publication workflow stages in progress.')
+        return '\n'.join(lines) + '\n'
+
+    def to_log_lines(self) -> List[str]:
+        """ One JSON line per series, histograms are reported as count, sum and mean. """
+        snapshot = self.snapshot()
+        lines = []
+        for metric, series in snapshot.items():
+            labels = ('stage', 'product') if metric.startswith('stage') else ('method', 'endpoint', 'status')
+            for key, value in sorted(series.items()):
+                record = {'metric': metric}
+                record.update(zip(labels, key))
+                if isinstance(value, tuple):  # histogram
+                    (_, count, total) = value
+                    record.update(count=count, sum=round(total, 6), mean=round(total / count, 6) if count else 0)
+                else:
+                    record['value'] = value
+                lines.append(json.dumps(record, sort_keys=True))
+        return lines
+
+    def log(self, logger) -> None:
+        """ Write all series to logger as structured lines. """
+        for line in self.to_log_lines():
+            logger.info(line)
+
+
+def stage(name: str) -> Callable:
+    """ Decorator measuring a Publicator method as workflow stage, uses self.metrics and self.product. """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.span(name, product=self.product):
+                return method(self, *args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,197 @@
+import functools
+import json
+import string
+import xml.etree.ElementTree as ET
+from typing import Iterable, Optional, Tuple
+from xml.sax.saxutils import escape
+
+TIME_REGEX = '[0-9]{4}-[0-9]{2}-[0-9]{2}T([0-9]{2}:){2}[0-9]{2}[.][0-9]{3}Z'
+
+_FIELD_TOKEN = '@@FIELD:{}@@'
+
+
+class Field:
+    """ Varying field of a payload template. """
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class ListOf:
+    """ List which is wrapped into item elements in xml, e.g. <mimeFormats><string>image/png</string></mimeFormats>. """
+
+    def __init__(self, tag: str, items: Iterable):
+        self.tag = tag
+        self.items = list(items)
+
+
+class PayloadTemplate:
+    """
+    Payload document prepared once and rendered with only the varying fields.
+
+    Attributes
+    ----------
+    root : str
+        Root element (xml) or root key (json) of the document.
+    document : dict
+        Document structure. Keys starting with '@' are xml attributes, python lists are repeated elements,
+        ListOf values are wrapped lists and Field values are filled in render.
+
+    Notes
+    -----
+    Both xml and json texts are serialized and validated in the constructor, render only substitutes
+    escaped field values.
+    """
+
+    def __init__(self, root: str, document: dict):
+        self.root = root
+        self._fields = set()
+        self._xml = self._create_template(self._to_xml(root, document))
+        self._json = self._create_template(json.dumps({root: self._to_json(document)}, separators=(',', ':')))
+        # validate documents once with dummy field values
+        dummy = {name: 'x' for name in self._fields}
+        ET.fromstring(self.render('xml', **dummy))
+        json.loads(self.render('json', **dummy))
+
+    def _create_template(self, text: str) -> string.Template:
+        text = text.replace('$', '$$')
+        for name in self._fields:
+            text = text.replace('"' + _FIELD_TOKEN.format(name) + '"', '${' + name + '}')  # json value
+            text = text.replace(_FIELD_TOKEN.format(name), '${' + name + '}')  # xml text
+        return string.Template(text)
+
+    def _to_xml_text(self, value) -> str:
+        if isinstance(value, Field):
+            self._fields.add(value.name)
+            return _FIELD_TOKEN.format(value.name)
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return escape('' if value is None else str(value))
+
+    def _to_xml(self, tag: str, value) -> str:
+        if isinstance(value, list):
+            return ''.join(self._to_xml(tag, item) for item in value)
+        if isinstance(value, ListOf):
+            return '<{0}>{1}</{0}>'.format(tag, ''.join(self._to_xml(value.tag, item) for item in value.items))
+        if isinstance(value, dict):
+            attributes = ''.join(" {}='{}'".format(k[1:], self._to_xml_text(v).replace("'", '&apos;'))
+                                 for k, v in value.items() if k.startswith('@'))
+            children = ''.join(self._to_xml(k, v) for k, v in value.items() if not k.startswith('@'))
+            return '<{0}{1}>{2}</{0}>'.format(tag, attributes, children)
+        return '<{0}>{1}</{0}>'.format(tag, self._to_xml_text(value))
+
+    def _to_json(self, value):
+        if isinstance(value, Field):
+            self._fields.add(value.name)
+            return _FIELD_TOKEN.format(value.name)
+        if isinstance(value, ListOf):
+            return [self._to_json(item) for item in value.items]
+        if isinstance(value, list):
+            return [self._to_json(item) for item in value]
+        if isinstance(value, dict):
+            return {k: self._to_json(v) for k, v in value.items()}
+        return value
+
+    def render(self, payload_format: str = 'xml', **fields) -> str:
+        """ Render document as xml or json. """
+        if payload_format == 'json':
+            return self._json.substitute({name: json.dumps(value) for name, value in fields.items()})
+        return self._xml.substitute({name: self._to_xml_text(value) for name, value in fields.items()})
+
+
+@functools.lru_cache(maxsize=None)
+def gwc_layer_template(
+        blob_store: str = 'RAM',
+        mime_formats: Tuple[str, ...] = ('image/png', 'image/jpeg'),
+        gridsets: Tuple[str, ...] = ('EPSG:4326', 'EPSG:900913'),
+        metatile: Tuple[int, int] = (4, 4),
+        in_memory_cached: bool = True,
+        expire_cache: int = 0,
+        expire_clients: int = 0,
+        gutter: int = 0,
+        time_regex: str = TIME_REGEX,
+        style_filter: bool = True,
+        regex_filters: Tuple[Tuple[str, str, str], ...] = (),
+) -> PayloadTemplate:
+    """
+    GWC GeoServerLayer document with TIME parameter filter.
+
+    Notes:
+    -----
+    Fields: id, name (workspace:layer) and time (default TIME value).
+    regex_filters are additional (key, regex, default value) parameter filters.
+    Templates are cached, pass tuples so that equal configs share one template.
+    """
+
+    regex_parameter_filters = [
+        {
+            'key': 'TIME',
+            'defaultValue': Field('time'),
+            'normalize': {'locale': ''},
+            'regex': time_regex,
+        }
+    ]
+    regex_parameter_filters.extend(
+        {'key': key, 'defaultValue': default_value, 'normalize': {'locale': ''}, 'regex': regex}
+        for key, regex, default_value in regex_filters
+    )
+
+    parameter_filters = {'regexParameterFilter': regex_parameter_filters}
+    if style_filter:
+        parameter_filters['styleParameterFilter'] = [{'key': 'STYLES', 'defaultValue': ''}]
+
+    return PayloadTemplate('GeoServerLayer', {
+        'id': Field('id'),
+        'enabled': True,
+        'inMemoryCached': in_memory_cached,
+        'name': Field('name'),
+        'blobStoreId': blob_store,
+        'mimeFormats': ListOf('string', mime_formats),
+        'gridSubsets': ListOf('gridSubset', [{'gridSetName': gridset} for gridset in gridsets]),
+        'metaWidthHeight': ListOf('int', metatile),
+        'expireCache': expire_cache,
+        'expireClients': expire_clients,
+        'parameterFilters': parameter_filters,
+        'gutter': gutter,
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def coverage_template(
+        dimensions: Tuple[Tuple[str, str, str, str], ...] = (('time', 'LIST', 'ISO8601', 'MINIMUM'),),
+        enabled: bool = True,
+        title: Optional[str] = None,
+) -> PayloadTemplate:
+    """
+    Coverage document with dimensions.
+
+    Notes:
+    -----
+    dimensions are (name, presentation, units, default value strategy), e.g. ('time', 'LIST', 'ISO8601', 'MINIMUM').
+    More about time support in geoserver WMS you can read here:
+    https://docs.geoserver.org/master/en/user/services/wms/time.html
+    """
+
+    document = {'enabled': enabled}
+    if title is not None:
+        document['title'] = title
+    document['metadata'] = {
+        'entry': [
+            {
+                '@key': name,
+                'dimensionInfo': {
+                    'enabled': True,
+                    'presentation': presentation,
+                    'units': units,
+                    'defaultValue': {'strategy': strategy},
+                },
+            }
+            for name, presentation, units, strategy in dimensions
+        ]
+    }
+    return PayloadTemplate('coverage', document)
+
+
+def get_payload_format(content_type: str) -> str:
+    """ Payload format by content type. """
+    return 'json' if 'json' in content_type else 'xml'
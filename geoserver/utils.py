@@ -1,6 +1,51 @@
+import codecs
+import contextlib
+import errno
+import json
+import mmap
 import os
 import pathlib
 import shutil
+import struct
+import time
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from osgeo import gdal
+except ImportError:  # optional dependency of optimize_geotiff, pip install GDAL
+    gdal = None
+
+
+FICLONE = 0x40049409  # linux ioctl to clone (reflink) a file
+
+STAGING_STRATEGIES = ('copy', 'hardlink', 'reflink', 'symlink', 'rename')
+
+ZIP_COMPRESSED_EXTENSIONS = ('.properties', '.xml', '.prj', '.txt')  # rasters are already compressed, stored as is
+
+# .prj of shapefile index for EPSG:4326 granules
+WGS84_WKT = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],' \
+            'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]'
+
+# julian day number of 1970-01-01, dbf timestamps count days from 4713 BC
+_JULIAN_DAY_OF_EPOCH = 2440588
+
+GeoTiffHeader = namedtuple('GeoTiffHeader', [
+    'width', 'height', 'bands', 'bits_per_sample', 'compression', 'tiled', 'block_size', 'overviews',
+    'epsg', 'bbox', 'resolution', 'bigtiff'
+])
+
+# struct items of tiff field types, ASCII, RATIONAL and UNDEFINED values are not needed
+_TIFF_TYPES = {1: 'B', 3: 'H', 4: 'I', 6: 'b', 8: 'h', 9: 'i', 11: 'f', 12: 'd', 16: 'Q', 17: 'q', 18: 'Q'}
+
+# NewSubfileType, size, BitsPerSample, Compression, SamplesPerPixel, RowsPerStrip, tile size
+# and GeoTIFF ModelPixelScale, ModelTiepoint, ModelTransformation, GeoKeyDirectory
+_TIFF_TAGS = {254, 256, 257, 258, 259, 277, 278, 322, 323, 33550, 33922, 34264, 34735}
+
+_TIFF_COMPRESSIONS = {1: 'none', 5: 'lzw', 6: 'jpeg', 7: 'jpeg', 8: 'deflate', 32773: 'packbits', 32946: 'deflate',
+                      34887: 'lerc', 50000: 'zstd', 50001: 'webp'}
 
 
 class PublicationUtils:
@@ -22,26 +67,663 @@ class PublicationUtils:
         return os.path.join(*fpath_parts)
 
     @staticmethod
-    def zip_dir(fpath: str) -> None:
-        """ Zip folder with files. """
+    def _get_zip_members(fpath: str, extra_files: Iterable[str] = ()) -> List[Tuple[str, str]]:
+        """ (file path, name in archive) of all files in folder and of extra files, which go to archive root. """
+        members = []
+        for root, _, files in os.walk(fpath):
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                members.append((file_path, os.path.relpath(file_path, fpath)))
+        members.extend((file_path, os.path.basename(file_path)) for file_path in extra_files)
+        return members
+
+    @staticmethod
+    def _create_zip_info(file_path: str, arcname: str) -> zipfile.ZipInfo:
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        if file_path.lower().endswith(ZIP_COMPRESSED_EXTENSIONS):
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+        else:
+            zinfo.compress_type = zipfile.ZIP_STORED
+        return zinfo
+
+    @staticmethod
+    def _write_zip_members(archive: zipfile.ZipFile, members: Iterable[Tuple[str, str]],
+                           chunk_size: int = 1024 * 1024) -> Iterator[None]:
+        """ Write members chunk by chunk, yields after every chunk. """
+        for file_path, arcname in members:
+            zinfo = PublicationUtils._create_zip_info(file_path, arcname)
+            with open(file_path, 'rb') as src, archive.open(zinfo, 'w') as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield
+
+    @staticmethod
+    def zip_dir(fpath: str, extra_files: Iterable[str] = ()) -> bool:
+        """
+        Zip folder with files to fpath.zip.
+
+        Notes:
+        -----
+        Rasters are stored uncompressed, only configuration files (.properties, ...) are deflated.
+        The archive is written under a temp name and renamed when it is complete.
+        """
         # Example: '/NFS_WORK/sat/public/test_products/blue_marble/init'
         if not PublicationUtils.check_path_existence(fpath):
             return False
-        shutil.make_archive(fpath, 'zip', fpath)
+        zip_fpath = fpath.rstrip(os.sep) + '.zip'
+        temp_fpath = PublicationUtils._create_temp_filename(zip_fpath)
+        try:
+            with zipfile.ZipFile(temp_fpath, 'w') as archive:
+                for _ in PublicationUtils._write_zip_members(archive,
+                                                             PublicationUtils._get_zip_members(fpath, extra_files)):
+                    pass
+            os.replace(temp_fpath, zip_fpath)
+        finally:
+            if os.path.lexists(temp_fpath):
+                os.remove(temp_fpath)
+        return True
+
+    @staticmethod
+    def iter_zip_dir(fpath: str, extra_files: Iterable[str] = (), chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """ Build zip of folder (and extra files) on the fly and yield it in chunks, nothing is written to disk. """
+        output = _ZipStreamOutput()
+        with zipfile.ZipFile(output, 'w') as archive:
+            for _ in PublicationUtils._write_zip_members(archive, PublicationUtils._get_zip_members(fpath, extra_files),
+                                                         chunk_size=chunk_size):
+                if output.size >= chunk_size:
+                    yield output.drain()
+        yield output.drain()  # central directory
+
+    @staticmethod
+    def get_base_zip(fpath: str) -> str:
+        """ Path of cached fpath.zip, the archive is rebuilt only when files of the folder changed. """
+        zip_fpath = fpath.rstrip(os.sep) + '.zip'
+        newest = max((os.path.getmtime(file_path) for file_path, _ in PublicationUtils._get_zip_members(fpath)),
+                     default=0)
+        if not PublicationUtils.check_path_existence(zip_fpath) or os.path.getmtime(zip_fpath) < newest:
+            PublicationUtils.zip_dir(fpath)
+        return zip_fpath
+
+    @staticmethod
+    def zip_dir_from_base(base_fpath: str, zip_fpath: str, extra_files: Iterable[str] = ()) -> bool:
+        """ Create zip_fpath as a copy of cached base folder archive with extra files appended. """
+        if not PublicationUtils.check_path_existence(base_fpath):
+            return False
+        base_zip_fpath = PublicationUtils.get_base_zip(base_fpath)
+        temp_fpath = PublicationUtils._create_temp_filename(zip_fpath)
+        try:
+            shutil.copyfile(base_zip_fpath, temp_fpath)
+            with zipfile.ZipFile(temp_fpath, 'a') as archive:
+                members = [(file_path, os.path.basename(file_path)) for file_path in extra_files]
+                for _ in PublicationUtils._write_zip_members(archive, members):
+                    pass
+            os.replace(temp_fpath, zip_fpath)
+        finally:
+            if os.path.lexists(temp_fpath):
+                os.remove(temp_fpath)
         return True
 
+    @staticmethod
+    def _create_temp_filename(fpath: str) -> str:
+        """ Hidden temp name in the same directory, so rename is atomic and GeoServer does not harvest it. """
+        dir_name, file_name = os.path.split(fpath)
+        return os.path.join(dir_name, '.{}.{}.tmp'.format(file_name, os.getpid()))
+
+    @staticmethod
+    def _reflink_file(fpath_from: str, fpath_to: str) -> None:
+        """ Clone file with FICLONE, fall back to in-kernel copy_file_range, then to regular copy. """
+        with open(fpath_from, 'rb') as src, open(fpath_to, 'wb') as dst:
+            try:
+                import fcntl
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except (ImportError, OSError):
+                pass
+            if not hasattr(os, 'copy_file_range'):
+                shutil.copyfileobj(src, dst)
+                return
+            size = os.fstat(src.fileno()).st_size
+            offset = 0
+            try:
+                while offset < size:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), size - offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                src.seek(offset)
+                dst.seek(offset)
+                shutil.copyfileobj(src, dst)
+
+    @staticmethod
+    def stage_file(fpath_from: str, fpath_to: str, strategy: str = 'copy') -> bool:
+        """
+        Put file to directory with one of staging strategies.
+
+        Notes:
+        -----
+        copy - regular copy, hardlink - hard link (copy if file systems differ), reflink - copy-on-write clone or
+        in-kernel copy where file system supports it, symlink - symbolic link, rename - move file.
+        The file is staged under a hidden temp name and atomically renamed, so a half-written file is never visible.
+        """
+
+        if strategy not in STAGING_STRATEGIES:
+            raise ValueError('strategy must be one of {}'.format(', '.join(STAGING_STRATEGIES)))
+        if PublicationUtils.check_path_existence(fpath_to) or not PublicationUtils.check_path_existence(fpath_from):
+            return False
+
+        temp_fpath = PublicationUtils._create_temp_filename(fpath_to)
+        try:
+            if strategy == 'rename':
+                try:
+                    os.replace(fpath_from, fpath_to)
+                    return True
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.copyfile(fpath_from, temp_fpath)
+                    os.replace(temp_fpath, fpath_to)
+                    os.remove(fpath_from)
+                    return True
+
+            if strategy == 'hardlink':
+                try:
+                    os.link(fpath_from, temp_fpath)
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                        raise
+                    shutil.copyfile(fpath_from, temp_fpath)
+            elif strategy == 'reflink':
+                PublicationUtils._reflink_file(fpath_from, temp_fpath)
+            elif strategy == 'symlink':
+                os.symlink(os.path.abspath(fpath_from), temp_fpath)
+            else:
+                shutil.copyfile(fpath_from, temp_fpath)
+
+            os.replace(temp_fpath, fpath_to)
+            return True
+        finally:
+            if os.path.lexists(temp_fpath):
+                os.remove(temp_fpath)
+
     @staticmethod
     def copy_file(fpath_from: str, fpath_to: str) -> None:
         """ Copy file from directory to directory. """
+        return PublicationUtils.stage_file(fpath_from, fpath_to, strategy='copy')
+
+    @staticmethod
+    def copy_dir_recursively(fpath_from: str, fpath_to: str, strategy: str = 'copy') -> bool:
+        """ Copy entire directory with files into an existing directory, files are staged with strategy. """
         if PublicationUtils.check_path_existence(fpath_to) or not PublicationUtils.check_path_existence(fpath_from):
             return False
-        shutil.copyfile(fpath_from, fpath_to)
+        if strategy not in STAGING_STRATEGIES or strategy == 'rename':
+            raise ValueError('strategy must be one of copy, hardlink, reflink, symlink')
+
+        def copy_function(src, dst):
+            PublicationUtils.stage_file(src, dst, strategy=strategy)
+
+        temp_fpath = PublicationUtils._create_temp_filename(fpath_to.rstrip(os.sep))
+        try:
+            shutil.copytree(fpath_from, temp_fpath, copy_function=copy_function)
+            os.rename(temp_fpath, fpath_to)
+        finally:
+            if os.path.lexists(temp_fpath):
+                shutil.rmtree(temp_fpath)
         return True
 
     @staticmethod
-    def copy_dir_recursively(fpath_from: str, fpath_to: str) -> bool:
-        """ Copy entire directory with files into an existing directory """
-        if PublicationUtils.check_path_existence(fpath_to) or not PublicationUtils.check_path_existence(fpath_from):
+    def _read_ifd(data: mmap.mmap, offset: int, order: str, bigtiff: bool) -> Tuple[dict, int]:
+        """ Values of known tags of IFD at offset and offset of the next IFD. """
+        (count_format, entry_format, offset_format) = ('Q', 'HHQ8s', 'Q') if bigtiff else ('H', 'HHI4s', 'I')
+        (count,) = struct.unpack_from(order + count_format, data, offset)
+        offset += struct.calcsize(count_format)
+        entry_size = struct.calcsize('=' + entry_format)
+        tags = {}
+        for i in range(count):
+            (tag, field_type, value_count, value) = struct.unpack_from(order + entry_format, data,
+                                                                       offset + i * entry_size)
+            item = _TIFF_TYPES.get(field_type)
+            if item is None or tag not in _TIFF_TAGS:
+                continue
+            size = struct.calcsize('=' + item) * value_count
+            if size > len(value):
+                (value_offset,) = struct.unpack(order + offset_format, value)
+                if value_offset + size > len(data):
+                    raise ValueError('tag {0} points beyond the end of file'.format(tag))
+                value = data[value_offset:value_offset + size]
+            tags[tag] = struct.unpack(order + item * value_count, value[:size])
+        (next_offset,) = struct.unpack_from(order + offset_format, data, offset + count * entry_size)
+        return tags, next_offset
+
+    @staticmethod
+    def read_geotiff_header(fpath: str) -> GeoTiffHeader:
+        """
+        Read GeoTIFF or BigTIFF header: size, tiling, compression, overviews, CRS and bbox.
+
+        Notes:
+        -----
+        The file is memory-mapped and only IFDs and GeoTIFF tags are read, raster data is never touched.
+        Overviews are the following reduced resolution IFDs. bbox and resolution are None if the file is not
+        georeferenced, rotated transformations are not supported. Raises ValueError for corrupt files.
+        """
+
+        with open(fpath, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError('{} is empty'.format(fpath))
+        with data:
+            if data[:2] not in (b'II', b'MM'):
+                raise ValueError('{} is not a tiff'.format(fpath))
+            order = '<' if data[:2] == b'II' else '>'
+            try:
+                (version,) = struct.unpack_from(order + 'H', data, 2)
+                if version == 42:
+                    bigtiff = False
+                    (offset,) = struct.unpack_from(order + 'I', data, 4)
+                elif version == 43:
+                    bigtiff = True
+                    (offset,) = struct.unpack_from(order + 'Q', data, 8)
+                else:
+                    raise ValueError('{0} has unknown tiff version {1}'.format(fpath, version))
+
+                ifds = []
+                visited = set()
+                while offset and offset not in visited:
+                    visited.add(offset)
+                    (tags, offset) = PublicationUtils._read_ifd(data, offset, order, bigtiff)
+                    ifds.append(tags)
+            except struct.error:
+                raise ValueError('{} is truncated'.format(fpath))
+
+        if not ifds or not {256, 257} <= ifds[0].keys():
+            raise ValueError('{} has no image'.format(fpath))
+        tags = ifds[0]
+        (width, height) = (tags[256][0], tags[257][0])
+        tiled = 322 in tags and 323 in tags
+        block_size = (tags[322][0], tags[323][0]) if tiled else (width, tags.get(278, (height,))[0])
+        # reduced resolution images which are not transparency masks
+        overviews = [(ifd[256][0], ifd[257][0]) for ifd in ifds[1:]
+                     if ifd.get(254, (0,))[0] & 5 == 1 and {256, 257} <= ifd.keys()]
+
+        geo_keys = {}
+        directory = tags.get(34735, ())
+        for i in range(4, len(directory) - 3, 4):
+            if directory[i + 1] == 0:  # value in the key entry, not in another tag
+                geo_keys[directory[i]] = directory[i + 3]
+        epsg = geo_keys.get(3072, geo_keys.get(2048))  # ProjectedCSType, GeographicType
+        if epsg == 32767:  # user defined
+            epsg = None
+
+        bbox = resolution = None
+        if 33550 in tags and 33922 in tags:
+            (scale_x, scale_y) = tags[33550][:2]
+            (i, j, _, x, y, _) = tags[33922][:6]
+            (origin_x, origin_y) = (x - i * scale_x, y + j * scale_y)
+        elif 34264 in tags:
+            matrix = tags[34264]
+            (scale_x, origin_x, scale_y, origin_y) = (matrix[0], matrix[3], -matrix[5], matrix[7])
+        else:
+            scale_x = None
+        if scale_x is not None:
+            if geo_keys.get(1025) == 2:  # PixelIsPoint, origin is the center of the first pixel
+                (origin_x, origin_y) = (origin_x - scale_x / 2, origin_y + scale_y / 2)
+            resolution = (scale_x, scale_y)
+            bbox = (origin_x, origin_y - scale_y * height, origin_x + scale_x * width, origin_y)
+
+        return GeoTiffHeader(
+            width=width,
+            height=height,
+            bands=tags.get(277, (1,))[0],
+            bits_per_sample=tags.get(258, (1,))[0],
+            compression=_TIFF_COMPRESSIONS.get(tags.get(259, (1,))[0], str(tags.get(259, (1,))[0])),
+            tiled=tiled,
+            block_size=block_size,
+            overviews=overviews,
+            epsg=epsg,
+            bbox=bbox,
+            resolution=resolution,
+            bigtiff=bigtiff,
+        )
+
+    @staticmethod
+    def read_world_file(fpath: str, width: int, height: int) -> Optional[Tuple[tuple, tuple]]:
+        """
+        bbox and resolution of a width x height image from world file (.tfw, .tifw or .wld) next to fpath.
+
+        Notes:
+        -----
+        Returns None if there is no world file, it is invalid or the transformation is rotated.
+        """
+
+        base = os.path.splitext(fpath)[0]
+        for extension in ('.tfw', '.tifw', '.wld', '.TFW'):
+            try:
+                with open(base + extension) as f:
+                    (scale_x, rotation_y, rotation_x, scale_y, x, y) = [float(line) for line in f.read().split()[:6]]
+            except (OSError, ValueError):
+                continue
+            if rotation_x or rotation_y or scale_x <= 0 or scale_y >= 0:
+                return None
+            # x, y is the center of the upper left pixel
+            (resolution_x, resolution_y) = (scale_x, -scale_y)
+            (origin_x, origin_y) = (x - resolution_x / 2, y + resolution_y / 2)
+            bbox = (origin_x, origin_y - resolution_y * height, origin_x + resolution_x * width, origin_y)
+            return bbox, (resolution_x, resolution_y)
+        return None
+
+    @staticmethod
+    def check_geotiff(fpath: str, expected: Optional[dict] = None) -> Tuple[Optional[GeoTiffHeader], Optional[str]]:
+        """
+        Header of a georeferenced tiff and None, or None and the reason why the file can not be published.
+
+        Notes:
+        -----
+        expected maps GeoTiffHeader fields to required values, e.g. {'epsg': 4326, 'bands': 3}.
+        Tiffs without GeoTIFF tags are georeferenced by a world file next to them, if there is one.
+        """
+
+        try:
+            header = PublicationUtils.read_geotiff_header(fpath)
+        except (OSError, ValueError) as e:
+            return None, str(e)
+        if header.bbox is None:
+            world = PublicationUtils.read_world_file(fpath, header.width, header.height)
+            if world is not None:
+                header = header._replace(bbox=world[0], resolution=world[1])
+        if header.bbox is None:
+            return None, '{} is not georeferenced'.format(fpath)
+        for field, value in (expected or {}).items():
+            actual = getattr(header, field)
+            if actual != value and not (isinstance(actual, tuple) and list(actual) == value):  # lists of yaml
+                return None, '{0} has {1} {2}, expected {3}'.format(fpath, field, actual, value)
+        return header, None
+
+    @staticmethod
+    def is_optimized_geotiff(header: GeoTiffHeader, overview_levels: Iterable[int] = (2, 4, 8, 16)) -> bool:
+        """ File is internally tiled and has overviews (if any are requested). """
+        return header.tiled and (bool(header.overviews) or not overview_levels)
+
+    @staticmethod
+    def optimize_geotiff(
+            fpath_from: str,
+            fpath_to: str,
+            block_size: int = 512,
+            compression: str = 'deflate',
+            overview_levels: Iterable[int] = (2, 4, 8, 16),
+            resampling: str = 'average',
+    ) -> bool:
+        """
+        Write fpath_from as internally tiled GeoTIFF with internal overviews to fpath_to.
+
+        Notes:
+        -----
+        Requires GDAL. The image is copied block by block into a tiled GeoTIFF under a hidden temp name next to
+        fpath_to, overviews are built in that file (with its compression) and the file is renamed, so no raster is
+        held in memory. Nothing is written if fpath_to exists or fpath_from is already tiled and has overviews,
+        then False is returned and the caller stages the file as is. GDAL errors are raised as RuntimeError
+        without changing the global exception mode of GDAL.
+        """
+
+        if gdal is None:
+            raise ImportError('optimize_geotiff requires GDAL. Install it with: pip install GDAL')
+        if PublicationUtils.check_path_existence(fpath_to):
+            return False
+        header = PublicationUtils.read_geotiff_header(fpath_from)
+        overview_levels = [level for level in overview_levels
+                           if header.width // level >= 1 and header.height // level >= 1]
+        if PublicationUtils.is_optimized_geotiff(header, overview_levels):
             return False
-        shutil.copytree(fpath_from, fpath_to)
+
+        def checked(result, action):
+            # with exceptions enabled GDAL raises itself, otherwise failures are None or non-zero CPLErr
+            if result is None or (isinstance(result, int) and result != 0):
+                raise RuntimeError('{0} failed: {1}'.format(action, gdal.GetLastErrorMsg()))
+            return result
+
+        # scoped exceptions (GDAL >= 3.7), return values are checked either way
+        exceptions = gdal.ExceptionMgr() if hasattr(gdal, 'ExceptionMgr') else contextlib.nullcontext()
+        temp_fpath = PublicationUtils._create_temp_filename(fpath_to)
+        try:
+            with exceptions:
+                source = checked(gdal.Open(fpath_from), 'open ' + fpath_from)
+                output = checked(gdal.GetDriverByName('GTiff').CreateCopy(temp_fpath, source, options=[
+                    'TILED=YES',
+                    'BLOCKXSIZE={}'.format(block_size),
+                    'BLOCKYSIZE={}'.format(block_size),
+                    'COMPRESS={}'.format(compression.upper()),
+                    'BIGTIFF=IF_SAFER',
+                ]), 'copy to ' + temp_fpath)
+                source = output = None  # flush and close datasets
+
+                if overview_levels:
+                    output = checked(gdal.Open(temp_fpath, gdal.GA_Update), 'open ' + temp_fpath)
+                    checked(output.BuildOverviews(resampling.upper(), overview_levels), 'overviews of ' + temp_fpath)
+                    output = None
+            os.replace(temp_fpath, fpath_to)
+        finally:
+            if os.path.lexists(temp_fpath):
+                os.remove(temp_fpath)
         return True
+
+    @staticmethod
+    def write_shapefile_index(fpath: str, records: Iterable[Tuple[str, Tuple[float, float, float, float], datetime]],
+                              epsg: Optional[int] = None) -> int:
+        """
+        Write ImageMosaic index as shapefile fpath.shp/.shx/.dbf with location, footprint and time of granules.
+
+        Notes:
+        -----
+        records are (location, (minx, miny, maxx, maxy), time). Time is stored in dbf timestamp ('@') field,
+        so time attribute keeps hours and minutes. .prj is written for EPSG:4326 only. Returns number of records.
+        """
+
+        records = list(records)
+        shape_records = []
+        for number, (_, (minx, miny, maxx, maxy), _) in enumerate(records, 1):
+            # polygon with one clockwise ring
+            content = struct.pack('<i4d2ii', 5, minx, miny, maxx, maxy, 1, 5, 0) + struct.pack(
+                '<10d', minx, miny, minx, maxy, maxx, maxy, maxx, miny, minx, miny)
+            shape_records.append(struct.pack('>2i', number, len(content) // 2) + content)
+
+        if records:
+            bbox = (min(r[1][0] for r in records), min(r[1][1] for r in records),
+                    max(r[1][2] for r in records), max(r[1][3] for r in records))
+        else:
+            bbox = (0.0, 0.0, 0.0, 0.0)
+
+        def shape_header(length_in_words):
+            return struct.pack('>7i', 9994, 0, 0, 0, 0, 0, length_in_words) + \
+                   struct.pack('<2i4d4d', 1000, 5, *bbox, 0.0, 0.0, 0.0, 0.0)
+
+        with open(fpath + '.shp', 'wb') as shp, open(fpath + '.shx', 'wb') as shx:
+            shp.write(shape_header(50 + sum(len(r) for r in shape_records) // 2))
+            shx.write(shape_header(50 + 4 * len(shape_records)))
+            offset = 50
+            for shape_record in shape_records:
+                shp.write(shape_record)
+                shx.write(struct.pack('>2i', offset, len(shape_record) // 2 - 4))
+                offset += len(shape_record) // 2
+
+        fields = (('location', b'C', 254), ('time', b'@', 8))
+        today = datetime.utcnow()
+        with open(fpath + '.dbf', 'wb') as dbf:
+            dbf.write(struct.pack('<4BIHH20x', 3, today.year - 1900, today.month, today.day, len(records),
+                                  32 + 32 * len(fields) + 1, 1 + sum(length for _, _, length in fields)))
+            for name, field_type, length in fields:
+                dbf.write(struct.pack('<11sc4xBB14x', name.encode(), field_type, length, 0))
+            dbf.write(b'\r')
+            for location, _, granule_time in records:
+                location = location.encode('utf-8')
+                if len(location) > 254:
+                    raise ValueError('location is longer than 254 bytes: {}'.format(location))
+                millis = int((granule_time - datetime(1970, 1, 1)).total_seconds() * 1000)
+                (days, millis_of_day) = divmod(millis, 86400000)
+                dbf.write(b' ' + location.ljust(254) + struct.pack('>2i', days + _JULIAN_DAY_OF_EPOCH, millis_of_day))
+            dbf.write(b'\x1a')
+
+        if epsg == 4326:
+            with open(fpath + '.prj', 'w') as prj:
+                prj.write(WGS84_WKT)
+        return len(records)
+
+    @staticmethod
+    def write_properties(fpath: str, properties: dict) -> None:
+        """ Write java .properties file, e.g. mosaic config. """
+        with open(fpath, 'w') as f:
+            for key, value in properties.items():
+                f.write('{0}={1}\n'.format(key, value))
+
+
+class _ZipStreamOutput:
+    """ Unseekable write-only buffer for zipfile, drained by iter_zip_dir. """
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+class UploadStream:
+    """
+    File-like upload body which reads a file from disk in bounded chunks.
+
+    Attributes
+    ----------
+    fpath : str
+        Path to the file to upload.
+    chunk_size : int
+        Maximum number of bytes held in memory at once.
+    progress : callable, optional
+        Called as progress(bytes_sent, total_bytes, throughput) after every chunk, throughput in bytes per second.
+
+    Notes
+    -----
+    The stream reports its length, so requests sends an explicit Content-Length instead of chunked encoding.
+    tell/seek let urllib3 rewind the body when a request is retried. urllib3 reads the body in blocks of its own
+    size (16 KB), so the file is read in chunks of chunk_size into a buffer which serves these blocks, and
+    progress is called once per chunk.
+    """
+
+    def __init__(self, fpath: str, chunk_size: int = 1024 * 1024, progress: Optional[Callable] = None):
+        self._file = open(fpath, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._chunk_size = chunk_size
+        self._progress = progress
+        self._buffer = b''
+        self._offset = 0
+        self._sent = 0
+        self._started = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self._chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, size: int = -1) -> bytes:
+        """ Read at most size bytes of the current chunk, the next chunk of chunk_size is read from disk if needed. """
+        if size is None or size < 0 or size > self._chunk_size:
+            size = self._chunk_size
+        if self._offset == len(self._buffer):
+            self._buffer = self._file.read(self._chunk_size)
+            self._offset = 0
+        chunk = self._buffer[self._offset:self._offset + size]
+        self._offset += len(chunk)
+        self._sent += len(chunk)
+        if chunk and self._offset == len(self._buffer) and self._progress is not None:
+            elapsed = time.monotonic() - self._started
+            self._progress(self._sent, self._size, self._sent / elapsed if elapsed > 0 else 0.0)
+        return chunk
+
+    def tell(self) -> int:
+        return self._sent
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """ Rewind stream before request retry. """
+        self._sent = self._file.seek(offset, whence)
+        self._buffer = b''
+        self._offset = 0
+        self._started = time.monotonic()
+        return self._sent
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class GranuleStreamParser:
+    """
+    Push parser of granules json (GeoJSON feature collection).
+
+    Notes
+    -----
+    Chunks of the response are fed as they arrive and complete features are returned as (id, location) pairs,
+    only the text of one feature is held in memory at a time.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._in_features = False
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, str]]:
+        """ Feed next chunk, returns granules completed by it. """
+        if self._finished:
+            return []
+        self._buffer += self._text_decoder.decode(chunk)
+
+        if not self._in_features:  # skip everything before the features array
+            start = self._buffer.find('"features"')
+            if start < 0 or self._buffer.find('[', start) < 0:
+                return []
+            self._buffer = self._buffer[self._buffer.find('[', start) + 1:]
+            self._in_features = True
+
+        granules = []
+        while True:
+            self._buffer = self._buffer.lstrip(' \t\r\n,')
+            if self._buffer.startswith(']'):
+                self._finished = True
+                self._buffer = ''
+                return granules
+            try:
+                feature, end = self._decoder.raw_decode(self._buffer)
+            except ValueError:  # feature is not complete yet
+                return granules
+            self._buffer = self._buffer[end:]
+            granules.append((feature['id'], feature['properties']['location']))
+
+    def close(self) -> None:
+        """ Check that the whole features array was parsed. """
+        if self._in_features and not self._finished:
+            raise ValueError('Unexpected end of granules json.')
@@ -0,0 +1,46 @@
+import pytest
+
+from geoserver.Geoserver import Geoserver
+from geoserver.MockGeoserver import MockGeoserver
+from helpers import PRODUCT
+
+
+@pytest.fixture
+def mock():
+    with MockGeoserver() as server:
+        yield server
+
+
+@pytest.fixture
+def geo(mock):
+    # no catalog cache, every call reaches the mock
+    with Geoserver(service_url=mock.service_url, cache_ttl=0, retries=0) as client:
+        yield client
+
+
+@pytest.fixture
+def config(tmp_path, mock):
+    """ Config of PRODUCT with storage in tmp_path and geoserver_config of the mock. """
+    base_init_dir = tmp_path / 'public' / 'base' / 'init'
+    base_init_dir.mkdir(parents=True)
+    (base_init_dir / 'indexer.properties').write_text(
+        'TimeAttribute=time\nSchema=*the_geom:Polygon,location:String,time:java.util.Date\n'
+        'PropertyCollectors=TimestampFileNameExtractorSPI[timeregex](time)\n')
+    (base_init_dir / 'timeregex.properties').write_text('regex=[0-9]{8}_[0-9]{4},format=yyyyMMdd_HHmm\n')
+    return {
+        'storage_config': {'DIR_SAT': str(tmp_path), 'DIR_SAT_RGB': 'rgb', 'DIR_SAT_PUBLIC': 'public'},
+        'geoserver_config': {'service_url': mock.service_url, 'username': 'admin', 'password': 'geoserver',
+                             'session': {'cache_ttl': 0, 'retries': 0}},
+        PRODUCT: {
+            'name': PRODUCT,
+            'dir_source': 'AHI',
+            'init_dir_name': 'init',
+            'storage_dir_name': 'tiff',
+            'base_dir_name': 'base',
+            'sample': 'RGB',
+            'extension': '.tif',
+            'workspace': 'sat',
+            'coveragestore': 'ahi',
+            'readiness_timeout': 5,
+        },
+    }
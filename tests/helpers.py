@@ -0,0 +1,113 @@
+""" Constants and file builders shared by tests, fixtures are in conftest.py. """
+
+import struct
+from typing import Optional, Tuple
+
+PRODUCT = 'AHI_L2_RGB_GEOSERVER'
+
+# struct items of TIFF field types used in headers: SHORT, LONG, DOUBLE
+_TIFF_TYPE_ITEMS = {3: 'H', 4: 'I', 12: 'd'}
+
+
+def pack_ifds(ifds: list, order: str, bigtiff: bool, offset: int) -> bytes:
+    """ IFD chain starting at offset, every IFD is a list of (tag, field type, values). """
+    (count_item, value_item, inline_size) = ('Q', 'Q', 8) if bigtiff else ('H', 'I', 4)
+    data = b''
+    for index, entries in enumerate(ifds):
+        values_offset = offset + struct.calcsize('=' + count_item) + len(entries) * (4 + 2 * inline_size) + \
+                        struct.calcsize('=' + value_item)
+        ifd = struct.pack(order + count_item, len(entries))
+        values = b''
+        for tag, field_type, tag_values in sorted(entries):
+            raw = struct.pack(order + _TIFF_TYPE_ITEMS[field_type] * len(tag_values), *tag_values)
+            ifd += struct.pack(order + 'HH' + value_item, tag, field_type, len(tag_values))
+            if len(raw) <= inline_size:
+                ifd += raw.ljust(inline_size, b'\x00')
+            else:
+                ifd += struct.pack(order + value_item, values_offset + len(values))
+                values += raw
+        offset = values_offset + len(values)
+        ifd += struct.pack(order + value_item, offset if index < len(ifds) - 1 else 0)
+        data += ifd + values
+    return data
+
+
+def create_geotiff(
+        width: int = 256,
+        height: int = 256,
+        bbox: Tuple[float, float, float, float] = (-180.0, -90.0, 180.0, 90.0),
+        epsg: Optional[int] = 4326,
+        bands: int = 1,
+        tile_size: Optional[int] = None,
+        overviews: Tuple[int, ...] = (),
+        bigtiff: bool = False,
+        byteorder: str = '<',
+        pixel_is_point: bool = False,
+        georeferenced: bool = True,
+        data_size: int = 0,
+) -> bytes:
+    """
+    Headers of a GeoTIFF followed by data_size zero bytes.
+
+    Notes
+    -----
+    overviews are decimation factors of reduced resolution IFDs. There are no strip or tile offsets,
+    so only header readers can open the file, not GDAL.
+    """
+
+    scale = ((bbox[2] - bbox[0]) / width, (bbox[3] - bbox[1]) / height)
+
+    def image_entries(image_width, image_height):
+        entries = [(256, 4, [image_width]), (257, 4, [image_height]), (258, 3, [8] * bands), (259, 3, [1]),
+                   (277, 3, [bands])]
+        if tile_size:
+            entries += [(322, 3, [tile_size]), (323, 3, [tile_size])]
+        else:
+            entries.append((278, 4, [image_height]))
+        return entries
+
+    main = image_entries(width, height)
+    if georeferenced:
+        (x, y) = (bbox[0], bbox[3])
+        if pixel_is_point:
+            (x, y) = (x + scale[0] / 2, y - scale[1] / 2)
+        geographic = epsg is not None and 4000 <= epsg < 5000
+        geo_keys = [(1024, 2 if geographic else 1), (1025, 2 if pixel_is_point else 1)]
+        if epsg is not None:
+            geo_keys.append((2048 if geographic else 3072, epsg))
+        main += [
+            (33550, 12, [scale[0], scale[1], 0.0]),
+            (33922, 12, [0.0, 0.0, 0.0, x, y, 0.0]),
+            (34735, 3, [1, 1, 0, len(geo_keys)] + [item for key, value in geo_keys for item in (key, 0, 1, value)]),
+        ]
+    ifds = [main] + [[(254, 4, [1])] + image_entries(max(1, width // factor), max(1, height // factor))
+                     for factor in overviews]
+
+    marker = b'II' if byteorder == '<' else b'MM'
+    if bigtiff:
+        header = marker + struct.pack(byteorder + 'HHHQ', 43, 8, 0, 16)
+    else:
+        header = marker + struct.pack(byteorder + 'HI', 42, 8)
+    return header + pack_ifds(ifds, byteorder, bigtiff, len(header)) + bytes(data_size)
+
+
+def write_gdal_geotiff(path: str, width: int, height: int) -> None:
+    """ Striped EPSG:4326 GeoTIFF with 0.05 degree pixels from (100, 30), written by GDAL with raster data. """
+    from osgeo import gdal, osr
+
+    dataset = gdal.GetDriverByName('GTiff').Create(path, width, height, 1, gdal.GDT_Byte)
+    dataset.SetGeoTransform((100.0, 0.05, 0.0, 30.0, 0.0, -0.05))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    dataset.SetProjection(srs.ExportToWkt())
+    dataset.GetRasterBand(1).Fill(7)
+    dataset.FlushCache()
+
+
+def write_source_files(root, slots, payload: Optional[bytes] = None) -> None:
+    """ Source tree of slots as <root>/rgb/AHI/YYYY/MM/DD/HHMM/AHI_YYYYMMDD_HHMM_RGB.tif. """
+    for (_, year, month, day, dtime) in slots:
+        slot_dir = root / 'rgb' / 'AHI' / year / month / day / dtime
+        slot_dir.mkdir(parents=True, exist_ok=True)
+        (slot_dir / 'AHI_{0}{1}{2}_{3}_RGB.tif'.format(year, month, day, dtime)).write_bytes(
+            create_geotiff(64, 32) if payload is None else payload)
@@ -0,0 +1,178 @@
+import asyncio
+import time
+import zipfile
+
+import pytest
+
+from geoserver.AsyncGeoserver import AsyncGeoserver
+
+pytest.importorskip('aiohttp')
+
+
+def run(mock, test, **kwargs):
+    """ Run test(geo) in a new event loop with a client of the mock. """
+
+    async def main():
+        async with AsyncGeoserver(service_url=mock.service_url, **kwargs) as geo:
+            return await test(geo)
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def store_zip(tmp_path):
+    path = tmp_path / 'store.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('AHI_20210709_0000_RGB.tif', b'II*\x00' + bytes(60))
+    return str(path)
+
+
+def test_workspaces_and_coveragestores(mock, store_zip):
+    async def test(geo):
+        created = await geo.create_workspace('sat')
+        store = await geo.create_coveragestore(store_zip, workspace='sat', coveragestore_name='ahi')
+        return created, store, await geo.get_workspaces(), await geo.get_coveragestores('sat')
+
+    (created, store, workspaces, stores) = run(mock, test)
+
+    assert created.startswith('Workspace sat created')
+    assert store.startswith('Coveragestore ahi is created')
+    assert workspaces == [{'name': 'sat'}]
+    assert stores == [{'name': 'ahi'}]
+
+
+def test_granules(mock):
+    mock.add_granules('ws', 'store', 12)
+
+    async def test(geo):
+        granules = [granule async for granule in geo.iter_granules_from_coveragestore('ws', 'store', page_size=5)]
+        filtered = await geo.get_granules_from_coveragestore('ws', 'store', cql_filter='time >= 2021-01-01T01:00:00Z')
+        deleted = await geo.delete_granula_from_coveragestore('ws', 'store', granules[0][0])
+        return granules, filtered, deleted
+
+    (granules, filtered, deleted) = run(mock, test)
+
+    assert len(granules) == 12
+    assert len(filtered) == 6
+    assert deleted.startswith('Granula "{0}" deleted'.format(granules[0][0]))
+    assert mock.granule_count('ws', 'store') == 11
+
+
+def test_requests_can_be_made_while_iterating_with_one_connection(mock):
+    mock.add_granules('ws', 'store', 7)
+
+    async def test(geo):
+        granules = []
+        async for granule in geo.iter_granules_from_coveragestore('ws', 'store', page_size=3):
+            granules.append(granule)
+            await geo.get_workspaces()  # needs the only semaphore slot while the iterator is suspended
+        return granules
+
+    async def with_timeout(geo):
+        return await asyncio.wait_for(test(geo), timeout=5)
+
+    granules = run(mock, with_timeout, concurrency=1)
+
+    assert len(granules) == 7
+    assert mock.stats()['requests_total'] == 3 + 7  # 3 pages and a request per granule
+
+
+def test_publish_files(mock, tmp_path):
+    paths = []
+    for dtime in ('0000', '0010', '0020'):
+        path = tmp_path / 'AHI_20210709_{0}_RGB.tif'.format(dtime)
+        path.write_bytes(b'II*\x00' + bytes(60))
+        paths.append(str(path))
+
+    async def test(geo):
+        return await geo.publish_files_to_coveragestore(paths + [str(tmp_path / 'missing.tif')], 'ahi', 'sat')
+
+    results = run(mock, test)
+
+    assert all(result.startswith('Published') for result in results[:3])
+    assert results[3].startswith('Can not publish it. This path not exists')
+    assert mock.granule_count('sat', 'ahi') == 3
+
+
+def test_time_dimension_and_gwc_layer(mock, store_zip):
+    async def test(geo):
+        await geo.create_coveragestore(store_zip, workspace='sat', coveragestore_name='ahi')
+        dimension = await geo.publish_time_dimension_to_coveragestore('sat', 'ahi')
+        timecache = await geo.publish_timecahe_file_to_coveragestore('ahi', 'sat', start_time='2021-07-09T00:00:00Z',
+                                                                      metatile=(2, 2))
+        return dimension, timecache, await geo.get_layers('sat')
+
+    (dimension, timecache, layers) = run(mock, test)
+
+    assert dimension.startswith('Time dimension is published')
+    assert timecache.startswith('Timecache file is published')
+    assert layers == {'layers': {'layer': [{'name': 'sat:ahi'}]}}
+
+
+def test_gwc_layer_id_is_cached_and_refreshed(mock, store_zip):
+    async def test(geo):
+        await geo.create_coveragestore(store_zip, workspace='sat', coveragestore_name='ahi')
+        first = await geo.publish_timecahe_file_to_coveragestore('ahi', 'sat')
+        mock._gwc_layers['sat:ahi'] = 'LayerInfoImpl--recreated'  # layer recreated by someone else
+        second = await geo.publish_timecahe_file_to_coveragestore('ahi', 'sat')
+        return first, second, geo._layer_ids
+
+    mock.reset_stats()
+    (first, second, layer_ids) = run(mock, test)
+
+    assert first.startswith('Timecache file is published')
+    assert second.startswith('Timecache file is published')
+    assert layer_ids == {('sat', 'ahi'): 'LayerInfoImpl--recreated'}
+    requests = mock.stats()['requests']
+    assert sum(count for (method, _), count in requests.items() if method == 'GET') == 2
+    assert sum(count for (method, _), count in requests.items() if method == 'PUT') == 4  # store + 3 layer configs
+
+
+def test_gwc_layer_of_missing_layer_is_error(mock):
+    async def test(geo):
+        return await geo.publish_timecahe_file_to_coveragestore('missing', 'sat')
+
+    assert run(mock, test) == 'Can not publish. Layer sat:missing not found.'
+
+
+def test_gwc_layer_is_error_when_server_is_down(mock):
+    mock.stop()
+
+    async def test(geo):
+        return await geo.publish_timecahe_file_to_coveragestore('ahi', 'sat')
+
+    assert run(mock, test).startswith('Can not publish.')
+
+
+def test_concurrency_is_limited_by_semaphore(mock):
+    mock.add_granules('ws', 'store', 1)
+    mock.latency = 0.1
+
+    async def test(geo):
+        started = time.monotonic()
+        results = await asyncio.gather(*(geo.get_granules_from_coveragestore('ws', 'store') for _ in range(6)))
+        return results, time.monotonic() - started
+
+    (results, elapsed) = run(mock, test, concurrency=2)
+
+    assert all(len(result) == 1 for result in results)
+    assert elapsed >= 0.3  # 3 rounds of 2 requests
+
+
+def test_cancellation_releases_semaphore(mock):
+    mock.add_granules('ws', 'store', 1)
+    mock.latency = 1.0
+
+    async def test(geo):
+        task = asyncio.ensure_future(geo.get_granules_from_coveragestore('ws', 'store'))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        mock.latency = 0.0
+        return geo._semaphore.locked(), await geo.get_granules_from_coveragestore('ws', 'store')
+
+    (locked, granules) = run(mock, test, concurrency=1)
+
+    assert not locked
+    assert len(granules) == 1
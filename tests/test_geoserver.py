@@ -0,0 +1,400 @@
+import json
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+from geoserver.Geoserver import Geoserver
+from geoserver.MockGeoserver import MockGeoserver
+from geoserver.utils import UploadStream
+
+
+def count_requests(mock, method: str, path_suffix: str) -> int:
+    return sum(count for (request_method, path), count in mock.stats()['requests'].items()
+               if request_method == method and path.endswith(path_suffix))
+
+
+def test_requests_share_one_keep_alive_connection(mock, geo):
+    geo.create_workspace('sat')
+    for _ in range(5):
+        assert geo.get_workspaces() == [{'name': 'sat'}]
+
+    assert mock.stats()['requests_total'] == 6
+    assert mock.stats()['connections'] == 1
+
+
+def test_connection_is_closed_after_every_request_without_keep_alive(mock):
+    with Geoserver(service_url=mock.service_url, keep_alive=False, cache_ttl=0, retries=0) as geo:
+        for _ in range(3):
+            geo.get_workspaces()
+
+    assert mock.stats()['connections'] == 3
+
+
+def test_retry_policy():
+    with Geoserver(retries=4, backoff_factor=0.1) as geo:
+        retry = geo._session.get_adapter('http://127.0.0.1').max_retries
+
+    assert (retry.total, retry.connect, retry.read, retry.status) == (4, 4, 4, 4)
+    assert retry.backoff_factor == 0.1
+    assert set(retry.status_forcelist) == {500, 502, 503, 504}
+    assert 'POST' not in retry.allowed_methods
+
+
+def test_idempotent_requests_are_retried_on_server_errors(mock):
+    mock.error_rate = 1.0
+
+    with Geoserver(service_url=mock.service_url, retries=2, backoff_factor=0) as geo:
+        assert geo.get_workspaces().startswith('Can not get workspaces')
+        geo.create_workspace('sat')
+
+    assert count_requests(mock, 'GET', '/rest/workspaces') == 3
+    assert count_requests(mock, 'POST', '/rest/workspaces') == 1  # harvests and creates are never sent twice
+
+
+def write_store_zip(tmp_path, size: int = 100000) -> str:
+    path = tmp_path / 'store.zip'
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr('AHI_20210709_0000_RGB.tif', bytes(range(256)) * (size // 256))
+    return str(path)
+
+
+def test_upload_stream_reads_bounded_chunks_and_rewinds(tmp_path):
+    data = bytes(range(256)) * 40
+    (tmp_path / 'data.bin').write_bytes(data)
+    progress = []
+
+    with UploadStream(str(tmp_path / 'data.bin'), chunk_size=4096,
+                      progress=lambda sent, total, _: progress.append((sent, total))) as stream:
+        assert len(stream) == 10240
+        assert stream.read(1024 * 1024) == data[:4096]
+        assert stream.tell() == 4096
+        assert b''.join(stream) == data[4096:]
+        assert stream.seek(0) == 0
+        assert stream.read(100) == data[:100]
+        assert stream.read(8192) == data[100:4096]  # rest of the chunk read from disk
+
+    assert progress == [(4096, 10240), (8192, 10240), (10240, 10240), (4096, 10240)]
+
+
+def test_upload_progress_is_reported_per_chunk(mock, geo, tmp_path):
+    path = write_store_zip(tmp_path, size=3 * 1024 * 1024)
+    size = os.path.getsize(path)
+    progress = []
+
+    result = geo.create_coveragestore(path, workspace='sat', coveragestore_name='ahi', chunk_size=1024 * 1024,
+                                      progress=lambda sent, total, _: progress.append((sent, total)))
+
+    assert result.startswith('Coveragestore ahi is created')
+    # once per chunk read from disk, not once per block written by urllib3
+    assert progress == [(min(n * 1024 * 1024, size), size) for n in (1, 2, 3, 4)]
+    assert mock.stats()['bytes_received'] == size
+
+
+def test_create_coveragestore_streams_zip(mock, geo, tmp_path):
+    path = write_store_zip(tmp_path)
+    progress = []
+
+    result = geo.create_coveragestore(path, workspace='sat', coveragestore_name='ahi',
+                                      progress=lambda sent, total, _: progress.append((sent, total)))
+
+    assert result.startswith('Coveragestore ahi is created')
+    assert progress[-1] == (os.path.getsize(path), os.path.getsize(path))
+    assert mock.stats()['bytes_received'] == os.path.getsize(path)
+    assert mock.granule_count('sat', 'ahi') == 1
+
+
+def test_zip_upload_is_rewound_on_retry(mock, tmp_path):
+    path = write_store_zip(tmp_path)
+    mock.error_rate = 1.0
+
+    with Geoserver(service_url=mock.service_url, retries=2, backoff_factor=0) as geo:
+        geo.create_coveragestore(path, workspace='sat', coveragestore_name='ahi')
+
+    assert count_requests(mock, 'PUT', '/file.imagemosaic') == 3
+    assert mock.stats()['bytes_received'] == 3 * os.path.getsize(path)  # every attempt sends the whole zip
+
+
+def test_iter_granules_pages_index(mock, geo):
+    mock.add_granules('ws', 'store', 25)
+
+    granules = list(geo.iter_granules_from_coveragestore('ws', 'store', page_size=10))
+
+    assert len(granules) == 25
+    assert len({granule_id for granule_id, _ in granules}) == 25
+    assert granules[0][1] == '/mock/store/store_20210101_0000_rgb.tif'
+    assert count_requests(mock, 'GET', '/index/granules.json') == 3  # 10 + 10 + 5
+
+
+def test_iter_granules_with_filter(mock, geo):
+    mock.add_granules('ws', 'store', 12)
+
+    granules = list(geo.iter_granules_from_coveragestore(
+        'ws', 'store', cql_filter='time >= 2021-01-01T01:00:00Z', page_size=4))
+
+    assert [location.rsplit('_', 2)[-2] for _, location in granules] == ['0100', '0110', '0120', '0130', '0140', '0150']
+
+
+def test_get_granules_with_filter_offset_and_limit(mock, geo):
+    mock.add_granules('ws', 'store', 12)
+
+    granules = geo.get_granules_from_coveragestore('ws', 'store', cql_filter='time < 2021-01-01T01:00:00Z',
+                                                   offset=1, limit=4)
+
+    assert sorted(location.rsplit('/', 1)[-1] for location in granules.values()) == [
+        'store_20210101_0010_rgb.tif', 'store_20210101_0020_rgb.tif', 'store_20210101_0030_rgb.tif',
+        'store_20210101_0040_rgb.tif']
+    assert len(geo.get_granules_from_coveragestore('ws', 'store')) == 12
+
+
+def test_granules_json_is_parsed_across_chunk_boundaries(geo):
+    text = json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': 'ahi.{}'.format(i), 'properties': {'location': '/data/ÄHI_{}.tif'.format(i)}}
+        for i in range(3)]})
+    data = text.encode()
+
+    granules = list(geo._iter_granules_from_stream(data[i:i + 1] for i in range(len(data))))
+
+    assert granules == [('ahi.{}'.format(i), '/data/ÄHI_{}.tif'.format(i)) for i in range(3)]
+    assert list(geo._iter_granules_from_stream([b'{"type": "FeatureCollection", "features": []}'])) == []
+    with pytest.raises(ValueError, match='Unexpected end'):
+        list(geo._iter_granules_from_stream([data[:len(data) // 2]]))
+
+
+def test_catalog_is_cached_and_invalidated_on_create_and_delete(mock, tmp_path):
+    with Geoserver(service_url=mock.service_url, retries=0) as geo:
+        assert geo.get_workspaces() == []
+        geo.create_workspace('sat')
+        assert geo.get_workspaces() == geo.get_workspaces() == [{'name': 'sat'}]
+        assert geo.get_coveragestores('sat') == []
+        geo.create_coveragestore(write_store_zip(tmp_path), workspace='sat', coveragestore_name='ahi')
+        assert geo.get_coveragestores('sat') == geo.get_coveragestores('sat') == [{'name': 'ahi'}]
+        geo.delete_coveragesotre('ahi', 'sat')
+        assert geo.get_coveragestores('sat') == []
+
+    assert count_requests(mock, 'GET', '/rest/workspaces') == 2
+    assert count_requests(mock, 'GET', '/rest/workspaces/{}/coveragestores') == 3
+
+
+def test_catalog_cache_expires(mock):
+    mock.add_granules('sat', 'ahi', 1)
+
+    with Geoserver(service_url=mock.service_url, retries=0, cache_ttl=0.2) as geo:
+        assert geo.get_layers('sat') == geo.get_layers('sat') == {'layers': {'layer': [{'name': 'sat:ahi'}]}}
+        time.sleep(0.25)
+        geo.get_layers('sat')
+
+    assert count_requests(mock, 'GET', '/rest/workspaces/{}/layers') == 2
+
+
+def test_errors_are_not_cached_and_cache_can_be_dropped(mock):
+    with Geoserver(service_url=mock.service_url, retries=0) as geo:
+        mock.error_rate = 1.0
+        assert geo.get_workspaces().startswith('Can not get workspaces')
+        mock.error_rate = 0.0
+        assert geo.get_workspaces() == []
+        mock.add_granules('sat', 'ahi', 1)
+        assert geo.get_workspaces() == []  # cached
+        geo.invalidate_cache(('coveragestores',))
+        assert geo.get_workspaces() == []
+        geo.invalidate_cache(('workspaces',))
+        assert geo.get_workspaces() == [{'name': 'sat'}]
+
+
+def test_publish_files_returns_results_in_order(mock, geo, tmp_path):
+    mock.add_granules('sat', 'ahi', 0)
+    mock.latency = 0.01
+    paths = []
+    for dtime in ('0000', '0010', '0020', '0030', '0040'):
+        path = tmp_path / 'AHI_20210709_{0}_RGB.tif'.format(dtime)
+        path.write_bytes(b'II*\x00')
+        paths.append(str(path))
+    paths.insert(2, str(tmp_path / 'missing.tif'))
+
+    results = geo.publish_files_to_coveragestore(paths, 'ahi', 'sat', max_workers=3)
+
+    assert [result.split('.')[0] for result in results] == [
+        'Published', 'Published', 'Can not publish it', 'Published', 'Published', 'Published']
+    assert mock.granule_count('sat', 'ahi') == 5
+
+
+def test_publish_files_bounds_paths_taken_ahead_when_workers_fail(monkeypatch, mock):
+    lock = threading.Lock()
+    counts = {'taken': 0, 'finished': 0, 'running': 0, 'max_running': 0, 'max_ahead': 0}
+
+    def publish_file_to_coveragestore(path, **kwargs):
+        with lock:
+            counts['running'] += 1
+            counts['max_running'] = max(counts['max_running'], counts['running'])
+        time.sleep(0.01)
+        with lock:
+            counts['running'] -= 1
+            counts['finished'] += 1
+        raise RuntimeError('worker failed on {}'.format(path))
+
+    def paths():
+        for i in range(20):
+            with lock:
+                counts['taken'] += 1
+                counts['max_ahead'] = max(counts['max_ahead'], counts['taken'] - counts['finished'])
+            yield '/data/{}.tif'.format(i)
+
+    with Geoserver(service_url=mock.service_url, retries=0, store_concurrency=2) as geo:
+        monkeypatch.setattr(geo, 'publish_file_to_coveragestore', publish_file_to_coveragestore)
+        results = geo.publish_files_to_coveragestore(paths(), 'ahi', 'sat', max_workers=3)
+
+    assert results == ['Can not publish it. worker failed on /data/{}.tif.'.format(i) for i in range(20)]
+    assert counts['max_ahead'] <= 7  # 2 * max_workers submitted and one waiting for a free slot
+    assert counts['max_running'] <= 2  # store_concurrency
+
+
+def test_wait_for_returns_as_soon_as_check_passes(geo):
+    calls = []
+
+    assert geo.wait_for(lambda: calls.append(time.monotonic()) or len(calls) == 3, timeout=5, initial_delay=0.01)
+    assert len(calls) == 3
+
+
+def test_wait_for_times_out_with_backoff(geo):
+    calls = []
+    started = time.monotonic()
+
+    assert not geo.wait_for(lambda: calls.append(time.monotonic() - started) and False, timeout=0.3,
+                            initial_delay=0.02, max_delay=0.08, factor=2)
+
+    assert 0.3 <= time.monotonic() - started < 0.45
+    delays = [later - earlier for earlier, later in zip(calls, calls[1:])]
+    for delay, expected in zip(delays, [0.02, 0.04, 0.08, 0.08]):  # doubled up to max_delay
+        assert expected <= delay < expected + 0.02
+    assert calls[-1] >= 0.3  # the last check is made at the deadline
+
+
+def test_wait_for_catalog_resources(mock, geo):
+    mock.add_granules('sat', 'ahi', 1)
+
+    assert geo.wait_for_workspace('sat', timeout=1)
+    assert geo.wait_for_coveragestore('sat', 'ahi', timeout=1)
+    assert geo.wait_for_coverage('sat', 'ahi', timeout=1)
+    assert not geo.wait_for_workspace('missing', timeout=0.1)
+    assert not geo.wait_for_gwc_layer('sat', 'missing', timeout=0.1)
+
+
+def test_delete_granules_by_filter(mock, geo):
+    mock.add_granules('ws', 'store', 12)
+
+    result = geo.delete_granules_from_coveragestore('ws', 'store', cql_filter='time < 2021-01-01T01:00:00Z')
+
+    assert result.startswith('Granules deleted')
+    assert mock.granule_count('ws', 'store') == 6
+
+
+def test_delete_granules_by_locations_in_batches(mock, geo):
+    mock.add_granules('ws', 'store', 12)
+    locations = sorted(geo.get_granules_from_coveragestore('ws', 'store').values())[:7]
+    locations[0] = locations[0].replace('store_', "o'store_")  # quotes are escaped
+    mock.reset_stats()
+
+    results = geo.delete_granules_by_locations('ws', 'store', locations, batch_size=3)
+
+    assert len(results) == 3
+    assert all(result.startswith('Granules deleted') for result in results)
+    assert count_requests(mock, 'DELETE', '/index/granules') == 3
+    assert mock.granule_count('ws', 'store') == 6
+    assert not set(locations) & set(geo.get_granules_from_coveragestore('ws', 'store').values())
+
+
+def test_gwc_layer_id_is_cached_until_layer_changes(mock, geo, tmp_path):
+    geo.create_coveragestore(write_store_zip(tmp_path), workspace='sat', coveragestore_name='ahi')
+
+    for _ in range(3):
+        assert geo.publish_timecahe_file_to_coveragestore('ahi', 'sat').startswith('Timecache file is published')
+    assert count_requests(mock, 'GET', '/gwc/rest/layers/{}') == 1
+    assert count_requests(mock, 'PUT', '/gwc/rest/layers/{}.xml') == 3
+
+    mock._gwc_layers['sat:ahi'] = 'LayerInfoImpl--recreated'  # the layer is recreated by someone else
+    assert geo.publish_timecahe_file_to_coveragestore('ahi', 'sat').startswith('Timecache file is published')
+    assert count_requests(mock, 'GET', '/gwc/rest/layers/{}') == 2
+    assert count_requests(mock, 'PUT', '/gwc/rest/layers/{}.xml') == 5
+
+    geo.delete_coveragesotre('ahi', 'sat')
+    assert geo._cache_get(('layer_id', 'sat', 'ahi')) is None
+
+
+
+def test_gwc_layer_errors_are_returned(monkeypatch, mock, geo, tmp_path):
+    assert geo.publish_timecahe_file_to_coveragestore('ahi', 'sat') == 'Can not publish. Layer sat:ahi not found.'
+
+    geo.create_coveragestore(write_store_zip(tmp_path), workspace='sat', coveragestore_name='ahi')
+    monkeypatch.setattr(geo, '_get_layer_id', lambda workspace, coveragestore_name: 'LayerInfoImpl--stale')
+    assert geo.publish_timecahe_file_to_coveragestore('ahi', 'sat') == 'Can not publish. Status code: 400.'
+    assert count_requests(mock, 'PUT', '/gwc/rest/layers/{}.xml') == 2
+
+    with MockGeoserver() as stopped:
+        service_url = stopped.service_url
+    with Geoserver(service_url=service_url, retries=0, timeout=1) as down:
+        assert down.publish_timecahe_file_to_coveragestore('ahi', 'sat').startswith('Can not publish. ')
+
+def test_update_gwc_layers(mock, geo, tmp_path):
+    layers = [('sat', 'ahi'), ('sat', 'abi'), ('sat', 'seviri')]
+    for workspace, coveragestore_name in layers:
+        geo.create_coveragestore(write_store_zip(tmp_path), workspace=workspace, coveragestore_name=coveragestore_name)
+
+    results = geo.update_gwc_layers(layers, max_workers=2, metatile=(2, 2), content_type='application/json')
+
+    assert list(results) == layers
+    assert all(result.startswith('Timecache file is published') for result in results.values())
+    assert count_requests(mock, 'PUT', '.json') == 3
+
+
+
+def test_seed_and_truncate_time_value(mock, geo):
+    seed = geo.seed_layer('sat', 'ahi', time_value='2021-07-09T00:00:00.000Z', bbox=(100, -10, 120, 10),
+                          zoom_stop=3, threads=8, parameters={'STYLES': 'rgb'})
+    truncate = geo.truncate_layer('sat', 'ahi', time_value='2021-07-09T00:00:00.000Z')
+
+    assert seed.startswith('Seed task started')
+    assert truncate.startswith('Truncate task started')
+    (seed_request, truncate_request) = [request['seedRequest'] for request in mock.seed_requests()]
+    assert seed_request == {
+        'name': 'sat:ahi', 'srs': {'number': 4326}, 'zoomStart': 0, 'zoomStop': 3, 'format': 'image/png',
+        'type': 'seed', 'threadCount': 4, 'gridSetId': 'EPSG:4326',  # threads are capped by max_seed_threads
+        'bounds': {'coords': {'double': [100, -10, 120, 10]}},
+        'parameters': {'entry': [{'string': ['STYLES', 'rgb']}, {'string': ['TIME', '2021-07-09T00:00:00.000Z']}]},
+    }
+    assert (truncate_request['type'], truncate_request['threadCount']) == ('truncate', 1)
+    assert geo.get_seed_tasks('sat', 'ahi') == []
+    assert geo.wait_for_seed('sat', 'ahi', timeout=1)
+
+
+def test_seed_waits_for_free_seeding_threads(monkeypatch, mock, geo):
+    running = {'task_id': 1, 'status': 1, 'tiles_done': 0, 'tiles_total': 10, 'time_remaining': 5}
+    tasks = [[running] * 3, [running] * 2]
+    monkeypatch.setattr(geo, 'get_seed_tasks', lambda *args: tasks.pop(0) if tasks else [])
+    monkeypatch.setattr(geo, 'wait_for', lambda check, **kwargs: any(check() for _ in range(10)))
+
+    assert geo.seed_layer('sat', 'ahi', threads=2).startswith('Seed task started')
+
+    assert tasks == []  # the task is started once 2 of 4 seeding threads are free
+    assert len(mock.seed_requests()) == 1
+
+
+def test_seed_errors_are_returned_when_server_is_down():
+    with MockGeoserver() as mock:
+        service_url = mock.service_url
+    with Geoserver(service_url=service_url, retries=0, timeout=1) as geo:
+        assert geo.get_seed_tasks('ws', 'store').startswith('Can not get seed tasks')
+        assert geo.truncate_layer('ws', 'store').startswith('Can not start truncate task')
+        assert geo.seed_layer('ws', 'store', timeout=0).startswith('Can not start seed task')
+
+
+def test_delete_granules_errors_are_returned(mock, geo):
+    assert geo.delete_granules_from_coveragestore(
+        'missing', 'store', cql_filter='time < 2021-01-01T00:00:00Z').startswith('Can not delete granules')
+
+    with MockGeoserver() as stopped:
+        service_url = stopped.service_url
+    with Geoserver(service_url=service_url, retries=0, timeout=1) as down:
+        (result,) = down.delete_granules_by_locations('ws', 'store', ['/data/a.tif'])
+    assert result.startswith('Can not delete granules')
@@ -0,0 +1,79 @@
+import threading
+
+from geoserver.GranuleIndex import GranuleIndex
+
+
+def granule_queries(mock) -> int:
+    return mock.stats()['requests'].get(('GET', '/geoserver/rest/workspaces/{}/coveragestores/{}/coverages/{}'
+                                                '/index/granules.json'), 0)
+
+
+def test_index_is_downloaded_once(mock, geo):
+    mock.add_granules('ws', 'store', 3)
+    index = GranuleIndex(geo, 'ws', 'store')
+
+    assert 'store_20210101_0010_rgb.tif' in index
+    assert 'store_20210101_0030_rgb.tif' not in index
+    assert len(index) == 3
+    assert granule_queries(mock) == 1
+
+
+
+def test_concurrent_lookups_download_index_once(mock, geo):
+    mock.add_granules('ws', 'store', 3)
+    mock.latency = 0.2
+    index = GranuleIndex(geo, 'ws', 'store')
+    results = []
+    threads = [threading.Thread(target=lambda: results.append('store_20210101_0010_rgb.tif' in index))
+               for _ in range(4)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 4
+    assert granule_queries(mock) == 1
+
+def test_unknown_name_is_synced_from_slot_time(mock, geo):
+    mock.add_granules('ws', 'store', 3)
+    index = GranuleIndex(geo, 'ws', 'store', max_age=0)
+    assert len(index) == 3
+    mock.add_granules('ws', 'store', 6)  # 3 new slots and the same 3 again
+
+    assert index.contains('store_20210101_0040_rgb.tif', since='2021-01-01T00:30:00Z')
+    assert not GranuleIndex(geo, 'ws', 'store', max_age=3600).contains('store_20210101_0100_rgb.tif',
+                                                                        since='2021-01-01T00:30:00Z')
+    assert len(index) == 6
+    assert granule_queries(mock) == 3  # download, delta query, download of the second index
+
+
+def test_own_changes_do_not_query(mock, geo):
+    mock.add_granules('ws', 'store', 0)
+    index = GranuleIndex(geo, 'ws', 'store')
+    assert len(index) == 0
+    mock.reset_stats()
+
+    index.add('a.tif')
+    index.add('b.tif')
+    index.discard('a.tif')
+
+    assert 'b.tif' in index and 'a.tif' not in index
+    assert mock.stats()['requests_total'] == 0
+
+
+def test_index_is_persisted(mock, geo, tmp_path):
+    mock.add_granules('ws', 'store', 2)
+    path = str(tmp_path / 'granules.sqlite')
+    index = GranuleIndex(geo, 'ws', 'store', path=path)
+    assert len(index) == 2
+    index.add('own.tif')
+    index.close()
+    mock.reset_stats()
+
+    index = GranuleIndex(geo, 'ws', 'store', path=path)
+    assert len(index) == 3
+    assert mock.stats()['requests_total'] == 0
+    index.clear()
+    assert len(index) == 2  # downloaded again
+    index.close()
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from geoserver.IngestQueue import IngestJob, IngestQueue
+
+SLOTS = [('AHI', '2021', '07', '09', dtime) for dtime in ('0000', '0010', '0020')]
+
+
+def granule(args) -> str:
+    return 'AHI_{1}{2}{3}_{4}_RGB.tif'.format(*args)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    ingest_queue = IngestQueue(str(tmp_path / 'queue.sqlite'), max_attempts=3, backoff=10)
+    yield ingest_queue
+    ingest_queue.close()
+
+
+def test_granules_are_queued_once(queue):
+    assert [queue.put(args, granule(args)) for args in SLOTS] == [True, True, True]
+    assert not queue.put(SLOTS[0], granule(SLOTS[0]))
+
+    assert len(queue) == 3
+    assert queue.counts() == {'pending': 3, 'staged': 0, 'published': 0, 'verified': 0, 'failed': 0}
+
+
+def test_oldest_due_jobs_are_claimed_once(queue):
+    for args in reversed(SLOTS):
+        queue.put(args, granule(args))
+
+    assert queue.claim(limit=2) == [IngestJob(granule(args), args, 'pending', 0) for args in SLOTS[:2]]
+    assert [job.args for job in queue.claim(limit=2)] == [SLOTS[2]]
+    assert queue.claim() == []
+    queue.release(granule(SLOTS[1]))
+    assert [job.args for job in queue.claim()] == [SLOTS[1]]
+
+
+def test_jobs_resume_from_recorded_state_after_restart(tmp_path, queue):
+    for args in SLOTS:
+        queue.put(args, granule(args))
+    (first, second, third) = queue.claim(limit=3)
+    queue.set_state(first.granule, 'verified')
+    queue.set_state(second.granule, 'staged')
+    queue.set_state(third.granule, 'published')
+    queue.close()  # the process stops with claimed jobs
+
+    reopened = IngestQueue(str(tmp_path / 'queue.sqlite'))
+    try:
+        assert [(job.granule, job.state) for job in reopened.claim(limit=3)] == [
+            (second.granule, 'staged'), (third.granule, 'published')]
+        assert len(reopened) == 2
+    finally:
+        reopened.close()
+
+
+def test_unknown_state_is_rejected(queue):
+    queue.put(SLOTS[0], granule(SLOTS[0]))
+
+    with pytest.raises(ValueError, match='state must be one of'):
+        queue.set_state(granule(SLOTS[0]), 'done')
+
+
+def test_failed_attempts_back_off_until_max_attempts(queue, clock):
+    queue.put(SLOTS[0], granule(SLOTS[0]))
+    queue.claim()
+    queue.set_state(granule(SLOTS[0]), 'published')
+
+    assert queue.fail(granule(SLOTS[0]), 'file creation error', state='staged') == 'staged'
+    assert queue.next_attempt_in() == 10
+    assert queue.claim() == []
+    clock[0] += 10
+    assert queue.claim() == [IngestJob(granule(SLOTS[0]), SLOTS[0], 'staged', 1)]
+
+    assert queue.fail(granule(SLOTS[0]), 'timeout') == 'staged'
+    assert queue.next_attempt_in() == 20  # doubled with every attempt
+    clock[0] += 20
+    queue.claim()
+    assert queue.fail(granule(SLOTS[0]), 'timeout') == 'failed'
+    assert queue.next_attempt_in() is None
+    assert len(queue) == 0
+
+    assert queue.retry_failed() == 1
+    assert queue.claim() == [IngestJob(granule(SLOTS[0]), SLOTS[0], 'pending', 0)]
@@ -0,0 +1,172 @@
+import contextlib
+import json
+import time
+
+import pytest
+
+from geoserver.metrics import Histogram, Metrics, get_endpoint, stage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ perf_counter returning the given ticks one by one. """
+    ticks = []
+    monkeypatch.setattr(time, 'perf_counter', lambda: ticks.pop(0))
+    return ticks
+
+
+@pytest.fixture
+def metrics(clock):
+    registry = Metrics(buckets=(0.1, 1))
+    clock.extend([0.0, 0.25, 1.0, 3.0])
+    with registry.request('PUT', 'http://localhost/geoserver/rest/workspaces/sat?recurse=true') as call:
+        call.update(status=202, bytes_sent=120, bytes_received=0, retries=1)
+    with pytest.raises(ValueError):
+        with registry.span('publish', product='A"HI'):
+            raise ValueError('no file')
+    return registry
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]  # bounds are inclusive
+    assert histogram.cumulative() == [('0.1', 2), ('1', 3), ('+Inf', 4)]
+    assert (histogram.count, histogram.sum) == (4, 5.65)
+
+
+@pytest.mark.parametrize('url, endpoint', [
+    ('http://localhost/geoserver/rest/workspaces', '/geoserver/rest/workspaces'),
+    ('http://localhost/geoserver/rest/workspaces/sat/coveragestores/ahi/external.imagemosaic?recalculate=',
+     '/geoserver/rest/workspaces/{}/coveragestores/{}/external.imagemosaic'),
+    ('http://localhost/geoserver/rest/workspaces/sat/coveragestores/ahi/coverages/ahi/index/granules.json',
+     '/geoserver/rest/workspaces/{}/coveragestores/{}/coverages/{}/index/granules.json'),
+    ('http://localhost/geoserver/gwc/rest/layers/sat:ahi.xml', '/geoserver/gwc/rest/layers/{}.xml'),
+])
+def test_get_endpoint(url, endpoint):
+    assert get_endpoint(url) == endpoint
+
+
+def test_to_prometheus(metrics):
+    assert metrics.to_prometheus() == '\n'.join([
+        '# HELP geoserver_request_duration_seconds Latency of GeoServer REST calls.',
+        '# TYPE geoserver_request_duration_seconds histogram',
+        'geoserver_request_duration_seconds_bucket{method="PUT",endpoint="/geoserver/rest/workspaces/{}",le="0.1"} 0',
+        'geoserver_request_duration_seconds_bucket{method="PUT",endpoint="/geoserver/rest/workspaces/{}",le="1"} 1',
+        'geoserver_request_duration_seconds_bucket{method="PUT",endpoint="/geoserver/rest/workspaces/{}",le="+Inf"} 1',
+        'geoserver_request_duration_seconds_sum{method="PUT",endpoint="/geoserver/rest/workspaces/{}"} 0.25',
+        'geoserver_request_duration_seconds_count{method="PUT",endpoint="/geoserver/rest/workspaces/{}"} 1',
+        '# HELP geoserver_requests_total GeoServer REST calls by status code.',
+        '# TYPE geoserver_requests_total counter',
+        'geoserver_requests_total{method="PUT",endpoint="/geoserver/rest/workspaces/{}",status="202"} 1',
+        '# HELP geoserver_request_bytes_sent_total Request body bytes sent to GeoServer.',
+        '# TYPE geoserver_request_bytes_sent_total counter',
+        'geoserver_request_bytes_sent_total{method="PUT",endpoint="/geoserver/rest/workspaces/{}"} 120',
+        '# HELP geoserver_response_bytes_received_total Response body bytes received from GeoServer.',
+        '# TYPE geoserver_response_bytes_received_total counter',
+        'geoserver_response_bytes_received_total{method="PUT",endpoint="/geoserver/rest/workspaces/{}"} 0',
+        '# HELP geoserver_request_retries_total Retries of GeoServer REST calls.',
+        '# TYPE geoserver_request_retries_total counter',
+        'geoserver_request_retries_total{method="PUT",endpoint="/geoserver/rest/workspaces/{}"} 1',
+        '# HELP geoserver_requests_in_flight GeoServer REST calls in progress.',
+        '# TYPE geoserver_requests_in_flight gauge',
+        'geoserver_requests_in_flight{method="PUT",endpoint="/geoserver/rest/workspaces/{}"} 0',
+        '# HELP publicator_stage_duration_seconds Duration of publication workflow stages.',
+        '# TYPE publicator_stage_duration_seconds histogram',
+        'publicator_stage_duration_seconds_bucket{stage="publish",product="A\\"HI",le="0.1"} 0',
+        'publicator_stage_duration_seconds_bucket{stage="publish",product="A\\"HI",le="1"} 0',
+        'publicator_stage_duration_seconds_bucket{stage="publish",product="A\\"HI",le="+Inf"} 1',
+        'publicator_stage_duration_seconds_sum{stage="publish",product="A\\"HI"} 2.0',
+        'publicator_stage_duration_seconds_count{stage="publish",product="A\\"HI"} 1',
+        '# HELP publicator_stage_errors_total Publication workflow stages failed with exception.',
+        '# TYPE publicator_stage_errors_total counter',
+        'publicator_stage_errors_total{stage="publish",product="A\\"HI"} 1',
+        '# HELP publicator_stages_in_flight Publication workflow stages in progress.',
+        '# TYPE publicator_stages_in_flight gauge',
+        'publicator_stages_in_flight{stage="publish",product="A\\"HI"} 0',
+    ]) + '\n'
+
+
+def test_to_log_lines(metrics):
+    endpoint = {'method': 'PUT', 'endpoint': '/geoserver/rest/workspaces/{}'}
+    stage_labels = {'stage': 'publish', 'product': 'A"HI'}
+
+    assert [json.loads(line) for line in metrics.to_log_lines()] == [
+        dict(endpoint, metric='request_duration_seconds', count=1, sum=0.25, mean=0.25),
+        dict(endpoint, metric='requests_total', status='202', value=1),
+        dict(endpoint, metric='request_bytes_sent_total', value=120),
+        dict(endpoint, metric='response_bytes_received_total', value=0),
+        dict(endpoint, metric='request_retries_total', value=1),
+        dict(endpoint, metric='requests_in_flight', value=0),
+        dict(stage_labels, metric='stage_duration_seconds', count=1, sum=2.0, mean=2.0),
+        dict(stage_labels, metric='stage_errors_total', value=1),
+        dict(stage_labels, metric='stages_in_flight', value=0),
+    ]
+    assert all(line == json.dumps(json.loads(line), sort_keys=True) for line in metrics.to_log_lines())
+
+
+def test_hooks_wrap_requests_and_stages():
+    calls = []
+
+    class Span:
+        def set_attribute(self, key, value):
+            calls.append(('set', key, value))
+
+    @contextlib.contextmanager
+    def hook(name, attributes):
+        calls.append(('enter', name, attributes))
+        yield Span()
+        calls.append(('exit', name))
+
+    metrics = Metrics()
+    metrics.add_hook(hook)
+    with pytest.raises(ConnectionError):
+        with metrics.request('GET', 'http://localhost/geoserver/rest/workspaces'):
+            raise ConnectionError()
+    with metrics.span('verify', product='AHI', slots=3):
+        pass
+
+    assert calls == [
+        ('enter', 'geoserver.request', {'http.method': 'GET', 'endpoint': '/geoserver/rest/workspaces'}),
+        ('set', 'http.status_code', 'ConnectionError'),
+        ('enter', 'verify', {'slots': 3, 'product': 'AHI'}),
+        ('exit', 'verify'),
+    ]  # the request hook does not exit normally, its exception is propagated
+    assert metrics.snapshot()['requests_total'] == {
+        ('GET', '/geoserver/rest/workspaces', 'ConnectionError'): 1}
+
+
+def test_stage_decorator():
+    class Worker:
+        metrics = Metrics()
+        product = 'AHI'
+
+        @stage('check_source')
+        def check(self, fail: bool = False) -> bool:
+            """ Check source. """
+            if fail:
+                raise OSError('gone')
+            return True
+
+    worker = Worker()
+    assert worker.check()
+    with pytest.raises(OSError):
+        worker.check(fail=True)
+
+    snapshot = worker.metrics.snapshot()
+    assert snapshot['stage_duration_seconds'][('check_source', 'AHI')][1] == 2
+    assert snapshot['stage_errors_total'] == {('check_source', 'AHI'): 1}
+    assert snapshot['stages_in_flight'] == {('check_source', 'AHI'): 0}
+    assert (Worker.check.__name__, Worker.check.__doc__) == ('check', ' Check source. ')
+
+
+def test_geoserver_records_requests(mock, geo):
+    geo.create_workspace('sat')
+    geo.get_workspaces()
+
+    requests_total = geo.metrics.snapshot()['requests_total']
+    assert requests_total == {('POST', '/geoserver/rest/workspaces', '201'): 1,
+                              ('GET', '/geoserver/rest/workspaces', '200'): 1}
+    assert geo.metrics.snapshot()['request_bytes_sent_total'][('POST', '/geoserver/rest/workspaces')] > 0
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+import requests
+
+from geoserver.MockGeoserver import MockGeoserver
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks',
+                         'publicator_benchmark.py')
+
+
+def test_stats_are_counted_by_endpoint(mock):
+    body = b'<workspace><name>sat</name></workspace>'
+    with requests.Session() as session:
+        session.post(mock.service_url + '/rest/workspaces', data=body, headers={'content-type': 'text/xml'})
+        for name in ('sat', 'missing'):
+            session.get(mock.service_url + '/rest/workspaces/{}.json'.format(name))
+
+    assert mock.stats() == {
+        'requests': {('POST', '/geoserver/rest/workspaces'): 1, ('GET', '/geoserver/rest/workspaces/{}.json'): 2},
+        'requests_total': 3,
+        'connections': 1,
+        'bytes_received': len(body),
+    }
+    mock.reset_stats()
+    assert mock.stats() == {'requests': {}, 'requests_total': 0, 'connections': 0, 'bytes_received': 0}
+
+
+def test_errors_are_injected_with_seed():
+    statuses = []
+    for _ in range(2):
+        with MockGeoserver(error_rate=0.5, error_status=502, seed=7) as mock:
+            statuses.append([requests.get(mock.service_url + '/rest/workspaces').status_code for _ in range(20)])
+
+    assert statuses[0] == statuses[1]
+    assert set(statuses[0]) == {200, 502}
+
+
+def test_synthetic_granules(mock):
+    mock.add_granules('ws', 'store', 3)
+
+    response = requests.get(mock.service_url + '/rest/workspaces/ws/coveragestores/store/coverages/store'
+                            '/index/granules.json', params={'filter': 'time >= 2021-01-01T00:10:00Z'})
+
+    assert [feature['properties']['location'] for feature in response.json()['features']] == [
+        '/mock/store/store_20210101_0010_rgb.tif', '/mock/store/store_20210101_0020_rgb.tif']
+    assert mock.granule_count('ws', 'store') == 3
+
+
+def test_benchmark_runs_scenarios():
+    output = subprocess.run(
+        [sys.executable, BENCHMARK, '--slots', '3', '--scenario', 'batch', '--scenario', 'index',
+         '--granules', '100', '--latency', '0', '--json'],
+        check=True, capture_output=True, text=True, timeout=60
+    ).stdout
+
+    (batch, index) = [json.loads(line) for line in output.splitlines()]
+    assert (batch['scenario'], batch['slots'], batch['done']) == ('batch', 3, 3)
+    assert (index['scenario'], index['granules']) == ('index', 100)
@@ -0,0 +1,87 @@
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from geoserver.payloads import (TIME_REGEX, Field, ListOf, PayloadTemplate, coverage_template, get_payload_format,
+                                gwc_layer_template)
+
+
+@pytest.fixture
+def template():
+    return PayloadTemplate('layer', {
+        'name': Field('name'),
+        'enabled': True,
+        'formats': ListOf('string', ['image/png', 'image/jpeg']),
+        'entry': [{'@key': 'time', 'size': 1}, {'@key': 'elevation', 'size': None}],
+        'price': '$5 & up',
+    })
+
+
+def test_render_xml(template):
+    assert template.render('xml', name='sat:ahi') == (
+        '<layer><name>sat:ahi</name><enabled>true</enabled>'
+        '<formats><string>image/png</string><string>image/jpeg</string></formats>'
+        "<entry key='time'><size>1</size></entry><entry key='elevation'><size></size></entry>"
+        '<price>$5 &amp; up</price></layer>')
+
+
+def test_render_json(template):
+    assert template.render('json', name='sat:ahi') == (
+        '{"layer":{"name":"sat:ahi","enabled":true,"formats":["image/png","image/jpeg"],'
+        '"entry":[{"@key":"time","size":1},{"@key":"elevation","size":null}],"price":"$5 & up"}}')
+
+
+@pytest.mark.parametrize('value', ['a<b & "c"', "${name} $$", '</name><injected/>', 'Ähi\n'])
+def test_field_values_are_escaped(template, value):
+    assert ET.fromstring(template.render('xml', name=value)).find('name').text == value
+    assert json.loads(template.render('json', name=value))['layer']['name'] == value
+
+
+def test_render_requires_all_fields(template):
+    with pytest.raises(KeyError):
+        template.render('xml')
+
+
+def test_gwc_layer_template():
+    xml = gwc_layer_template(metatile=(2, 2), regex_filters=(('ELEVATION', '[0-9]+', '0'),)).render(
+        'xml', id='LayerInfoImpl--1', name='sat:ahi', time='2021-07-09T00:00:00.000Z')
+
+    layer = ET.fromstring(xml)
+    assert (layer.find('id').text, layer.find('name').text) == ('LayerInfoImpl--1', 'sat:ahi')
+    assert [item.text for item in layer.find('metaWidthHeight')] == ['2', '2']
+    assert [item.find('gridSetName').text for item in layer.find('gridSubsets')] == ['EPSG:4326', 'EPSG:900913']
+    filters = layer.find('parameterFilters').findall('regexParameterFilter')
+    assert [(f.find('key').text, f.find('regex').text, f.find('defaultValue').text) for f in filters] == [
+        ('TIME', TIME_REGEX, '2021-07-09T00:00:00.000Z'), ('ELEVATION', '[0-9]+', '0')]
+    assert layer.find('parameterFilters/styleParameterFilter/key').text == 'STYLES'
+
+
+def test_coverage_template():
+    document = json.loads(coverage_template(title='AHI').render('json'))
+
+    assert document == {'coverage': {'enabled': True, 'title': 'AHI', 'metadata': {'entry': [{
+        '@key': 'time',
+        'dimensionInfo': {'enabled': True, 'presentation': 'LIST', 'units': 'ISO8601',
+                          'defaultValue': {'strategy': 'MINIMUM'}},
+    }]}}}
+
+
+def test_templates_are_cached_per_config():
+    assert gwc_layer_template() is gwc_layer_template()
+    assert gwc_layer_template(metatile=(2, 2)) is gwc_layer_template(metatile=(2, 2))
+    assert gwc_layer_template(metatile=(2, 2)) is not gwc_layer_template()
+    assert coverage_template() is coverage_template()
+    assert coverage_template(title='AHI') is not coverage_template()
+    with pytest.raises(TypeError):
+        gwc_layer_template(metatile=[2, 2])  # lists are not hashable, pass tuples
+
+
+@pytest.mark.parametrize('content_type, payload_format', [
+    ('application/xml; charset=UTF-8', 'xml'),
+    ('text/xml', 'xml'),
+    ('application/json', 'json'),
+    ('application/json; charset=UTF-8', 'json'),
+])
+def test_get_payload_format(content_type, payload_format):
+    assert get_payload_format(content_type) == payload_format
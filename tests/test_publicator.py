@@ -0,0 +1,420 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from geoserver.MockGeoserver import MockGeoserver
+from geoserver.Publicator import Publicator
+from geoserver.utils import PublicationUtils
+from helpers import PRODUCT, create_geotiff, write_gdal_geotiff, write_source_files
+
+START = datetime(2021, 7, 9)
+
+
+def create_slots(count: int) -> list:
+    return Publicator.create_slots(PRODUCT, START, START + timedelta(minutes=10) * (count - 1))
+
+
+def granule_queries(mock) -> int:
+    return sum(count for (method, path), count in mock.stats()['requests'].items()
+               if method == 'GET' and '/index/granules' in path)
+
+
+def test_workflow_creates_product_and_publishes(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots[:2])
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert [publicator.workflow(args) for args in slots[:2]] == ['done', 'done']
+        mock.reset_stats()
+        assert publicator.workflow(slots[0]) == 'done'
+        assert publicator.workflow(slots[2]) == 'source file existence error'
+
+    assert granule_queries(mock) == 0  # existence is checked in the local granule index
+    assert mock.granule_count('sat', 'ahi') == 2
+
+
+def test_workflow_polls_until_granule_is_harvested(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots)
+    mock.harvest_delay = 0.3
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.workflow(slots[0]) == 'done'
+        assert publicator.workflow(slots[1]) == 'done'
+        publicator._readiness_timeout = 0.1
+        assert publicator.workflow(slots[2]) == 'file creation error'  # accepted, but not harvested in time
+
+
+def test_logger_is_injectable(config):
+    logger = logging.getLogger('injected')
+
+    with Publicator(PRODUCT, config=config, logger=logger) as publicator:
+        assert publicator.logger is logger
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.logger is logging.getLogger(PRODUCT)
+
+
+def test_config_loader_is_injectable(tmp_path, config):
+    with Publicator(PRODUCT, config_loader=lambda: config) as publicator:
+        assert publicator._config is config
+
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(config))
+    with Publicator(PRODUCT, config_loader=lambda: Publicator.load_config(str(path))) as publicator:
+        assert publicator._config == config
+
+
+def test_create_slots():
+    assert Publicator.create_slots(PRODUCT, START, START + timedelta(minutes=20)) == [
+        (PRODUCT, '2021', '07', '09', '0000'), (PRODUCT, '2021', '07', '09', '0010'),
+        (PRODUCT, '2021', '07', '09', '0020')]
+    assert Publicator.create_slots(PRODUCT, START, START - timedelta(minutes=10)) == []
+
+
+def test_batch_workflow_reports_missing_sources(tmp_path, mock, config):
+    slots = create_slots(4)
+    write_source_files(tmp_path, slots[:3])
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        results = publicator.batch_workflow(slots)
+        mock.reset_stats()
+        again = publicator.batch_workflow(slots[:3])
+
+    assert list(results) == slots
+    assert list(results.values()) == ['done', 'done', 'done', 'source file existence error']
+    assert list(again.values()) == ['done', 'done', 'done']
+    assert granule_queries(mock) == 1  # one delta query for the whole batch
+    assert mock.granule_count('sat', 'ahi') == 3
+
+
+def test_prune_removes_old_granules_and_files(tmp_path, mock, config):
+    slots = create_slots(4)
+    write_source_files(tmp_path, slots)
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.batch_workflow(slots)
+        with pytest.raises(ValueError, match='retention_days'):
+            publicator.prune()
+        report = publicator.prune(retention_days=1, now=START + timedelta(days=1, minutes=25))
+        assert 'AHI_20210709_0010_RGB.tif' not in publicator.granule_index
+        assert 'AHI_20210709_0030_RGB.tif' in publicator.granule_index
+
+    assert report['index'].startswith('Granules deleted')
+    assert sorted(report['files']) == ['AHI_20210709_0010_RGB.tif', 'AHI_20210709_0020_RGB.tif']
+    assert [path.name for path in (tmp_path / 'public' / PRODUCT / 'tiff').iterdir()] == ['AHI_20210709_0030_RGB.tif']
+    assert mock.granule_count('sat', 'ahi') == 1
+
+
+def test_rename_staging_moves_sources_and_keeps_base_dir(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['staging'] = 'rename'
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert set(publicator.batch_workflow(slots).values()) == {'done'}
+
+    sources = sorted(path.name for path in (tmp_path / 'rgb').rglob('*.tif'))
+    assert sources == ['AHI_20210709_0000_RGB.tif']  # the init sample is copied into the init zip
+    assert sorted(path.name for path in (tmp_path / 'public' / PRODUCT / 'tiff').iterdir()) == [
+        'AHI_20210709_0010_RGB.tif', 'AHI_20210709_0020_RGB.tif']
+    assert sorted(path.name for path in (tmp_path / 'public' / 'base' / 'init').iterdir()) == [
+        'indexer.properties', 'timeregex.properties']
+
+
+def test_init_zip_is_streamed(tmp_path, mock, config):
+    slots = create_slots(2)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['stream_init_zip'] = True
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert set(publicator.batch_workflow(slots).values()) == {'done'}
+
+    assert not (tmp_path / 'public' / PRODUCT / 'init.zip').exists()
+    assert mock.granule_count('sat', 'ahi') == 2
+
+
+def test_published_slots_are_seeded_and_pruned_slots_truncated(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['seed'] = {'zoom_stop': 2, 'wait': True, 'truncate_on_prune': True}
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.workflow(slots[0])
+        publicator.batch_workflow(slots[1:])
+        publicator.prune(retention_days=1, now=START + timedelta(days=1, minutes=15))
+
+    requests = [request['seedRequest'] for request in mock.seed_requests()]
+    assert [(request['type'], request['parameters']['entry']) for request in requests] == [
+        ('seed', [{'string': ['TIME', '2021-07-09T00:00:00.000Z']}]),
+        ('seed', [{'string': ['TIME', '2021-07-09T00:10:00.000Z']}]),
+        ('seed', [{'string': ['TIME', '2021-07-09T00:20:00.000Z']}]),
+        ('truncate', [{'string': ['TIME', '2021-07-09T00:10:00.000Z']}]),
+    ]
+    assert {request['zoomStop'] for request in requests} == {2}
+
+
+def test_ingest_queue_resumes_slots_from_recorded_state(monkeypatch, tmp_path, mock, config):
+    slots = create_slots(4)
+    write_source_files(tmp_path, slots[:3])
+    config[PRODUCT]['ingest_queue'] = {'max_attempts': 1}
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.enqueue(slots[:1]) == 1
+        assert publicator.run_queue()['verified'] == 1
+        assert publicator.enqueue(slots) == 3  # queued granules are skipped
+        (job,) = publicator.ingest_queue.claim()
+        publicator._move_file_to_product_dir(job.args)
+        publicator.ingest_queue.set_state(job.granule, 'staged')  # the process stops here
+
+    staged = []
+    with Publicator(PRODUCT, config=config) as publicator:
+        move = publicator._move_file_to_product_dir
+        monkeypatch.setattr(publicator, '_move_file_to_product_dir', lambda args: staged.append(args) or move(args))
+        counts = publicator.run_queue(workers=2)
+
+    assert counts == {'pending': 0, 'staged': 0, 'published': 0, 'verified': 3, 'failed': 1}
+    assert staged == [slots[2]]  # the staged slot is published without staging it again
+    assert mock.granule_count('sat', 'ahi') == 3
+
+
+
+def test_ingest_queue_resumes_slot_renamed_before_its_state_was_recorded(tmp_path, mock, config):
+    slots = create_slots(2)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['staging'] = 'rename'
+    config[PRODUCT]['ingest_queue'] = {'max_attempts': 1}
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.workflow(slots[0]) == 'done'
+        assert publicator.enqueue(slots[1:]) == 1
+        (job,) = publicator.ingest_queue.claim()
+        publicator._move_file_to_product_dir(job.args)  # the process stops before the state is recorded
+        assert not os.path.exists(publicator._create_source_file_path(job.args))
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        counts = publicator.run_queue()
+
+    assert (counts['verified'], counts['failed']) == (1, 0)
+    assert mock.granule_count('sat', 'ahi') == 2
+
+def test_reconcile_reports_and_repairs_drift(tmp_path, mock, config):
+    slots = create_slots(4)
+    write_source_files(tmp_path, slots[:3])
+    tiff_dir = tmp_path / 'public' / PRODUCT / 'tiff'
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.batch_workflow(slots[:3])
+        (tiff_dir / 'AHI_20210709_0010_RGB.tif').unlink()
+        (tiff_dir / 'AHI_20210709_0030_RGB.tif').write_bytes(create_geotiff(64, 32))
+        publicator.geoserver.publish_file_to_coveragestore(str(tiff_dir / 'AHI_20210709_0020_RGB.tif'),
+                                                           coveragestore_name='ahi', workspace='sat')
+
+        report = publicator.reconcile()
+        assert mock.granule_count('sat', 'ahi') == 4  # dry run
+        repaired = publicator.reconcile(repair=True)
+        clean = publicator.reconcile()
+
+    assert report == {
+        'files': 2,
+        'granules': 4,
+        'unindexed': ['AHI_20210709_0030_RGB.tif'],
+        'orphaned': [str(tiff_dir / 'AHI_20210709_0010_RGB.tif')],
+        'duplicated': [str(tiff_dir / 'AHI_20210709_0020_RGB.tif')],
+    }
+    assert all(result.startswith('Granules deleted') for result in repaired['deleted'])
+    assert all(result.startswith('Published') for result in repaired['published'])
+    assert (clean['files'], clean['granules'], clean['unindexed'], clean['orphaned'], clean['duplicated']) == (
+        2, 3, [], [], [])
+
+
+def test_workflow_stages_are_recorded_in_client_metrics(tmp_path, mock, config):
+    slots = create_slots(2)
+    write_source_files(tmp_path, slots)
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.workflow(slots[0])
+        publicator.workflow(slots[1])
+        snapshot = publicator.geoserver.metrics.snapshot()
+
+    durations = snapshot['stage_duration_seconds']
+    assert {stage: durations[(stage, PRODUCT)][1] for stage in ('workflow', 'create_product', 'publish', 'verify')} == {
+        'workflow': 2, 'create_product': 1, 'publish': 1, 'verify': 2}
+    assert snapshot['stage_errors_total'] == {}
+
+
+def test_bulk_harvest_publishes_batch_with_one_request(tmp_path, mock, config):
+    slots = create_slots(5)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['bulk_harvest_threshold'] = 3
+    tiff_dir = tmp_path / 'public' / PRODUCT / 'tiff'
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.batch_workflow(slots[:2])  # the product and one missing file, below the threshold
+        mock.reset_stats()
+        results = publicator.batch_workflow(slots)
+        harvests = sum(count for (method, path), count in mock.stats()['requests'].items()
+                       if path.endswith('/external.imagemosaic'))
+        report = publicator.reconcile()
+        assert mock.granule_count('sat', 'ahi') == 5
+        publicator.prune(retention_days=1, now=START + timedelta(days=1, minutes=45))
+
+    assert set(results.values()) == {'done'}
+    assert harvests == 1
+    assert (report['files'], report['unindexed'], report['orphaned']) == (4, [], [])
+    assert [path.name for path in tiff_dir.iterdir()] == []  # the emptied harvest dir is removed
+
+
+def test_bootstrap_creates_store_from_index(tmp_path, mock, geo, config):
+    slots = create_slots(4)
+    write_source_files(tmp_path, slots[:3])
+    write_source_files(tmp_path, slots[3:], payload=create_geotiff(64, 32, georeferenced=False))
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        result = publicator.bootstrap(slots, processes=2)
+        mock.reset_stats()
+        assert set(publicator.batch_workflow(slots[:3]).values()) == {'done'}
+        assert granule_queries(mock) == 1  # delta query of batch, the index is known from bootstrap
+        with pytest.raises(ValueError):
+            publicator.bootstrap()
+
+    assert result['granules'] == 3
+    assert result['result'].startswith('Coveragestore ahi is created')
+    assert [path.rsplit('/', 1)[-1] for path in result['skipped']] == ['AHI_20210709_0030_RGB.tif']
+    mosaic_dir = tmp_path / 'public' / PRODUCT / 'mosaic'
+    assert {'ahi.shp', 'ahi.shx', 'ahi.dbf', 'ahi.prj', 'ahi.properties', 'indexer.properties'} <= {
+        path.name for path in mosaic_dir.iterdir()}
+    assert mock.granule_count('sat', 'ahi') == 3
+    assert geo.get_layers('sat') == {'layers': {'layer': [{'name': 'sat:ahi'}]}}
+    times = {granule_time for _, granule_time in MockGeoserver._read_index(str(mosaic_dir / 'ahi.dbf'))}
+    assert times == {'2021-07-09T00:00:00Z', '2021-07-09T00:10:00Z', '2021-07-09T00:20:00Z'}
+
+
+def test_invalid_source_files_are_not_published(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots[:1])
+    write_source_files(tmp_path, slots[1:2], payload=create_geotiff(64, 32, georeferenced=False))
+    write_source_files(tmp_path, slots[2:], payload=create_geotiff(64, 32, bands=3))
+    config[PRODUCT]['validate'] = True
+    config[PRODUCT]['expected_header'] = {'epsg': 4326, 'bands': 1}
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        results = [publicator.workflow(args) for args in slots]
+
+    assert results == ['done', 'invalid source file', 'invalid source file']
+    assert mock.granule_count('sat', 'ahi') == 1
+    assert not (tmp_path / 'public' / PRODUCT / 'tiff' / 'AHI_20210709_0010_RGB.tif').exists()  # not staged
+
+
+def test_validation_is_opt_in_and_accepts_world_files(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots, payload=create_geotiff(64, 32, georeferenced=False))
+    world_file = tmp_path / 'rgb' / 'AHI' / '2021' / '07' / '09' / '0020' / 'AHI_20210709_0020_RGB.tfw'
+    world_file.write_text('0.5\n0\n0\n-0.5\n100.25\n29.75\n')
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.workflow(slots[0]) == 'done'
+    config[PRODUCT]['validate'] = True
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.workflow(slots[1]) == 'invalid source file'
+        assert publicator.workflow(slots[2]) == 'done'
+
+
+def test_source_files_are_optimized_while_staged(tmp_path, mock, config):
+    pytest.importorskip('osgeo')
+    slots = create_slots(2)
+    write_gdal_geotiff(str(tmp_path / 'striped.tif'), 1024, 512)
+    write_source_files(tmp_path, slots, payload=(tmp_path / 'striped.tif').read_bytes())
+    config[PRODUCT]['optimize'] = {'block_size': 256, 'overview_levels': [2, 4], 'processes': 1}
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert [publicator.workflow(args) for args in slots] == ['done', 'done']
+
+    staged = tmp_path / 'public' / PRODUCT / 'tiff' / 'AHI_20210709_0010_RGB.tif'
+    header = PublicationUtils.read_geotiff_header(str(staged))
+    assert (header.tiled, header.block_size, header.overviews) == (True, (256, 256), [(512, 256), (256, 128)])
+    assert PublicationUtils.read_geotiff_header(publicator._create_source_file_path(slots[1])).tiled is False
+
+
+def test_optimize_errors_fail_slots(tmp_path, mock, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots[:1])
+    write_source_files(tmp_path, slots[1:], payload=b'not a tiff')
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.workflow(slots[0]) == 'done'
+    config[PRODUCT]['optimize'] = {'block_size': 256, 'processes': 1}
+    with Publicator(PRODUCT, config=config) as publicator:
+        # ImportError without GDAL, ValueError of the header reader otherwise
+        assert publicator.workflow(slots[1]) == 'optimize error'
+        assert publicator.batch_workflow(slots) == {
+            slots[0]: 'done', slots[1]: 'optimize error', slots[2]: 'optimize error'}
+
+    assert os.listdir(tmp_path / 'public' / PRODUCT / 'tiff') == []  # the first slot is the init granule
+    assert mock.granule_count('sat', 'ahi') == 1
+
+
+def test_prune_truncates_with_truncate_only_seed_config(tmp_path, mock, config):
+    slots = create_slots(4)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['seed'] = {'truncate_on_prune': True}
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.batch_workflow(slots)
+        assert mock.seed_requests() == []  # nothing to seed on publish
+        report = publicator.prune(retention_days=1, now=START + timedelta(days=1, minutes=25))
+
+    assert report['index'].startswith('Granules deleted')
+    assert sorted(report['files']) == ['AHI_20210709_0010_RGB.tif', 'AHI_20210709_0020_RGB.tif']
+    requests = [request['seedRequest'] for request in mock.seed_requests()]
+    assert [request['type'] for request in requests] == ['truncate', 'truncate']
+    assert [request['parameters']['entry'][0]['string'][1] for request in requests] == [
+        '2021-07-09T00:10:00.000Z', '2021-07-09T00:20:00.000Z']
+
+
+def test_prune_keeps_files_when_index_delete_fails(tmp_path, mock, config):
+    slots = create_slots(2)
+    write_source_files(tmp_path, slots)
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.batch_workflow(slots)
+        mock.error_rate = 1.0
+        report = publicator.prune(retention_days=1, now=START + timedelta(days=2))
+
+    assert report['index'].startswith('Can not delete granules')
+    assert report['files'] == []
+    assert len(list((tmp_path / 'public' / PRODUCT / 'tiff').iterdir())) == 1  # init sample is the first granule
+
+
+def test_published_granules_are_indexed_by_delta_queries(tmp_path, mock, config):
+    slots = create_slots(6)
+    write_source_files(tmp_path, slots)
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert publicator.workflow(slots[0]) == 'done'
+        mock.reset_stats()
+        assert publicator.workflow(slots[1]) == 'done'
+        assert granule_queries(mock) == 1  # the publish status does not add the granule
+        publicator.batch_workflow(slots[2:4], bulk_harvest=False)
+        publicator.batch_workflow(slots[4:], bulk_harvest=True)
+        assert granule_queries(mock) == 5  # delta queries for existing and for published granules of each batch
+        assert len(publicator.granule_index) == 6
+
+
+def test_reconcile_drops_granules_deleted_by_others(tmp_path, mock, geo, config):
+    slots = create_slots(3)
+    write_source_files(tmp_path, slots)
+    config[PRODUCT]['granule_index_path'] = str(tmp_path / 'granules.sqlite')
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        publicator.batch_workflow(slots)
+    name = publicator._create_source_file_name(slots[1])
+    geo.delete_granules_from_coveragestore('sat', 'ahi', cql_filter="location LIKE '%{0}'".format(name))
+
+    with Publicator(PRODUCT, config=config) as publicator:
+        assert name in publicator.granule_index  # persisted entry
+        report = publicator.reconcile()
+        assert report['unindexed'] == [name]
+        assert name not in publicator.granule_index
@@ -0,0 +1,123 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from geoserver.Publicator import Publicator
+from geoserver.Scheduler import Scheduler
+from helpers import PRODUCT, create_geotiff, write_source_files
+
+OTHER = 'ABI_L2_G16_RGB_GEOSERVER'
+START = datetime(2021, 7, 9)
+
+
+@pytest.fixture
+def products_config(config):
+    config[OTHER] = dict(config[PRODUCT], name=OTHER, dir_source='ABI', coveragestore='abi')
+    return config
+
+
+def record_jobs(scheduler, jobs: list, duration: float = 0.0) -> None:
+    """ Replace job processing of every product with recording of (product, start, end). """
+    for product, publicator in scheduler.publicators.items():
+        def process(job, product=product, publicator=publicator):
+            started = time.monotonic()
+            time.sleep(duration)
+            jobs.append((product, started, time.monotonic()))
+            publicator.ingest_queue.set_state(job.granule, 'verified')
+            return 'verified'
+
+        publicator._process_job = process
+
+
+def test_publicators_share_one_client(products_config):
+    with Scheduler(config=products_config) as scheduler:
+        assert list(scheduler.publicators) == [PRODUCT, OTHER]  # configured PRODUCTS
+        assert {id(publicator.geoserver) for publicator in scheduler.publicators.values()} == {
+            id(scheduler.geoserver)}
+        scheduler.publicators[PRODUCT].close()
+        assert scheduler.geoserver._session is not None
+
+    products_config[OTHER]['schedule'] = {'priority': 0}
+    with pytest.raises(ValueError, match='priority'):
+        Scheduler(config=products_config)
+
+
+def test_config_loader_and_loggers_are_injected(products_config):
+    loaded = []
+    loggers = {}
+
+    def load_config():
+        loaded.append(True)
+        return products_config
+
+    def logger_factory(product):
+        return loggers.setdefault(product, logging.getLogger('test.' + product))
+
+    with Scheduler(config_loader=load_config, logger_factory=logger_factory) as scheduler:
+        assert loaded == [True]  # once for all products
+        assert {product: publicator.logger for product, publicator in scheduler.publicators.items()} == loggers
+        assert list(loggers) == [PRODUCT, OTHER]
+
+
+@pytest.mark.parametrize('max_in_flight', [0, -1])
+def test_scheduler_rejects_max_in_flight_below_one(config, max_in_flight):
+    config[PRODUCT]['schedule'] = {'max_in_flight': max_in_flight}
+
+    with pytest.raises(ValueError, match='max_in_flight'):
+        Scheduler([PRODUCT], config=config)
+
+
+def test_run_publishes_queues_of_all_products(tmp_path, mock, products_config):
+    slots = {product: Publicator.create_slots(product, START, START + timedelta(minutes=20))
+             for product in (PRODUCT, OTHER)}
+    write_source_files(tmp_path, slots[PRODUCT])
+    for (_, year, month, day, dtime) in slots[OTHER]:
+        slot_dir = tmp_path / 'rgb' / 'ABI' / year / month / day / dtime
+        slot_dir.mkdir(parents=True)
+        (slot_dir / 'ABI_{0}{1}{2}_{3}_RGB.tif'.format(year, month, day, dtime)).write_bytes(create_geotiff(64, 32))
+
+    with Scheduler(config=products_config, max_workers=3) as scheduler:
+        for product in (PRODUCT, OTHER):
+            assert scheduler.enqueue(product, slots[product]) == 3
+        counts = scheduler.run()
+
+    assert {product: product_counts['verified'] for product, product_counts in counts.items()} == {
+        PRODUCT: 3, OTHER: 3}
+    assert (mock.granule_count('sat', 'ahi'), mock.granule_count('sat', 'abi')) == (3, 3)
+
+
+def test_workers_are_shared_in_proportion_to_priority(products_config):
+    products_config[PRODUCT]['schedule'] = {'priority': 3}
+    jobs = []
+
+    with Scheduler(config=products_config, max_workers=1) as scheduler:
+        for product in (PRODUCT, OTHER):
+            scheduler.enqueue(product, Publicator.create_slots(product, START, START + timedelta(minutes=70)))
+        record_jobs(scheduler, jobs)
+        scheduler.run()
+
+    order = [product for product, _, _ in jobs]
+    # 3 jobs of the first product for every job of the other one, the other one is never starved
+    assert order[:8] == [PRODUCT, OTHER, PRODUCT, PRODUCT, PRODUCT, OTHER, PRODUCT, PRODUCT]
+    assert order[12:] == [OTHER] * 4
+
+
+def test_max_in_flight_caps_jobs_of_one_product(products_config):
+    products_config[PRODUCT]['schedule'] = {'max_in_flight': 1}
+    jobs = []
+
+    with Scheduler(config=products_config, max_workers=4, poll_interval=0.01) as scheduler:
+        for product in (PRODUCT, OTHER):
+            scheduler.enqueue(product, Publicator.create_slots(product, START, START + timedelta(minutes=30)))
+        record_jobs(scheduler, jobs, duration=0.05)
+        counts = scheduler.run()
+
+    def max_overlap(product):
+        spans = [(started, ended) for name, started, ended in jobs if name == product]
+        return max(sum(1 for other in spans if other[0] < ended and started < other[1]) for started, ended in spans)
+
+    assert counts[PRODUCT]['verified'] == counts[OTHER]['verified'] == 4
+    assert max_overlap(PRODUCT) == 1
+    assert max_overlap(OTHER) > 1
@@ -0,0 +1,409 @@
+import errno
+import fcntl
+import io
+import json
+import os
+import shutil
+import struct
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from geoserver import utils
+from geoserver.MockGeoserver import MockGeoserver
+from geoserver.utils import WGS84_WKT, GeoTiffHeader, GranuleStreamParser, PublicationUtils
+from helpers import create_geotiff, pack_ifds, write_gdal_geotiff
+
+
+def test_granule_stream_parser_is_fed_in_pieces():
+    data = json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': 'ahi.{}'.format(i), 'properties': {'location': '/data/{}.tif'.format(i)}}
+        for i in range(3)]}).encode()
+    parser = GranuleStreamParser()
+
+    granules = [granule for i in range(0, len(data), 7) for granule in parser.feed(data[i:i + 7])]
+    parser.close()
+
+    assert granules == [('ahi.{}'.format(i), '/data/{}.tif'.format(i)) for i in range(3)]
+    truncated = GranuleStreamParser()
+    truncated.feed(data[:60])
+    with pytest.raises(ValueError, match='Unexpected end'):
+        truncated.close()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'src' / 'AHI_20210709_0000_RGB.tif'
+    path.parent.mkdir()
+    path.write_bytes(b'II*\x00' + bytes(range(256)) * 64)
+    (tmp_path / 'dst').mkdir()
+    return path
+
+
+def oserror(code):
+    def raise_oserror(*args, **kwargs):
+        raise OSError(code, os.strerror(code))
+    return raise_oserror
+
+
+@pytest.mark.parametrize('strategy', ['copy', 'hardlink', 'reflink', 'symlink', 'rename'])
+def test_stage_file(source, strategy):
+    data = source.read_bytes()
+    inode = source.stat().st_ino
+    target = source.parent.parent / 'dst' / source.name
+
+    assert PublicationUtils.stage_file(str(source), str(target), strategy=strategy)
+
+    assert target.read_bytes() == data
+    assert os.listdir(target.parent) == [source.name]  # no temp file is left
+    assert source.exists() == (strategy != 'rename')
+    assert target.is_symlink() == (strategy == 'symlink')
+    assert (target.stat().st_ino == inode) == (strategy in ('hardlink', 'symlink', 'rename'))
+
+
+def test_stage_file_does_not_overwrite(source):
+    target = source.parent.parent / 'dst' / source.name
+    target.write_bytes(b'old')
+
+    assert not PublicationUtils.stage_file(str(source), str(target))
+    assert not PublicationUtils.stage_file(str(source.parent / 'missing.tif'), str(target.parent / 'new.tif'))
+    assert target.read_bytes() == b'old'
+    with pytest.raises(ValueError, match='strategy must be one of'):
+        PublicationUtils.stage_file(str(source), str(target.parent / 'new.tif'), strategy='move')
+
+
+def test_hardlink_falls_back_to_copy_across_devices(monkeypatch, source):
+    target = source.parent.parent / 'dst' / source.name
+    monkeypatch.setattr(os, 'link', oserror(errno.EXDEV))
+
+    assert PublicationUtils.stage_file(str(source), str(target), strategy='hardlink')
+
+    assert target.read_bytes() == source.read_bytes()
+    assert target.stat().st_ino != source.stat().st_ino
+
+
+def test_reflink_falls_back_to_copy(monkeypatch, source):
+    target = source.parent.parent / 'dst' / source.name
+    monkeypatch.setattr(fcntl, 'ioctl', oserror(errno.EOPNOTSUPP))
+    monkeypatch.setattr(os, 'copy_file_range', oserror(errno.EXDEV), raising=False)
+
+    assert PublicationUtils.stage_file(str(source), str(target), strategy='reflink')
+
+    assert target.read_bytes() == source.read_bytes()
+
+
+def test_rename_copies_across_devices(monkeypatch, source):
+    data = source.read_bytes()
+    target = source.parent.parent / 'dst' / source.name
+    replace = os.replace
+
+    def cross_device_replace(src, dst):
+        if src == str(source):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        return replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', cross_device_replace)
+
+    assert PublicationUtils.stage_file(str(source), str(target), strategy='rename')
+
+    assert target.read_bytes() == data
+    assert not source.exists()
+    assert os.listdir(target.parent) == [source.name]
+
+
+def test_temp_file_is_removed_on_failure(monkeypatch, source):
+    target = source.parent.parent / 'dst' / source.name
+
+    def failing_copyfile(src, dst):
+        with open(dst, 'wb') as f:
+            f.write(b'partial')
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+    monkeypatch.setattr(shutil, 'copyfile', failing_copyfile)
+
+    with pytest.raises(OSError):
+        PublicationUtils.stage_file(str(source), str(target))
+    assert os.listdir(target.parent) == []
+
+
+def test_copy_dir_recursively(monkeypatch, tmp_path):
+    base = tmp_path / 'base'
+    (base / 'nested').mkdir(parents=True)
+    (base / 'indexer.properties').write_text('TimeAttribute=time\n')
+    (base / 'nested' / 'timeregex.properties').write_text('regex=[0-9]{8}_[0-9]{4}\n')
+
+    assert PublicationUtils.copy_dir_recursively(str(base), str(tmp_path / 'init'), strategy='hardlink')
+    assert (tmp_path / 'init' / 'nested' / 'timeregex.properties').stat().st_ino == \
+           (base / 'nested' / 'timeregex.properties').stat().st_ino
+    assert not PublicationUtils.copy_dir_recursively(str(base), str(tmp_path / 'init'))
+    with pytest.raises(ValueError):
+        PublicationUtils.copy_dir_recursively(str(base), str(tmp_path / 'other'), strategy='rename')
+
+    monkeypatch.setattr(shutil, 'copyfile', oserror(errno.ENOSPC))
+    with pytest.raises(shutil.Error):
+        PublicationUtils.copy_dir_recursively(str(base), str(tmp_path / 'failed'))
+    assert sorted(os.listdir(tmp_path)) == ['base', 'init']  # temp dir is removed
+
+
+@pytest.fixture
+def init_dir(tmp_path):
+    path = tmp_path / 'init'
+    path.mkdir()
+    (path / 'indexer.properties').write_text('TimeAttribute=time\n' * 100)
+    (path / 'AHI_20210709_0000_RGB.tif').write_bytes(bytes(range(256)) * 1024)
+    return path
+
+
+def read_zip(data: bytes) -> dict:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return {info.filename: (info.compress_type, archive.read(info)) for info in archive.infolist()}
+
+
+def test_zip_dir_stores_rasters_and_deflates_configs(init_dir):
+    assert PublicationUtils.zip_dir(str(init_dir))
+
+    members = read_zip((init_dir.parent / 'init.zip').read_bytes())
+    assert members == {
+        'AHI_20210709_0000_RGB.tif': (zipfile.ZIP_STORED, (init_dir / 'AHI_20210709_0000_RGB.tif').read_bytes()),
+        'indexer.properties': (zipfile.ZIP_DEFLATED, (init_dir / 'indexer.properties').read_bytes()),
+    }
+    assert sorted(os.listdir(init_dir.parent)) == ['init', 'init.zip']
+    assert not PublicationUtils.zip_dir(str(init_dir.parent / 'missing'))
+
+
+def test_iter_zip_dir_streams_the_same_archive(init_dir, tmp_path):
+    extra = tmp_path / 'AHI_20210709_0010_RGB.tif'
+    extra.write_bytes(b'II*\x00' * 1000)
+
+    chunks = list(PublicationUtils.iter_zip_dir(str(init_dir), extra_files=(str(extra),), chunk_size=16 * 1024))
+
+    assert len(chunks) > 10
+    assert max(len(chunk) for chunk in chunks) < 2 * 16 * 1024
+    members = read_zip(b''.join(chunks))
+    assert sorted(members) == ['AHI_20210709_0000_RGB.tif', 'AHI_20210709_0010_RGB.tif', 'indexer.properties']
+    assert members['AHI_20210709_0010_RGB.tif'] == (zipfile.ZIP_STORED, extra.read_bytes())
+    assert sorted(os.listdir(tmp_path)) == ['AHI_20210709_0010_RGB.tif', 'init']  # nothing is written to disk
+
+
+def test_base_zip_is_cached_until_base_dir_changes(init_dir, tmp_path):
+    base_zip = PublicationUtils.get_base_zip(str(init_dir))
+    os.utime(base_zip, (1e9, 1e9))
+    os.utime(init_dir / 'indexer.properties', (1e9 - 10, 1e9 - 10))
+    os.utime(init_dir / 'AHI_20210709_0000_RGB.tif', (1e9 - 10, 1e9 - 10))
+
+    assert PublicationUtils.get_base_zip(str(init_dir)) == base_zip
+    assert os.path.getmtime(base_zip) == 1e9  # not rebuilt
+    (init_dir / 'indexer.properties').write_text('TimeAttribute=ingestion\n')
+    PublicationUtils.get_base_zip(str(init_dir))
+    assert read_zip(open(base_zip, 'rb').read())['indexer.properties'][1] == b'TimeAttribute=ingestion\n'
+
+
+def test_zip_dir_from_base_appends_sample(init_dir, tmp_path):
+    sample = tmp_path / 'AHI_20210709_0010_RGB.tif'
+    sample.write_bytes(b'II*\x00' * 10)
+
+    assert PublicationUtils.zip_dir_from_base(str(init_dir), str(tmp_path / 'product_init.zip'), (str(sample),))
+
+    members = read_zip((tmp_path / 'product_init.zip').read_bytes())
+    assert sorted(members) == ['AHI_20210709_0000_RGB.tif', 'AHI_20210709_0010_RGB.tif', 'indexer.properties']
+    assert (tmp_path / 'init.zip').exists()  # cached base archive
+
+
+def write(tmp_path, data: bytes, name: str = 'AHI_20210709_0000_RGB.tif') -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_read_classic_geotiff_header(tmp_path):
+    path = write(tmp_path, create_geotiff(64, 32, bbox=(100.0, -10.0, 164.0, 22.0), bands=3, data_size=1024))
+
+    assert PublicationUtils.read_geotiff_header(path) == GeoTiffHeader(
+        width=64, height=32, bands=3, bits_per_sample=8, compression='none', tiled=False, block_size=(64, 32),
+        overviews=[], epsg=4326, bbox=(100.0, -10.0, 164.0, 22.0), resolution=(1.0, 1.0), bigtiff=False)
+
+
+def test_read_big_endian_bigtiff_header_with_tiles_and_overviews(tmp_path):
+    bbox = (300000.0, 4000000.0, 556000.0, 4128000.0)
+    path = write(tmp_path, create_geotiff(1024, 512, bbox=bbox, epsg=32633, tile_size=256, overviews=(2, 4),
+                                          bigtiff=True, byteorder='>'))
+
+    header = PublicationUtils.read_geotiff_header(path)
+
+    assert (header.bigtiff, header.tiled, header.block_size) == (True, True, (256, 256))
+    assert header.overviews == [(512, 256), (256, 128)]
+    assert (header.epsg, header.bbox, header.resolution) == (32633, bbox, (250.0, 250.0))
+
+
+def test_masks_are_not_overviews(tmp_path):
+    def image(width, height, subfile_type=None):
+        entries = [(256, 4, [width]), (257, 4, [height]), (278, 4, [height])]
+        return entries + ([(254, 4, [subfile_type])] if subfile_type is not None else [])
+
+    ifds = [image(64, 64), image(32, 32, 1), image(64, 64, 4), image(32, 32, 5)]  # overview, mask, overview mask
+    path = write(tmp_path, b'II' + struct.pack('<HI', 42, 8) + pack_ifds(ifds, '<', False, 8))
+
+    header = PublicationUtils.read_geotiff_header(path)
+
+    assert header.overviews == [(32, 32)]
+    assert (header.bbox, header.epsg) == (None, None)
+
+
+def test_pixel_is_point_origin(tmp_path):
+    path = write(tmp_path, create_geotiff(36, 18, pixel_is_point=True))
+
+    assert PublicationUtils.read_geotiff_header(path).bbox == (-180.0, -90.0, 180.0, 90.0)
+
+
+def test_read_ifd_skips_unknown_tags():
+    data = b'II' + struct.pack('<HI', 42, 8) + pack_ifds(
+        [[(256, 4, [8]), (257, 3, [4]), (999, 4, [1]), (33550, 12, [0.5, 0.25, 0.0])], [(256, 4, [4])]],
+        '<', False, 8)
+
+    (tags, next_offset) = PublicationUtils._read_ifd(data, 8, '<', False)
+
+    assert tags == {256: (8,), 257: (4,), 33550: (0.5, 0.25, 0.0)}
+    assert PublicationUtils._read_ifd(data, next_offset, '<', False) == ({256: (4,)}, 0)
+
+
+@pytest.mark.parametrize('data, reason', [
+    (b'', 'is empty'),
+    (b'GIF89a' + bytes(64), 'is not a tiff'),
+    (b'II' + struct.pack('<HI', 44, 8), 'unknown tiff version'),
+    (create_geotiff(64, 32)[:40], 'is truncated'),
+    (create_geotiff(64, 32, bigtiff=True)[:12], 'is truncated'),
+    (create_geotiff(64, 32)[:-16], 'points beyond the end of file'),
+    (b'II' + struct.pack('<HIH', 42, 8, 0) + bytes(4), 'has no image'),
+])
+def test_invalid_tiff_is_rejected(tmp_path, data, reason):
+    path = write(tmp_path, data)
+
+    with pytest.raises(ValueError, match=reason):
+        PublicationUtils.read_geotiff_header(path)
+    assert PublicationUtils.check_geotiff(path)[0] is None
+    assert reason in PublicationUtils.check_geotiff(path)[1]
+
+
+def test_check_geotiff(tmp_path):
+    path = write(tmp_path, create_geotiff(64, 32, bands=3))
+
+    (header, error) = PublicationUtils.check_geotiff(path, expected={'epsg': 4326, 'block_size': [64, 32]})
+    assert (header.bands, error) == (3, None)
+    (header, error) = PublicationUtils.check_geotiff(path, expected={'bands': 1})
+    assert header is None
+    assert error == '{} has bands 3, expected 1'.format(path)
+    assert PublicationUtils.check_geotiff(str(tmp_path / 'missing.tif'))[0] is None
+    plain = write(tmp_path, create_geotiff(64, 32, georeferenced=False), name='plain.tif')
+    assert PublicationUtils.check_geotiff(plain) == (None, '{} is not georeferenced'.format(plain))
+
+
+def test_world_file_georeferences_plain_tiff(tmp_path):
+    path = write(tmp_path, create_geotiff(64, 32, georeferenced=False))
+
+    assert PublicationUtils.read_geotiff_header(path).bbox is None
+    assert PublicationUtils.check_geotiff(path) == (None, '{} is not georeferenced'.format(path))
+
+    # upper left pixel center and 0.5 degree pixels
+    (tmp_path / 'AHI_20210709_0000_RGB.tfw').write_text('0.5\n0\n0\n-0.5\n100.25\n29.75\n')
+    (header, error) = PublicationUtils.check_geotiff(path)
+    assert error is None
+    assert (header.bbox, header.resolution, header.epsg) == ((100.0, 14.0, 132.0, 30.0), (0.5, 0.5), None)
+
+    (tmp_path / 'AHI_20210709_0000_RGB.tfw').write_text('0.5\n0.1\n0\n-0.5\n100.25\n29.75\n')  # rotated
+    assert PublicationUtils.check_geotiff(path)[1] == '{} is not georeferenced'.format(path)
+
+
+def test_is_optimized_geotiff(tmp_path):
+    tiled = PublicationUtils.read_geotiff_header(write(tmp_path, create_geotiff(1024, 512, tile_size=256,
+                                                                              overviews=(2, 4))))
+    without_overviews = PublicationUtils.read_geotiff_header(write(tmp_path, create_geotiff(1024, 512, tile_size=256)))
+    striped = PublicationUtils.read_geotiff_header(write(tmp_path, create_geotiff(1024, 512, overviews=(2, 4))))
+
+    assert PublicationUtils.is_optimized_geotiff(tiled)
+    assert not PublicationUtils.is_optimized_geotiff(without_overviews)
+    assert PublicationUtils.is_optimized_geotiff(without_overviews, overview_levels=())
+    assert not PublicationUtils.is_optimized_geotiff(striped)
+
+
+def test_optimize_geotiff_requires_gdal(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, 'gdal', None)
+    path = write(tmp_path, create_geotiff(64, 32))
+
+    with pytest.raises(ImportError, match='pip install GDAL'):
+        PublicationUtils.optimize_geotiff(path, str(tmp_path / 'optimized.tif'))
+
+
+def test_optimize_geotiff(tmp_path):
+    pytest.importorskip('osgeo')
+    source = str(tmp_path / 'AHI_20210709_0000_RGB.tif')
+    target = str(tmp_path / 'optimized' / 'AHI_20210709_0000_RGB.tif')
+    (tmp_path / 'optimized').mkdir()
+    write_gdal_geotiff(source, 1024, 512)
+
+    assert PublicationUtils.optimize_geotiff(source, target, block_size=256, overview_levels=(2, 4, 2048))
+
+    header = PublicationUtils.read_geotiff_header(target)
+    assert (header.tiled, header.block_size, header.overviews) == (True, (256, 256), [(512, 256), (256, 128)])
+    assert header.epsg == 4326
+    assert header.bbox == pytest.approx((100.0, 4.4, 151.2, 30.0))
+    assert not PublicationUtils.optimize_geotiff(source, target)  # target exists
+    assert not PublicationUtils.optimize_geotiff(target, str(tmp_path / 'again.tif'))  # already optimized
+    assert os.listdir(tmp_path / 'optimized') == ['AHI_20210709_0000_RGB.tif']  # no temp file is left
+
+
+def read_shapes(path: str) -> list:
+    """ Footprints (minx, miny, maxx, maxy) of polygon records of .shp, checked against their ring and .shx. """
+    with open(path + '.shp', 'rb') as shp, open(path + '.shx', 'rb') as shx:
+        shp_data = shp.read()
+        shx_data = shx.read()
+    (code, length) = struct.unpack('>i20xi', shp_data[:28])
+    assert (code, length * 2) == (9994, len(shp_data))
+    assert struct.unpack('>i20xi', shx_data[:28])[1] * 2 == len(shx_data)
+
+    footprints = []
+    offset = 100
+    for index_offset in range(100, len(shx_data), 8):
+        (record_offset, content_length) = struct.unpack('>2i', shx_data[index_offset:index_offset + 8])
+        assert record_offset * 2 == offset
+        (number, length) = struct.unpack('>2i', shp_data[offset:offset + 8])
+        assert (number, length) == (len(footprints) + 1, content_length)
+        (shape_type, minx, miny, maxx, maxy, parts, points, _) = struct.unpack(
+            '<i4d3i', shp_data[offset + 8:offset + 56])
+        ring = struct.unpack('<{}d'.format(2 * points), shp_data[offset + 56:offset + 56 + 16 * points])
+        assert (shape_type, parts, points) == (5, 1, 5)
+        assert ring[:2] == ring[-2:]  # closed ring
+        assert (min(ring[0::2]), min(ring[1::2]), max(ring[0::2]), max(ring[1::2])) == (minx, miny, maxx, maxy)
+        footprints.append((minx, miny, maxx, maxy))
+        offset += 8 + length * 2
+    assert offset == len(shp_data)
+    return footprints
+
+
+def test_shapefile_index_reads_back(tmp_path):
+    records = [
+        ('/data/tiff/AHI_20210709_0000_RGB.tif', (-180.0, -90.0, 180.0, 90.0), datetime(2021, 7, 9, 0, 0)),
+        ('/data/tiff/harvest_1/AHI_20210709_0010_RGB.tif', (100.5, -10.25, 140.0, 20.0), datetime(2021, 7, 9, 0, 10)),
+    ]
+    path = str(tmp_path / 'ahi')
+
+    assert PublicationUtils.write_shapefile_index(path, records, epsg=4326) == 2
+
+    assert list(MockGeoserver._read_index(path + '.dbf')) == [
+        ('/data/tiff/AHI_20210709_0000_RGB.tif', '2021-07-09T00:00:00Z'),
+        ('/data/tiff/harvest_1/AHI_20210709_0010_RGB.tif', '2021-07-09T00:10:00Z'),
+    ]
+    assert read_shapes(path) == [bbox for _, bbox, _ in records]
+    with open(path + '.shp', 'rb') as shp:
+        assert struct.unpack('<2i4d', shp.read(100)[28:68]) == (1000, 5, -180.0, -90.0, 180.0, 90.0)
+    assert (tmp_path / 'ahi.prj').read_text() == WGS84_WKT
+
+
+def test_empty_shapefile_index_without_prj(tmp_path):
+    path = str(tmp_path / 'ahi')
+
+    assert PublicationUtils.write_shapefile_index(path, [], epsg=32633) == 0
+
+    assert list(MockGeoserver._read_index(path + '.dbf')) == []
+    assert read_shapes(path) == []
+    assert not (tmp_path / 'ahi.prj').exists()
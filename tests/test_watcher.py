@@ -0,0 +1,123 @@
+import json
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from geoserver.Publicator import Publicator
+from geoserver.Watcher import Watcher, main
+from helpers import PRODUCT, write_source_files
+
+TODAY = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def source_path(tmp_path, args):
+    (_, year, month, day, dtime) = args
+    return tmp_path / 'rgb' / 'AHI' / year / month / day / dtime / 'AHI_{0}{1}{2}_{3}_RGB.tif'.format(
+        year, month, day, dtime)
+
+
+def wait_until(check, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def publicator(config):
+    with Publicator(PRODUCT, config=config) as product_publicator:
+        yield product_publicator
+
+
+def test_files_are_published_after_settle_time(tmp_path, publicator):
+    slots = Publicator.create_slots(PRODUCT, TODAY, TODAY + timedelta(minutes=10))
+    write_source_files(tmp_path, slots[:1], payload=b'II*\x00')
+    source_path(tmp_path, slots[1]).parent.mkdir(parents=True)
+    source_path(tmp_path, slots[1]).write_bytes(b'')  # not written yet
+    (source_path(tmp_path, slots[0]).parent / 'AHI_20210709_0000_RGB.tif.aux.xml').write_bytes(b'<PAM/>')
+    watcher = Watcher([publicator], settle_time=0.3, use_inotify=False)
+
+    watcher._scan()
+    assert sorted(watcher._candidates) == [str(source_path(tmp_path, args)) for args in slots]
+    assert watcher._collect_ready() == {}
+    time.sleep(0.1)
+    with open(source_path(tmp_path, slots[0]), 'ab') as f:
+        f.write(bytes(1020))  # the size changed, settle time starts again
+    assert watcher._collect_ready() == {}
+    time.sleep(0.1)
+    assert watcher._collect_ready() == {}
+    time.sleep(0.25)
+    assert watcher._collect_ready() == {publicator: [slots[0]]}
+    assert watcher._collect_ready() == {}  # slots are handed off once
+    watcher._scan()
+    assert list(watcher._candidates) == [str(source_path(tmp_path, slots[1]))]  # empty files never settle
+
+
+def test_scan_lists_only_changed_slot_dirs_of_lookback_window(monkeypatch, tmp_path, publicator):
+    old = TODAY - timedelta(days=3)
+    slots = Publicator.create_slots(PRODUCT, TODAY, TODAY + timedelta(minutes=10))
+    write_source_files(tmp_path, slots[:1] + Publicator.create_slots(PRODUCT, old, old))
+    watcher = Watcher([publicator], settle_time=0, lookback_days=1, use_inotify=False)
+    scanned = []
+    scan_slot_dir = watcher._scan_slot_dir
+    monkeypatch.setattr(watcher, '_scan_slot_dir', lambda *args: scanned.append(args[1]) or scan_slot_dir(*args))
+
+    watcher._scan()
+    assert watcher._collect_ready() == {}  # sizes are recorded first
+    assert watcher._collect_ready() == {publicator: slots[:1]}  # the slot of 3 days ago is out of the window
+    watcher._scan()
+    assert scanned == [str(source_path(tmp_path, slots[0]).parent)]
+    write_source_files(tmp_path, slots[1:])
+    watcher._scan()
+
+    assert scanned[1:] == [str(source_path(tmp_path, slots[1]).parent)]
+    watcher._collect_ready()
+    assert watcher._collect_ready() == {publicator: slots[1:]}
+
+
+@pytest.mark.parametrize('mode', ['queue', 'workflow'])
+def test_run_publishes_new_slots(tmp_path, mock, publicator, mode):
+    slots = Publicator.create_slots(PRODUCT, TODAY, TODAY + timedelta(minutes=20))
+    watcher = Watcher([publicator], mode=mode, settle_time=0.05, poll_interval=0.05, use_inotify=False)
+    runner = threading.Thread(target=watcher.run)
+    runner.start()
+    try:
+        write_source_files(tmp_path, slots)
+        assert wait_until(lambda: mock.granule_count('sat', 'ahi') == 3)
+    finally:
+        watcher.stop()
+        runner.join(5)
+
+    assert not runner.is_alive()
+    counts = publicator.ingest_queue.counts()
+    assert counts['verified'] == (3 if mode == 'queue' else 0)
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError, match='mode must be one of'):
+        Watcher([], mode='sync')
+
+
+def test_main(monkeypatch, tmp_path, mock, config):
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps(config))
+    handlers = {}
+    monkeypatch.setattr(signal, 'signal', lambda signum, handler: handlers.setdefault(signum, handler))
+    write_source_files(tmp_path, Publicator.create_slots(PRODUCT, TODAY, TODAY + timedelta(minutes=10)))
+
+    def stop_when_published():
+        wait_until(lambda: mock.granule_count('sat', 'ahi') == 2 and signal.SIGTERM in handlers)
+        handlers[signal.SIGTERM](signal.SIGTERM, None)
+
+    stopper = threading.Thread(target=stop_when_published)
+    stopper.start()
+    main([PRODUCT, '--mode', 'workflow', '--settle-time', '0', '--poll-interval', '0.05', '--no-inotify',
+          '--config', str(config_path)])
+    stopper.join()
+
+    assert mock.granule_count('sat', 'ahi') == 2